@@ -5,41 +5,58 @@ Shows only high-value detections by default, full logs with -v
 """
 import os
 import re
+import selectors
+import shlex
+import socket
+import sqlite3
 import subprocess
 import sys
 import time
 import signal
 import argparse
+import bisect
 import threading
 import json
+import random
+import glob
+import contextlib
+import gzip
+import hashlib
+import heapq
+import http.server
+import itertools
+import locale
+import mmap
+import pickle
+import queue
+import shutil
+import struct
+import urllib.parse
+import zlib
+from sys import intern
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 try:
     import notify2
 except ImportError:
     notify2 = None
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Global flags
 shutdown_flag = False
 live_stats = defaultdict(int)
-ip_profiles = defaultdict(lambda: {
-    'os': None,
-    'os_detail': None,
-    'distance': None,
-    'services': set(),
-    'scanners': set(),
-    'suspicious': set(),
-    'nat': False,
-    'uptime': None,
-    'link': None,
-    'first_seen': None,
-    'is_server': False,
-    'is_eol': False
-})
-stats_lock = threading.Lock()
+# ip_profiles is the ProfileStore defined under "Host profile store",
+# stats_lock the TimedLock defined with Instrumentation
 verbose_mode = False
+export_format = 'json'     # 'json' or 'ndjson' (one host object per line)
+report_analytics = False   # --analytics: extra aggregates in the final report (needs numpy)
 
 # ANSI color codes
 class Colors:
@@ -57,8 +74,9 @@ class Colors:
 # Detection rules
 # ------------------------------------------------------------------
 ONELINERS = {
-    "internal-only":     "grep -vE '^\\[.+\\]' full.log | grep -F '-> 192.168.'  > internal-only.log",
-    "same-subnet":       "grep -vE '^\\[.+\\]' full.log | grep -E '10\\.|172\\.1[6-9]\\.|172\\.2[0-9]\\.|172\\.3[01]\\.|192\\.168\\.' | grep -F 'distance=0'  > same-subnet.log",
+    # Private-address conditions of these two are in NETWORK_RULES
+    "internal-only":     "grep -vE '^\\[.+\\]' full.log  > internal-only.log",
+    "same-subnet":       "grep -vE '^\\[.+\\]' full.log | grep -F '|dist=0|'  > same-subnet.log",
     "jump-candidates":   "grep -vE '^\\[.+\\]' full.log | grep -E 'distance=1|distance=2' | grep -F 'os=Windows'  > jump-candidates.log",
     "remote-sites":      "grep -vE '^\\[.+\\]' full.log | grep -E 'link=DSL|link=modem' | grep -E 'distance=[5-9]'  > remote-sites.log",
     "dmz-hosts":         "grep -vE '^\\[.+\\]' full.log | grep 'distance=1' | grep 'subj=srv' | awk -F '|' '{{print $3}}' | sort -u  > dmz-servers.log",
@@ -391,6 +409,127 @@ def count_lines(path):
     except:
         return 0
 
+# Common server ports and their service names
+SERVICE_MAP = {
+    21: 'FTP', 22: 'SSH', 23: 'Telnet',
+    80: 'HTTP', 443: 'HTTPS', 445: 'SMB',
+    139: 'NetBIOS', 3389: 'RDP', 3306: 'MySQL',
+    5432: 'PostgreSQL', 27017: 'MongoDB', 6379: 'Redis'
+}
+_service_labels = {}
+
+def service_label(port):
+    """'SMB:445' style label for a server port"""
+    label = _service_labels.get(port)
+    if label is None:
+        label = _service_labels[port] = f"{SERVICE_MAP.get(port, f'port-{port}')}:{port}"
+    return label
+
+class P0fEvent:
+    """One p0f log line, parsed once and shared by every consumer.
+
+    `tail` holds the module-specific key=value fields (os, dist, params,
+    app, nat, link, ...). Tails repeat heavily across lines, so decoded
+    tails are cached and shared between events: treat `tail` as read-only.
+    """
+    __slots__ = ('text', 'timestamp', 'mod', 'subj', 'cli_ip', 'cli_port',
+                 'srv_ip', 'srv_port', 'os', 'dist', 'params', 'tail')
+
+    def __init__(self, text, timestamp, mod, subj, cli_ip, cli_port, srv_ip, srv_port, tail):
+        self.text = text
+        self.timestamp = timestamp
+        self.mod = mod
+        self.subj = subj
+        self.cli_ip = cli_ip
+        self.cli_port = cli_port
+        self.srv_ip = srv_ip
+        self.srv_port = srv_port
+        self.os, self.dist, self.params, self.tail = tail
+
+    def get(self, key, default=None):
+        """Value of a tail field such as nat, uptime, link, app or bad_sw"""
+        return self.tail.get(key, default)
+
+    @property
+    def subject_ip(self):
+        if self.subj == 'cli':
+            return self.cli_ip
+        if self.subj == 'srv':
+            return self.srv_ip
+        return None
+
+# p0f modules whose lines nothing here reads (no profile field, rule or
+# pattern uses them); ingest drops them by a prefix test before parsing
+UNUSED_MODULES = ('host change', 'ip sharing')
+_UNUSED_PREFIXES = tuple(f"mod={module}|" for module in UNUSED_MODULES)
+
+def is_unused_module(line):
+    """True for a line from one of the UNUSED_MODULES, whatever its timestamp looks like"""
+    start = line.find('] mod=')
+    return start >= 0 and line.startswith(_UNUSED_PREFIXES, start + 2)
+
+# p0f's fixed line prefix; anything else goes through the generic decoder
+_EVENT_RE = re.compile(r'\[([^\]]*)\] mod=([^|]*)\|cli=([^|]*)/(\d+)\|srv=([^|]*)/(\d+)\|subj=([^|]*)\|?(.*)')
+_tail_cache = {}
+_CACHE_LIMIT = 65536
+
+def _decode_fields(fields):
+    data = {}
+    for field in fields:
+        key, sep, val = field.partition('=')
+        if sep:
+            data[intern(key.strip())] = val.strip()
+    return data
+
+def _decode_tail(data):
+    """(os, dist, params, data) for a dict of tail fields"""
+    # OS strings end up in host profiles, so share one copy of each
+    os_name = data.get('os')
+    os_name = intern(os_name) if os_name is not None else None
+    dist = data.get('dist', data.get('distance'))
+    dist = int(dist) if dist is not None and dist.isdigit() else None
+    params = data.get('params')
+    params = tuple(params.split(',')) if params and params != 'none' else ()
+    return os_name, dist, params, data
+
+def _cached_tail(tail):
+    decoded = _tail_cache.get(tail)
+    if decoded is None:
+        if len(_tail_cache) >= _CACHE_LIMIT:
+            _tail_cache.clear()
+        decoded = _tail_cache[tail] = _decode_tail(_decode_fields(tail.split('|')))
+    return decoded
+
+def split_address(addr):
+    """Split p0f's 'ip/port' (or 'ipv4:port') into (ip, port)"""
+    if not addr:
+        return None, None
+    ip, sep, port = addr.rpartition('/')
+    if not sep:
+        if addr.count(':') != 1:
+            return addr, None
+        ip, _, port = addr.partition(':')
+    return ip, int(port) if port.isdigit() else None
+
+def parse_event(line):
+    """Parse a full.log line into a P0fEvent, or None for non-event lines"""
+    m = _EVENT_RE.match(line)
+    if m is not None:
+        timestamp, mod, cli_ip, cli_port, srv_ip, srv_port, subj, tail = m.groups()
+        return P0fEvent(m.group(0), timestamp, mod, subj, cli_ip, int(cli_port),
+                        srv_ip, int(srv_port), _tail_cache.get(tail) or _cached_tail(tail))
+    if not is_event_line(line):
+        return None
+
+    text = line.rstrip('\n')
+    fields = text.split('|')
+    head = fields[0]
+    data = _decode_fields([head[head.find(']') + 1:]] + fields[1:])
+    cli_ip, cli_port = split_address(data.get('cli'))
+    srv_ip, srv_port = split_address(data.get('srv'))
+    return P0fEvent(text, head[1:head.find(']')], data.get('mod'), data.get('subj'),
+                    cli_ip, cli_port, srv_ip, srv_port, _decode_tail(data))
+
 def parse_p0f_line(line):
     """Extract key information from a p0f log line"""
     data = {}
@@ -404,17 +543,23 @@ def parse_p0f_line(line):
             data[key.strip()] = val.strip()
     return data
 
-def check_high_value(line):
+_high_value_matcher = None
+
+def check_high_value(line, instruments=None):
     """Check if line matches high-value patterns and return tags"""
-    tags = []
-    for pattern, tag, color in HIGH_VALUE_PATTERNS:
-        if re.search(pattern, line):
-            tags.append((tag, color))
+    global _high_value_matcher
+    if _high_value_matcher is None:
+        _high_value_matcher = HighValueMatcher(HIGH_VALUE_PATTERNS)
+    tags = _high_value_matcher.tags(line)
+    if instruments is not None:
+        instruments.sample_high_value(_high_value_matcher, line, tags)
     return tags
 
-def highlight_line(line):
+def highlight_line(line, instruments=None):
     """Add color highlights to important detections"""
-    tags = check_high_value(line)
+    if isinstance(line, P0fEvent):
+        line = line.text
+    tags = check_high_value(line, instruments)
     
     if tags:
         tag_str = ' '.join([f"{color}{tag}{Colors.RESET}" for tag, color in tags])
@@ -424,275 +569,2589 @@ def highlight_line(line):
 def extract_ips_from_line(line):
     """Extract client and server IPs from p0f line"""
     data = parse_p0f_line(line)
-    cli_ip = None
-    srv_ip = None
-    
-    if 'cli' in data:
-        # Format: IP/port
-        cli_ip = data['cli'].split('/')[0] if '/' in data['cli'] else data['cli'].split(':')[0]
-    if 'srv' in data:
-        srv_ip = data['srv'].split('/')[0] if '/' in data['srv'] else data['srv'].split(':')[0]
-    
+    cli_ip, _ = split_address(data.get('cli'))
+    srv_ip, _ = split_address(data.get('srv'))
     return cli_ip, srv_ip, data
 
-def update_live_stats(line):
-    """Update live statistics and build per-IP profiles"""
+# ------------------------------------------------------------------
+# Raw log segments
+# ------------------------------------------------------------------
+# Long captures rotate full.log into numbered segments (full.log.000001,
+# full.log.000002, ...) that a background thread gzips; the segment being
+# written is always full.log itself. Readers go through LogStream, which
+# streams the closed segments and then full.log as one log without
+# decompressing anything to disk. gzip only keeps the size modulo 4 GiB,
+# so the compressor records each segment's real size in full.log.sizes.
+_SEGMENT_SUFFIX = re.compile(r'\.(\d{6})(\.gz)?')
+
+def log_segments(base="full.log"):
+    """Closed segments of a log in order, then the log itself if it exists"""
+    found = {}
+    for path in glob.glob(glob.escape(base) + '.[0-9]*'):
+        m = _SEGMENT_SUFFIX.fullmatch(path, len(base))
+        if m is None:
+            continue
+        sequence = int(m.group(1))
+        # While a segment is being compressed both files exist; the plain one is complete
+        if m.group(2) is None or sequence not in found:
+            found[sequence] = path
+    segments = [found[sequence] for sequence in sorted(found)]
+    if os.path.exists(base):
+        segments.append(base)
+    return segments
+
+def open_segment(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+def segment_sizes(base="full.log"):
+    """{segment file name: uncompressed size} as recorded in <base>.sizes"""
+    sizes = {}
+    try:
+        with open(base + '.sizes') as f:
+            for line in f:
+                name, _, size = line.rpartition(' ')
+                if size.strip().isdigit():
+                    sizes[name] = int(size)
+    except OSError:
+        pass
+    return sizes
+
+def segment_size(path, sizes=None):
+    """Uncompressed size of a segment: recorded in `sizes`, else the gzip
+    ISIZE trailer (only exact below 4 GiB, for segments of older runs)"""
+    if not path.endswith('.gz'):
+        return os.path.getsize(path)
+    if sizes and os.path.basename(path) in sizes:
+        return sizes[os.path.basename(path)]
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', f.read(4))[0]
+
+def log_footprint(base="full.log"):
+    """(segments, bytes on disk, bytes of p0f output) for a log and its segments"""
+    segments = log_segments(base)
+    sizes = segment_sizes(base)
+    stored = sum(os.path.getsize(path) for path in segments)
+    raw = sum(segment_size(path, sizes) for path in segments)
+    return len(segments), stored, raw
+
+class LogStream:
+    """Binary line reader over a log's segments and the log itself, in order"""
+
+    def __init__(self, base="full.log"):
+        self.segments = log_segments(base)
+        self.index = 0
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.index += 1
+        if self.index < len(self.segments):
+            self.file = open_segment(self.segments[self.index])
+        return self.file
+
+    def skip(self, count):
+        """Move `count` bytes into the stream (whole plain segments are not read)"""
+        while count > 0 and (self.file or self._next_file()):
+            path = self.segments[self.index]
+            if not path.endswith('.gz'):
+                remaining = os.path.getsize(path) - self.file.tell()
+                if count < remaining:
+                    self.file.seek(count, os.SEEK_CUR)
+                    return
+                count -= remaining
+                self._next_file()
+                continue
+            data = self.file.read(min(count, 1 << 20))
+            if not data:
+                self._next_file()
+            count -= len(data)
+
+    def readlines(self, hint=-1):
+        """Next lines as bytes (about `hint` bytes' worth); [] at the end"""
+        while self.file or self._next_file():
+            lines = self.file.readlines(hint)
+            if lines:
+                return lines
+            self._next_file()
+        return []
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def read_log_lines(base="full.log"):
+    """Every line of a (possibly segmented) log as text"""
+    with LogStream(base) as stream:
+        while True:
+            lines = stream.readlines(1 << 20)
+            if not lines:
+                return
+            for line in lines:
+                yield line.decode('utf-8', 'surrogateescape')
+
+class SegmentedLog:
+    """Append-only log that rotates by size or age into gzipped segments.
+
+    Without limits it is a plain append to `base`. write() takes whole
+    lines, so segments always end on a line boundary; compression runs
+    on a background thread and close() waits for it to finish.
+    """
+
+    def __init__(self, base="full.log", max_bytes=None, max_age=None):
+        self.base = base
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.file = open(base, 'ab')
+        self.size = self.file.tell()
+        self.opened = time.time()
+        self.rotations = 0
+
+        closed = log_segments(base)[:-1]
+        match = _SEGMENT_SUFFIX.fullmatch(closed[-1], len(base)) if closed else None
+        self.sequence = int(match.group(1)) if match else 0
+        self.pending = queue.Queue()
+        self.compressor = None
+        if max_bytes or max_age:
+            self.compressor = threading.Thread(target=self._compress_segments, daemon=True)
+            self.compressor.start()
+            # Segments a previous run closed but never compressed
+            for path in closed:
+                if not path.endswith('.gz'):
+                    self.pending.put(path)
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+        if ((self.max_bytes and self.size >= self.max_bytes)
+                or (self.max_age and time.time() - self.opened >= self.max_age)):
+            self.rotate()
+
+    def rotate(self):
+        """Close the current segment and queue it for compression"""
+        self.opened = time.time()
+        if not self.size:
+            return
+        self.file.close()
+        self.sequence += 1
+        segment = f"{self.base}.{self.sequence:06d}"
+        os.rename(self.base, segment)
+        self.file = open(self.base, 'ab')
+        self.size = 0
+        self.rotations += 1
+        self.pending.put(segment)
+
+    def _compress_segments(self):
+        while True:
+            segment = self.pending.get()
+            if segment is None:
+                return
+            try:
+                size = os.path.getsize(segment)
+                with open(segment, 'rb') as src, gzip.open(segment + '.gz.tmp', 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+                with open(self.base + '.sizes', 'a') as sizes:
+                    sizes.write(f"{os.path.basename(segment)}.gz {size}\n")
+                os.replace(segment + '.gz.tmp', segment + '.gz')
+                os.remove(segment)
+            except OSError as e:
+                print(f"{Colors.YELLOW}[!] Could not compress {segment}: {e}{Colors.RESET}")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        if self.compressor is not None:
+            self.pending.put(None)
+            self.compressor.join()
+            self.compressor = None
+
+# ------------------------------------------------------------------
+# Network prefixes
+# ------------------------------------------------------------------
+# CIDR handling on pack_ip() keys: a longest-prefix-match trie for scope
+# lists and address classes, and a bucketed index of profiled hosts for
+# range queries. Networks live in the same key space as hosts (IPv6 with
+# the tag bit, never the expanded-spelling bit), so a network key is
+# compared with host keys directly.
+PRIVATE_NETWORKS = ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '169.254.0.0/16', '127.0.0.0/8',
+                    'fc00::/7', 'fe80::/10', '::1/128')
+subnet_prefixes = (24, 64)   # IPv4 / IPv6 prefix of the report's subnet summary
+
+def parse_network(text):
+    """(network key, prefix length) for 'ADDRESS/BITS' or a bare address; host bits are cleared"""
+    address, slash, bits = text.strip().partition('/')
+    key = pack_ip(address)
+    if key.__class__ is not int or (slash and not bits.isdigit()):
+        raise ValueError(f"bad network {text!r}")
+    key &= ~_V6_EXPANDED
+    width = 128 if key >= _V6_TAG else 32
+    length = int(bits) if slash else width
+    if length > width:
+        raise ValueError(f"bad network {text!r}: /{length} is longer than the address")
+    return key & ~((1 << (width - length)) - 1), length
+
+def network_range(key, length):
+    """[low, high) key range a parse_network() network covers"""
+    width = 128 if key >= _V6_TAG else 32
+    return key, key + (1 << (width - length))
+
+def format_network(key, length):
+    if key < _V6_TAG:
+        return f"{socket.inet_ntop(socket.AF_INET, key.to_bytes(4, 'big'))}/{length}"
+    return f"{socket.inet_ntop(socket.AF_INET6, (key ^ _V6_TAG).to_bytes(16, 'big'))}/{length}"
+
+class _TrieNode:
+    __slots__ = ('address', 'length', 'value', 'children')
+
+    def __init__(self, address, length, value):
+        self.address = address      # leading `length` bits; the rest are zero
+        self.length = length
+        self.value = value          # None on pure branch nodes
+        self.children = [None, None]
+
+class PrefixTrie:
+    """Longest-prefix match of pack_ip() keys against stored networks.
+
+    A path-compressed binary (radix) trie per address family: each node
+    holds a whole prefix and branches on the bit after it, so a lookup
+    visits one node per stored prefix along the path instead of one per
+    address bit. Values must not be None.
+    """
+    __slots__ = ('roots', 'size', 'matches')
+
+    def __init__(self, networks=(), value=True):
+        self.roots = [None, None]
+        self.size = 0
+        self.matches = {}     # address string -> lookup() result, for match()
+        for network in networks:
+            self.insert(network, value)
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _split(key):
+        """(family, address bits, width) for a network or host key"""
+        if key < _V6_TAG:
+            return 0, key, 32
+        return 1, (key & ~_V6_EXPANDED) ^ _V6_TAG, 128
+
+    def insert(self, network, value):
+        """Store `value` for a CIDR string (or a parse_network() pair), replacing any previous one"""
+        key, length = parse_network(network) if isinstance(network, str) else network
+        family, address, width = self._split(key)
+        self.matches.clear()
+        leaf = _TrieNode(address, length, value)
+        parent, side = None, 0
+        node = self.roots[family]
+        while node is not None:
+            common = min(width - (address ^ node.address).bit_length(), length, node.length)
+            if common < node.length:
+                # Diverges inside this node's prefix: hang both under the shared part
+                if common == length:
+                    replacement = leaf
+                else:
+                    replacement = _TrieNode(address >> (width - common) << (width - common), common, None)
+                    replacement.children[address >> (width - 1 - common) & 1] = leaf
+                replacement.children[node.address >> (width - 1 - common) & 1] = node
+                break
+            if node.length == length:
+                if node.value is None:
+                    self.size += 1
+                node.value = value
+                return
+            parent, side = node, address >> (width - 1 - node.length) & 1
+            node = node.children[side]
+        else:
+            replacement = leaf
+        if parent is None:
+            self.roots[family] = replacement
+        else:
+            parent.children[side] = replacement
+        self.size += 1
+
+    def lookup(self, key, default=None):
+        """Value of the longest stored network containing a pack_ip() key"""
+        if key.__class__ is not int:
+            return default
+        if key < _V6_TAG:
+            node, address, width = self.roots[0], key, 32
+        else:
+            node, address, width = self.roots[1], (key & ~_V6_EXPANDED) ^ _V6_TAG, 128
+        best = default
+        while node is not None:
+            length = node.length
+            if (address ^ node.address) >> (width - length):
+                break
+            if node.value is not None:
+                best = node.value
+            if length == width:
+                break
+            node = node.children[address >> (width - 1 - length) & 1]
+        return best
+
+    def items(self):
+        """((network key, prefix length), value) for every stored network, parents first"""
+        for family, node in enumerate(self.roots):
+            tag, width = (_V6_TAG, 128) if family else (0, 32)
+            stack = [node] if node is not None else []
+            while stack:
+                node = stack.pop()
+                if node.value is not None:
+                    yield (node.address | tag, node.length), node.value
+                stack.extend(child for child in reversed(node.children) if child is not None)
+
+    def match(self, ip, default=None):
+        """lookup() for an address string, remembered per string"""
+        matches = self.matches
+        if ip in matches:
+            value = matches[ip]
+        else:
+            if len(matches) >= _CACHE_LIMIT:
+                matches.clear()
+            value = matches[ip] = self.lookup(pack_ip(ip))
+        return default if value is None else value
+
+class NetworkScope:
+    """In-scope / out-of-scope networks (--scope FILE), decided by longest prefix.
+
+    A line is dropped when neither endpoint is in scope; when only one
+    is, the other must not gain a profile from it. With no in-scope
+    networks listed, everything that is not excluded is in scope.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.trie = PrefixTrie()
+        self.included = 0
+        self.excluded = 0
+
+    def add(self, network, inside=True):
+        self.trie.insert(network, inside)
+        if inside:
+            self.included += 1
+        else:
+            self.excluded += 1
+
+    def contains(self, ip):
+        return self.trie.match(ip, not self.included)
+
+    def allows(self, event):
+        return bool(event.cli_ip and self.contains(event.cli_ip)) or bool(event.srv_ip and self.contains(event.srv_ip))
+
+    def restrict(self, event):
+        """The event as profiling should see it: None when out of scope, else a
+        copy without any out-of-scope endpoint (or the event itself)"""
+        cli = bool(event.cli_ip and self.contains(event.cli_ip))
+        srv = bool(event.srv_ip and self.contains(event.srv_ip))
+        if cli and srv:
+            return event
+        if not (cli or srv):
+            return None
+        return P0fEvent(event.text, event.timestamp, event.mod, event.subj,
+                        event.cli_ip if cli else None, event.cli_port,
+                        event.srv_ip if srv else None, event.srv_port,
+                        (event.os, event.dist, event.params, event.tail))
+
+    def describe(self):
+        return f"{self.path}: {self.included} in-scope, {self.excluded} out-of-scope networks"
+
+    def bpf(self):
+        """BPF expression passing packets with an in-scope endpoint (None: no restriction)"""
+        if not self.excluded:
+            return _bpf_any([f"net {format_network(*network)}" for network, _ in self.trie.items()])
+        # Nest the networks: each one's children are the closest networks inside it
+        roots, open_nets = [], []
+        for network, inside in self.trie.items():
+            low, high = network_range(*network)
+            while open_nets and not (open_nets[-1][0] <= low and high <= open_nets[-1][1]):
+                open_nets.pop()
+            node = (format_network(*network), inside, [])
+            (open_nets[-1][2][2] if open_nets else roots).append(node)
+            open_nets.append((low, high, node))
+
+        def region(node, direction, wanted):
+            # Part of `node` whose scope is `wanted`, as seen from one direction
+            cidr, inside, children = node
+            parts = [region(child, direction, wanted) for child in children]
+            if inside != wanted:
+                return _bpf_any(parts)
+            others = _bpf_any([region(child, direction, not wanted) for child in children])
+            match = f"{direction} net {cidr}"
+            return f"({match} and not {others})" if others else match
+
+        def in_scope(direction):
+            if self.included:
+                return _bpf_any([region(root, direction, True) for root in roots])
+            return f"not {_bpf_any([region(root, direction, False) for root in roots])}"
+        return f"({in_scope('src')} or {in_scope('dst')})"
+
+def _bpf_any(parts):
+    parts = [part for part in parts if part]
+    if len(parts) <= 1:
+        return parts[0] if parts else None
+    return f"({' or '.join(parts)})"
+
+def parse_ports(text):
+    """[(low, high)] for a port list like '22,80,443,8000-8100'; raises ValueError"""
+    ranges = []
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        low, dash, high = item.partition('-')
+        if not low.isdigit() or (dash and not high.isdigit()):
+            raise ValueError(f"bad port range {item!r}")
+        low, high = int(low), int(high or low)
+        if not 0 < low <= high <= 65535:
+            raise ValueError(f"bad port range {item!r}")
+        ranges.append((low, high))
+    if not ranges:
+        raise ValueError("empty port list")
+    return ranges
+
+def build_capture_filter(scope=None, ports=None, extra=None):
+    """BPF for p0f from the scope, a parse_ports() list and a raw expression, all ANDed"""
+    clauses = []
+    if scope is not None:
+        clauses.append(scope.bpf())
+    if ports:
+        clauses.append(_bpf_any([f"port {low}" if low == high else f"portrange {low}-{high}"
+                                 for low, high in ports]))
+    if extra:
+        clauses.append(f"({extra})")
+    clauses = [clause for clause in clauses if clause]
+    return ' and '.join(clauses) or None
+
+def load_scope(path):
+    """NetworkScope from a file with one network per line.
+
+    'CIDR' or a bare address is in scope, '!CIDR' (or '-CIDR') out of
+    scope; blank lines and '#' comments are skipped. Raises ValueError
+    naming the line on a bad entry.
+    """
+    scope = NetworkScope(path)
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            entry = line.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            inside = entry[0] not in '!-'
+            try:
+                scope.add(entry if inside else entry[1:], inside)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}") from None
+    return scope
+
+class SubnetIndex:
+    """Profiled host keys bucketed by IPv4 /24 and IPv6 /64.
+
+    Bucket ids are kept sorted, so a CIDR query bisects to the run of
+    buckets it spans and only checks the hosts in those; maintained from
+    snapshot changes like the PriorityIndex.
+    """
+    def __init__(self):
+        self.buckets = {}     # bucket id -> set of host keys
+        self.order = []       # sorted bucket ids
+
+    @staticmethod
+    def bucket(key):
+        if key < _V6_TAG:
+            return key >> 8
+        return (key & ~_V6_EXPANDED) >> 64
+
+    def update(self, key, old, new):
+        """Track one host appearing (old None) or leaving (new None)"""
+        if key.__class__ is not int or (old is None) == (new is None):
+            return
+        bucket = self.bucket(key)
+        members = self.buckets.get(bucket)
+        if new is not None:
+            if members is None:
+                members = self.buckets[bucket] = set()
+                bisect.insort(self.order, bucket)
+            members.add(key)
+        elif members is not None:
+            members.discard(key)
+            if not members:
+                del self.buckets[bucket]
+                del self.order[bisect.bisect_left(self.order, bucket)]
+
+    def within(self, low, high):
+        """Host keys in the [low, high) key range of a network, in IP order"""
+        order = self.order
+        first = bisect.bisect_left(order, self.bucket(low))
+        last = bisect.bisect_right(order, self.bucket(high - 1))
+        keys = []
+        for bucket in order[first:last]:
+            keys.extend(key for key in self.buckets[bucket] if low <= key & ~_V6_EXPANDED < high)
+        keys.sort()
+        return keys
+
+def subnet_summary(hosts, prefix=24, prefix6=64):
+    """Per-network aggregate of profiled hosts, busiest first.
+
+    Returns [(cidr, hosts, {os family: hosts}, {port: hosts})] with IPv4
+    hosts grouped by `prefix` and IPv6 ones by `prefix6` bits.
+    """
+    shift4 = 32 - prefix
+    mask6 = ~((1 << (128 - prefix6)) - 1)
+    families = {}
+    groups = {}
+    for key, profile in hosts.items():
+        if key.__class__ is not int:
+            continue
+        if key < _V6_TAG:
+            network = key >> shift4 << shift4
+        else:
+            network = key & ~_V6_EXPANDED & mask6
+        group = groups.get(network)
+        if group is None:
+            group = groups[network] = [0, defaultdict(int), defaultdict(int)]
+        group[0] += 1
+        family = families.get(profile.os_id)
+        if family is None:
+            family = families[profile.os_id] = os_family(profile.os) or 'unknown'
+        group[1][family] += 1
+        bits = profile.service_bits
+        if bits:
+            for port, bit in _SERVICE_BITS.items():
+                if bits & bit:
+                    group[2][port] += 1
+        for port in profile.rare_ports or ():
+            group[2][port] += 1
+    summary = []
+    for network in sorted(groups, key=lambda network: (-groups[network][0], network)):
+        count, by_family, by_port = groups[network]
+        summary.append((format_network(network, prefix if network < _V6_TAG else prefix6),
+                        count, dict(by_family), dict(by_port)))
+    return summary
+
+# ------------------------------------------------------------------
+# Host profile store
+# ------------------------------------------------------------------
+# Millions of hosts have to fit in memory, so profiles are __slots__
+# records keyed by packed integer IPs rather than dicts of sets keyed by
+# strings. IPv6 keys carry a tag bit above the 128 address bits so they
+# never collide with IPv4 ones, plus a second bit for p0f's uncompressed
+# 'a:b:c:d:e:f:g:h' spelling; any other spelling is remembered verbatim.
+_V6_TAG = 1 << 128
+_V6_EXPANDED = 1 << 129
+_ip_keys = {}
+_v6_text = {}
+
+def pack_ip(ip):
+    """Integer key for an IPv4/IPv6 address string (the string itself if unparsable)"""
+    key = _ip_keys.get(ip)
+    if key is not None:
+        return key
+    try:
+        if ':' in ip:
+            packed = socket.inet_pton(socket.AF_INET6, ip)
+            key = int.from_bytes(packed, 'big') | _V6_TAG
+            if _expanded_v6(key) == ip:
+                key |= _V6_EXPANDED
+            elif socket.inet_ntop(socket.AF_INET6, packed) != ip:
+                _v6_text.setdefault(key, ip)
+        else:
+            key = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, TypeError):
+        key = ip
+    if len(_ip_keys) >= _CACHE_LIMIT:
+        _ip_keys.clear()
+    _ip_keys[ip] = key
+    return key
+
+def _expanded_v6(key):
+    return ':'.join('%x' % ((key >> shift) & 0xffff) for shift in range(112, -16, -16))
+
+def format_ip(key):
+    """Address string for a pack_ip() key"""
+    if key.__class__ is not int:
+        return key
+    if key < _V6_TAG:
+        return socket.inet_ntop(socket.AF_INET, key.to_bytes(4, 'big'))
+    if key & _V6_EXPANDED:
+        return _expanded_v6(key)
+    text = _v6_text.get(key)
+    if text is None:
+        text = socket.inet_ntop(socket.AF_INET6, (key ^ _V6_TAG).to_bytes(16, 'big'))
+    return text
+
+# OS strings seen in profiles; profiles store the index (0 = unknown)
+OS_TABLE = [None]
+_os_ids = {None: 0}
+
+def os_id(name):
+    index = _os_ids.get(name)
+    if index is None:
+        index = _os_ids[name] = len(OS_TABLE)
+        OS_TABLE.append(intern(name))
+    return index
+
+# Well-known service ports are one bit each; anything else goes to a side set
+_SERVICE_BITS = {port: 1 << bit for bit, port in enumerate(SERVICE_MAP)}
+_NO_ITEMS = frozenset()
+
+PROFILE_NAT = 1
+PROFILE_SERVER = 2
+PROFILE_EOL = 4
+
+class HostProfile:
+    """Everything known about one host.
+
+    Indexing with the old dict keys ('os', 'services', 'is_eol', ...)
+    returns the same values the dict-based profiles held.
+    """
+    __slots__ = ('os_id', 'distance', 'service_bits', 'rare_ports', 'scanners',
+                 'suspicious', 'flags', 'uptime', 'link', 'first_seen', 'last_seen')
+
+    def __init__(self):
+        self.os_id = 0
+        self.distance = None
+        self.service_bits = 0
+        self.rare_ports = None
+        self.scanners = None
+        self.suspicious = None
+        self.flags = 0
+        self.uptime = None
+        self.link = None
+        self.first_seen = None
+        self.last_seen = 0
+
+    @property
+    def os(self):
+        return OS_TABLE[self.os_id]
+
+    @property
+    def services(self):
+        labels = {service_label(port) for port, bit in _SERVICE_BITS.items() if self.service_bits & bit}
+        if self.rare_ports:
+            labels.update(service_label(port) for port in self.rare_ports)
+        return labels
+
+    def add_service(self, port):
+        """Record a server port; True if it was new"""
+        bit = _SERVICE_BITS.get(port)
+        if bit is not None:
+            if self.service_bits & bit:
+                return False
+            self.service_bits |= bit
+            return True
+        if self.rare_ports is None:
+            self.rare_ports = {port}
+            return True
+        if port in self.rare_ports:
+            return False
+        self.rare_ports.add(port)
+        return True
+
+    def add_scanner(self, app):
+        if self.scanners is None:
+            self.scanners = set()
+        self.scanners.add(app)
+
+    def add_suspicious(self, flag):
+        if self.suspicious is None:
+            self.suspicious = set()
+        self.suspicious.add(flag)
+
+    def frozen(self):
+        """Copy whose sets can no longer change (for snapshots)"""
+        copy = HostProfile.__new__(HostProfile)
+        copy.os_id = self.os_id
+        copy.distance = self.distance
+        copy.service_bits = self.service_bits
+        copy.rare_ports = frozenset(self.rare_ports) if self.rare_ports else None
+        copy.scanners = frozenset(self.scanners) if self.scanners else None
+        copy.suspicious = frozenset(self.suspicious) if self.suspicious else None
+        copy.flags = self.flags
+        copy.uptime = self.uptime
+        copy.link = self.link
+        copy.first_seen = self.first_seen
+        copy.last_seen = self.last_seen
+        return copy
+
+    def absorb(self, other):
+        """Merge a later profile of the same host into this one.
+
+        Same rules as ingesting other's events after ours: first OS and
+        distance win, flags and sets accumulate, uptime/link take the
+        latest value. Returns (gained_os, gained_distance).
+        """
+        if not self.first_seen:
+            self.first_seen = other.first_seen
+        self.last_seen = max(self.last_seen, other.last_seen)
+
+        gained_os = not self.os_id and other.os_id
+        if gained_os:
+            self.os_id = other.os_id
+            self.flags |= other.flags & (PROFILE_SERVER | PROFILE_EOL)
+        gained_distance = self.distance is None and other.distance is not None
+        if gained_distance:
+            self.distance = other.distance
+
+        self.flags |= other.flags & PROFILE_NAT
+        if other.uptime is not None:
+            self.uptime = other.uptime
+        if other.link is not None:
+            self.link = other.link
+        self.service_bits |= other.service_bits
+        for port in other.rare_ports or ():
+            self.add_service(port)
+        for app in other.scanners or ():
+            self.add_scanner(app)
+        for flag in other.suspicious or ():
+            self.add_suspicious(flag)
+        return bool(gained_os), gained_distance
+
+    def __getitem__(self, key):
+        if key == 'os' or key == 'os_detail':
+            return OS_TABLE[self.os_id]
+        if key == 'services':
+            return self.services
+        if key == 'scanners' or key == 'suspicious':
+            return getattr(self, key) or _NO_ITEMS
+        if key == 'nat':
+            return bool(self.flags & PROFILE_NAT)
+        if key == 'is_server':
+            return bool(self.flags & PROFILE_SERVER)
+        if key == 'is_eol':
+            return bool(self.flags & PROFILE_EOL)
+        if key in ('distance', 'uptime', 'link', 'first_seen'):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    # OS ids are per process, so pickles (process-pool results) carry the name
+    def __getstate__(self):
+        return (OS_TABLE[self.os_id], self.distance, self.service_bits, self.rare_ports,
+                self.scanners, self.suspicious, self.flags, self.uptime, self.link,
+                self.first_seen, self.last_seen)
+
+    def __setstate__(self, state):
+        (name, self.distance, self.service_bits, self.rare_ports, self.scanners,
+         self.suspicious, self.flags, self.uptime, self.link,
+         self.first_seen, self.last_seen) = state
+        self.os_id = os_id(name) if name is not None else 0
+
+class ProfileStore:
+    """IP -> HostProfile map keyed by pack_ip() integers.
+
+    `dirty` collects the keys changed since the last snapshot; writers
+    add to it while holding stats_lock. `added` lists the keys created
+    since then, in order, so snapshots can keep first-seen order without
+    walking the store. `clock` (whole seconds, set per ingest batch) is
+    stamped on every profile touched, for eviction, which `spill` (a
+    ProfileSpill, when live mode caps the hosts in memory) does. `db` is
+    the --db ProfileDatabase the store is flushed to.
+
+    `trackers` are the consumers of changed hosts (the ProfileDatabase, a
+    DeltaExporter): every snapshot adds the keys it saw change to each
+    one's `pending` set, and the spill hands each the profiles it drops
+    via evicted().
+    """
+    def __init__(self):
+        self.hosts = {}
+        self.dirty = set()
+        self.added = []
+        self.clock = 0
+        self.spill = None
+        self.db = None
+        self.trackers = []
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __contains__(self, ip):
+        return pack_ip(ip) in self.hosts
+
+    def __iter__(self):
+        return map(format_ip, self.hosts)
+
+    def __getitem__(self, ip):
+        """Profile for ip, created on first use and marked changed"""
+        key = pack_ip(ip)
+        self.dirty.add(key)
+        return self.profile(key)
+
+    def profile(self, key):
+        """Profile for a packed key, created on first use (not marked changed)"""
+        profile = self.hosts.get(key)
+        if profile is None:
+            profile = self.hosts[key] = HostProfile()
+            self.added.append(key)
+        profile.last_seen = self.clock
+        return profile
+
+    def get(self, ip, default=None):
+        return self.hosts.get(pack_ip(ip), default)
+
+    def items(self):
+        for key, profile in self.hosts.items():
+            yield format_ip(key), profile
+
+    def values(self):
+        return self.hosts.values()
+
+    def clear(self):
+        self.hosts.clear()
+        self.dirty.clear()
+        self.added.clear()
+
+class ProfileSpill:
+    """Bounded-memory mode: evict idle hosts to an append-only NDJSON file.
+
+    Hosts idle for more than `ttl` seconds, or the least recently seen
+    ones once the store holds more than `max_hosts`, are written out and
+    dropped from memory. Eviction trims to 90% of the cap so sweeps stay
+    rare. merged() folds the spilled records back in for final output.
+    """
+    def __init__(self, path, max_hosts=None, ttl=None):
+        self.path = path
+        self.max_hosts = max_hosts
+        self.ttl = ttl
+        self.file = open(path, 'w', buffering=1 << 16)
+        self.evicted = 0
+        self.started = time.time()
+        self.next_sweep = 0
+
+    def due(self, store):
+        if self.max_hosts and len(store.hosts) > self.max_hosts:
+            return True
+        return bool(self.ttl) and store.clock >= self.next_sweep
+
+    def evict(self, store):
+        """Spill idle/excess hosts (caller holds stats_lock); returns (key, profile) pairs
+
+        Every change tracker is handed the evicted profiles, as they are
+        gone from the snapshots its pending keys are resolved against.
+        """
+        hosts = store.hosts
+        now = store.clock
+        victims = []
+        if self.ttl:
+            cutoff = now - self.ttl
+            victims = [key for key, profile in hosts.items() if profile.last_seen < cutoff]
+            self.next_sweep = now + max(1, self.ttl // 10)
+        if self.max_hosts and len(hosts) - len(victims) > self.max_hosts:
+            chosen = set(victims)
+            excess = len(hosts) - len(victims) - int(self.max_hosts * 0.9)
+            oldest = heapq.nsmallest(excess, (item for item in hosts.items() if item[0] not in chosen),
+                                     key=lambda item: item[1].last_seen)
+            victims.extend(key for key, _ in oldest)
+
+        write = self.file.write
+        spilled = []
+        for key in victims:
+            profile = hosts.pop(key)
+            spilled.append((key, profile))
+            write(json.dumps(self.record(format_ip(key), profile)) + '\n')
+        self.file.flush()
+        self.evicted += len(victims)
+        # Before the keys are marked dirty, so trackers can tell which had unsaved changes
+        for tracker in store.trackers:
+            tracker.evicted(spilled, store.dirty)
+        store.dirty.update(victims)
+        return spilled
+
+    @staticmethod
+    def record(ip, profile):
+        ports = [port for port, bit in _SERVICE_BITS.items() if profile.service_bits & bit]
+        ports.extend(profile.rare_ports or ())
+        return {
+            'ip': ip, 'os': profile.os, 'distance': profile.distance, 'ports': ports,
+            'scanners': sorted(profile.scanners or ()), 'suspicious': sorted(profile.suspicious or ()),
+            'flags': profile.flags, 'uptime': profile.uptime, 'link': profile.link,
+            'first_seen': profile.first_seen, 'last_seen': profile.last_seen,
+        }
+
+    @staticmethod
+    def profile(record):
+        profile = HostProfile()
+        profile.os_id = os_id(record['os']) if record['os'] is not None else 0
+        profile.distance = record['distance']
+        for port in record['ports']:
+            profile.add_service(port)
+        for app in record['scanners']:
+            profile.add_scanner(app)
+        for flag in record['suspicious']:
+            profile.add_suspicious(flag)
+        profile.flags = record['flags']
+        profile.uptime = record['uptime']
+        profile.link = intern(record['link']) if record['link'] is not None else None
+        profile.first_seen = record['first_seen']
+        profile.last_seen = record['last_seen']
+        return profile
+
+    def rate(self):
+        """Evictions per minute since start"""
+        minutes = max(time.time() - self.started, 1) / 60
+        return self.evicted / minutes
+
+    def merged(self, snapshot):
+        """Snapshot of spilled hosts (in spill order) followed by resident ones.
+
+        Per-host counters are recomputed, as a host that came back after
+        being spilled was counted again when it was re-profiled.
+        """
+        self.file.flush()
+        hosts = {}
+        with open(self.path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                key = pack_ip(record['ip'])
+                profile = self.profile(record)
+                if key in hosts:
+                    hosts[key].absorb(profile)
+                else:
+                    hosts[key] = profile
+        for key, profile in snapshot.hosts.items():
+            if key in hosts:
+                hosts[key].absorb(profile)
+            else:
+                hosts[key] = profile
+
+        stats = defaultdict(int, snapshot.stats)
+        for counter in ('total_os', 'windows', 'linux', 'eol_systems', 'close_hosts'):
+            stats.pop(counter, None)
+        for profile in hosts.values():
+            name = profile.os
+            if name:
+                stats['total_os'] += 1
+                if 'Windows' in name:
+                    stats['windows'] += 1
+                    if profile.flags & PROFILE_EOL:
+                        stats['eol_systems'] += 1
+                elif 'Linux' in name:
+                    stats['linux'] += 1
+            if profile.distance is not None and profile.distance <= 2:
+                stats['close_hosts'] += 1
+        return ProfileSnapshot(snapshot.epoch, stats, hosts)
+
+    def close(self):
+        self.file.close()
+
+def os_family(name):
+    """Coarse OS family ('Windows', 'Linux', 'Mac OS X', ...) for indexing"""
+    if not name:
+        return None
+    for family in ('Windows', 'Linux', 'Mac OS X', 'iOS', 'Android', 'FreeBSD', 'OpenBSD', 'Solaris'):
+        if family in name:
+            return family
+    return name.split(' ', 1)[0]
+
+class ProfileDatabase:
+    """Optional SQLite copy of the host profiles that outlives the process.
+
+    Hosts changed since the last flush are upserted in one transaction
+    once `interval` seconds or `batch` changed hosts have built up, with
+    WAL and synchronous=NORMAL so commits do not wait on fsync. Upserts
+    follow HostProfile.absorb() rules, so a resumed session (or a host
+    that was spilled and came back) only ever adds detail to a row.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS hosts (
+            ip TEXT PRIMARY KEY, os TEXT, os_family TEXT, distance INTEGER,
+            flags INTEGER NOT NULL DEFAULT 0, uptime TEXT, link TEXT,
+            first_seen REAL, last_seen INTEGER);
+        CREATE TABLE IF NOT EXISTS services (
+            ip TEXT NOT NULL, port INTEGER NOT NULL,
+            PRIMARY KEY (ip, port)) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS tags (
+            ip TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL,
+            PRIMARY KEY (ip, kind, value)) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE INDEX IF NOT EXISTS hosts_os_family ON hosts (os_family);
+        CREATE INDEX IF NOT EXISTS hosts_distance ON hosts (distance);
+        CREATE INDEX IF NOT EXISTS hosts_flags ON hosts (flags);
+        CREATE INDEX IF NOT EXISTS services_port ON services (port);
+    """
+    # Same merge as HostProfile.absorb(): DO UPDATE sees the stored row as hosts.*
+    UPSERT_HOST = f"""
+        INSERT INTO hosts (ip, os, os_family, distance, flags, uptime, link, first_seen, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (ip) DO UPDATE SET
+            os = COALESCE(hosts.os, excluded.os),
+            os_family = COALESCE(hosts.os_family, excluded.os_family),
+            distance = COALESCE(hosts.distance, excluded.distance),
+            flags = hosts.flags | (excluded.flags & CASE WHEN hosts.os IS NULL
+                THEN {PROFILE_NAT | PROFILE_SERVER | PROFILE_EOL} ELSE {PROFILE_NAT} END),
+            uptime = COALESCE(excluded.uptime, hosts.uptime),
+            link = COALESCE(excluded.link, hosts.link),
+            first_seen = COALESCE(hosts.first_seen, excluded.first_seen),
+            last_seen = MAX(hosts.last_seen, excluded.last_seen)
+    """
+
+    def __init__(self, path, resume=False, interval=2.0, batch=5000):
+        self.path = path
+        self.interval = interval
+        self.batch = batch
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if not resume:
+            self.db.executescript("DROP TABLE IF EXISTS hosts; DROP TABLE IF EXISTS services; "
+                                  "DROP TABLE IF EXISTS tags; DROP TABLE IF EXISTS meta;")
+        self.db.executescript(self.SCHEMA)
+        self.lock = threading.Lock()
+        self.pending = set()      # keys changed since the last flush (filled by take_snapshot)
+        self.spilled = []         # (key, profile) evicted before they were flushed
+        self.started = time.time()
+        self.last_flush = self.started
+        self.rows = 0
+        self.commits = 0
+        self.busy = 0.0
+
+    def evicted(self, spilled, dirty):
+        """Keep spilled hosts that have unsaved changes for the next flush"""
+        self.spilled.extend(item for item in spilled if item[0] in dirty or item[0] in self.pending)
+
+    def due(self, store):
+        if time.time() - self.last_flush >= self.interval:
+            return True
+        return len(self.pending) + len(store.dirty) >= self.batch
+
+    def load(self, store):
+        """Load every stored host and the saved counters (for --resume); returns the host count"""
+        profiles = {}
+        for ip, name, distance, flags, uptime, link, first_seen, last_seen in self.db.execute(
+                "SELECT ip, os, distance, flags, uptime, link, first_seen, last_seen FROM hosts ORDER BY rowid"):
+            profile = HostProfile()
+            profile.os_id = os_id(name) if name is not None else 0
+            profile.distance = distance
+            profile.flags = flags
+            profile.uptime = uptime
+            profile.link = intern(link) if link is not None else None
+            profile.first_seen = first_seen
+            profile.last_seen = last_seen or 0
+            profiles[ip] = profile
+        for ip, port in self.db.execute("SELECT ip, port FROM services"):
+            profiles[ip].add_service(port)
+        for ip, kind, value in self.db.execute("SELECT ip, kind, value FROM tags"):
+            if kind == 'scanner':
+                profiles[ip].add_scanner(value)
+            else:
+                profiles[ip].add_suspicious(value)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'stats'").fetchone()
+
+        with stats_lock:
+            for ip, profile in profiles.items():
+                key = pack_ip(ip)
+                store.hosts[key] = profile
+                store.dirty.add(key)
+                store.added.append(key)
+            if row:
+                for counter, value in json.loads(row[0]).items():
+                    live_stats[counter] += value
+        return len(profiles)
+
+    def flush(self):
+        """Upsert every host changed since the last flush in one transaction"""
+        with self.lock:
+            snapshot = take_snapshot()
+            started = time.time()
+            keys, self.pending = self.pending, set()
+            # Evicted copies go first so a host that came back merges on top
+            changed, self.spilled = self.spilled, []
+            # Walk in first-seen order so rowids (and a resumed report) keep it
+            resident = snapshot.hosts
+            changed.extend((key, resident[key]) for key in resident.ordered(keys))
+
+            hosts, services, tags = [], [], []
+            for key, profile in changed:
+                ip = format_ip(key)
+                name = profile.os
+                hosts.append((ip, name, os_family(name), profile.distance, profile.flags,
+                              profile.uptime, profile.link, profile.first_seen, profile.last_seen))
+                services.extend((ip, port) for port, bit in _SERVICE_BITS.items() if profile.service_bits & bit)
+                services.extend((ip, port) for port in profile.rare_ports or ())
+                tags.extend((ip, 'scanner', app) for app in profile.scanners or ())
+                tags.extend((ip, 'suspicious', flag) for flag in profile.suspicious or ())
+
+            with self.db:
+                self.db.executemany(self.UPSERT_HOST, hosts)
+                self.db.executemany("INSERT OR IGNORE INTO services (ip, port) VALUES (?, ?)", services)
+                self.db.executemany("INSERT OR IGNORE INTO tags (ip, kind, value) VALUES (?, ?, ?)", tags)
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats', ?)",
+                                (json.dumps(snapshot.stats),))
+            self.last_flush = time.time()
+            self.busy += self.last_flush - started
+            self.rows += len(hosts)
+            self.commits += 1
+
+    def summary(self):
+        """Write rate so far, e.g. '120000 upserts in 14 commits, 85,000 rows/s, 100 ms/commit'"""
+        if not self.commits:
+            return None
+        rate = self.rows / self.busy if self.busy else 0
+        return (f"{self.rows} upserts in {self.commits} commits, {rate:,.0f} rows/s, "
+                f"{self.busy / self.commits * 1000:.0f} ms/commit, "
+                f"{self.busy / max(time.time() - self.started, 1e-9):.1%} of wall time")
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.db.close()
+
+ip_profiles = ProfileStore()
+
+def update_live_stats(event):
+    """Update live statistics and build per-IP profiles from a P0fEvent"""
+    if not isinstance(event, P0fEvent):
+        event = parse_event(event)
+        if event is None:
+            return
     with stats_lock:
-        cli_ip, srv_ip, data = extract_ips_from_line(line)
-        
-        live_stats['total_packets'] += 1
+        ip_profiles.clock = int(time.time())
+        _profile_event(event)
+        spill = ip_profiles.spill
+        if spill is not None and spill.due(ip_profiles):
+            spill.evict(ip_profiles)
+    db = ip_profiles.db
+    if db is not None and db.due(ip_profiles):
+        db.flush()
+
+def update_live_stats_batch(events):
+    """update_live_stats() for many events under one lock acquisition"""
+    with stats_lock:
+        ip_profiles.clock = int(time.time())
+        for event in events:
+            _profile_event(event)
+        spill = ip_profiles.spill
+        if spill is not None and spill.due(ip_profiles):
+            spill.evict(ip_profiles)
+    db = ip_profiles.db
+    if db is not None and db.due(ip_profiles):
+        db.flush()
+
+def _profile_event(event):
+    # Caller holds stats_lock
+    cli_ip = event.cli_ip
+    srv_ip = event.srv_ip
+    os_name = event.os
+    tail = event.tail
+    store = ip_profiles
+    
+    live_stats['total_packets'] += 1
+    
+    # Determine which IP we're profiling (client or server based on subject)
+    subj = event.subj
+    subject_ip = cli_ip if subj == 'cli' else srv_ip if subj == 'srv' else None
+    
+    # If we have an OS fingerprint, use that IP
+    if os_name is not None and os_name != '???' and subject_ip:
+        key = pack_ip(subject_ip)
+        profile = store.profile(key)
+        store.dirty.add(key)
         
-        # Determine which IP we're profiling (client or server based on subject)
-        subject_ip = None
-        if 'subj' in data:
-            if data['subj'] == 'cli' and cli_ip:
-                subject_ip = cli_ip
-            elif data['subj'] == 'srv' and srv_ip:
-                subject_ip = srv_ip
+        if not profile.first_seen:
+            profile.first_seen = time.time()
         
-        # If we have an OS fingerprint, use that IP
-        if 'os' in data and data['os'] != '???' and subject_ip:
-            profile = ip_profiles[subject_ip]
+        # Track OS
+        if not profile.os_id:
+            profile.os_id = os_id(os_name)
+            live_stats['total_os'] += 1
             
-            if not profile['first_seen']:
-                profile['first_seen'] = time.time()
-            
-            # Track OS
-            if not profile['os']:
-                profile['os'] = data['os']
-                profile['os_detail'] = data['os']
-                live_stats['total_os'] += 1
+            if 'Windows' in os_name:
+                live_stats['windows'] += 1
                 
-                if 'Windows' in data['os']:
-                    live_stats['windows'] += 1
-                    
-                    # EOL detection
-                    if any(x in data['os'] for x in ['XP', '2003', '2000']) and 'NT kernel' not in data['os']:
-                        profile['is_eol'] = True
-                        live_stats['eol_systems'] += 1
-                    
-                    # Server detection
-                    if any(x in data['os'] for x in ['2012', '2016', '2019', '2022']):
-                        if 'subj' in data and data['subj'] == 'srv':
-                            profile['is_server'] = True
+                # EOL detection
+                if any(x in os_name for x in ['XP', '2003', '2000']) and 'NT kernel' not in os_name:
+                    profile.flags |= PROFILE_EOL
+                    live_stats['eol_systems'] += 1
                 
-                elif 'Linux' in data['os']:
-                    live_stats['linux'] += 1
-                    if 'subj' in data and data['subj'] == 'srv':
-                        profile['is_server'] = True
-            
-            # Distance
-            if 'distance' in data and profile['distance'] is None:
-                try:
-                    profile['distance'] = int(data['distance'])
-                    if profile['distance'] <= 2:
-                        live_stats['close_hosts'] += 1
-                except:
-                    pass
+                # Server detection
+                if any(x in os_name for x in ['2012', '2016', '2019', '2022']):
+                    if subj == 'srv':
+                        profile.flags |= PROFILE_SERVER
             
-            # NAT
-            if 'nat' in data and data['nat'] == 'yes':
-                profile['nat'] = True
-                live_stats['nat_detected'] += 1
-            
-            # Uptime
-            if 'uptime' in data:
-                profile['uptime'] = data['uptime']
-            
-            # Link type
-            if 'link' in data:
-                profile['link'] = data['link']
+            elif 'Linux' in os_name:
+                live_stats['linux'] += 1
+                if subj == 'srv':
+                    profile.flags |= PROFILE_SERVER
         
-        # Suspicious User-Agents
-        if 'bad_sw' in data and data['bad_sw'] != '0' and cli_ip:
-            ua_type = "OS mismatch" if data['bad_sw'] == '1' else "FAKE UA"
-            ip_profiles[cli_ip]['suspicious'].add(ua_type)
-            live_stats['suspicious_ua'] += 1
+        # Distance
+        if event.dist is not None and profile.distance is None:
+            profile.distance = event.dist
+            if event.dist <= 2:
+                live_stats['close_hosts'] += 1
         
-        # Scanner detection
-        if 'app' in data and cli_ip:
-            app_lower = data['app'].lower()
-            if 'nmap' in app_lower or 'masscan' in app_lower or 'scanner' in app_lower:
-                ip_profiles[cli_ip]['scanners'].add(data['app'])
-                live_stats['scanners'] += 1
+        # NAT
+        if tail.get('nat') == 'yes':
+            profile.flags |= PROFILE_NAT
+            live_stats['nat_detected'] += 1
         
-        # Service detection - track on the SERVER side
-        if srv_ip and ('srv' in data or 'cli' in data):
-            # Extract port from server address
-            if '/' in data.get('srv', '') or ':' in data.get('srv', ''):
-                port_match = re.search(r'[:/](\d+)\b', data['srv'])
-                if port_match:
-                    port = port_match.group(1)
-                    
-                    # Map common ports to services
-                    service_map = {
-                        '21': 'FTP', '22': 'SSH', '23': 'Telnet',
-                        '80': 'HTTP', '443': 'HTTPS', '445': 'SMB',
-                        '139': 'NetBIOS', '3389': 'RDP', '3306': 'MySQL',
-                        '5432': 'PostgreSQL', '27017': 'MongoDB', '6379': 'Redis'
-                    }
-                    
-                    service_name = service_map.get(port, f'port-{port}')
-                    ip_profiles[srv_ip]['services'].add(f"{service_name}:{port}")
-
-def print_live_stats():
-    """Print current live statistics in a clean format"""
-    with stats_lock:
-        if live_stats['total_packets'] == 0:
-            return
+        # Uptime
+        if 'uptime' in tail:
+            profile.uptime = tail['uptime']
         
-        print(f"\n{Colors.BOLD}{'='*70}{Colors.RESET}")
-        print(f"{Colors.BOLD}📊 LIVE STATISTICS{Colors.RESET}")
-        print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
-        print(f"Total Packets:     {live_stats['total_packets']:>6}")
-        print(f"OS Identified:     {live_stats['total_os']:>6}")
-        print(f"  └─ Windows:      {live_stats['windows']:>6}")
-        print(f"  └─ Linux:        {live_stats['linux']:>6}")
-        if live_stats['eol_systems'] > 0:
-            print(f"{Colors.RED}EOL Systems:       {live_stats['eol_systems']:>6}{Colors.RESET}")
-        if live_stats['close_hosts'] > 0:
-            print(f"{Colors.GREEN}Close Hosts:       {live_stats['close_hosts']:>6}{Colors.RESET}")
-        if live_stats['nat_detected'] > 0:
-            print(f"{Colors.YELLOW}NAT Detected:      {live_stats['nat_detected']:>6}{Colors.RESET}")
-        if live_stats['suspicious_ua'] > 0:
-            print(f"{Colors.YELLOW}Suspicious UA:     {live_stats['suspicious_ua']:>6}{Colors.RESET}")
-        if live_stats['scanners'] > 0:
-            print(f"{Colors.RED}Scanners:          {live_stats['scanners']:>6}{Colors.RESET}")
-        print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
-
-def print_live_intelligence_update(iteration):
-    """Print actionable intelligence summary grouped by IP"""
-    print(f"\n{Colors.BOLD}{'='*70}{Colors.RESET}")
-    print(f"{Colors.BOLD}📊 LIVE INTELLIGENCE UPDATE #{iteration}{Colors.RESET} - {datetime.now().strftime('%H:%M:%S')}")
-    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
-    
-    # Quick stats
-    total_hosts = len(ip_profiles)
-    windows_count = sum(1 for p in ip_profiles.values() if p['os'] and 'Windows' in p['os'])
-    linux_count = sum(1 for p in ip_profiles.values() if p['os'] and 'Linux' in p['os'])
-    
-    print(f"Packets: {live_stats['total_packets']} | Unique Hosts: {total_hosts} | "
-          f"Win: {windows_count} | Linux: {linux_count}")
+        # Link type
+        if 'link' in tail:
+            profile.link = intern(tail['link'])
     
-    # Group IPs by priority: EOL > Scanners > Servers > Services > Others
-    eol_ips = []
-    scanner_ips = []
-    server_ips = []
-    service_ips = []
-    other_ips = []
+    # Suspicious User-Agents
+    bad_sw = tail.get('bad_sw')
+    if bad_sw is not None and bad_sw != '0' and cli_ip:
+        ua_type = "OS mismatch" if bad_sw == '1' else "FAKE UA"
+        store[cli_ip].add_suspicious(ua_type)
+        live_stats['suspicious_ua'] += 1
     
-    for ip, profile in ip_profiles.items():
-        if profile['is_eol']:
-            eol_ips.append(ip)
-        elif profile['scanners']:
-            scanner_ips.append(ip)
-        elif profile['is_server']:
-            server_ips.append(ip)
-        elif profile['services']:
-            service_ips.append(ip)
-        else:
-            other_ips.append(ip)
-    
-    # Display EOL systems
-    if eol_ips:
-        print(f"\n{Colors.RED}{Colors.BOLD}🎯 CRITICAL: END-OF-LIFE SYSTEMS{Colors.RESET}")
-        for ip in sorted(eol_ips)[:10]:
-            profile = ip_profiles[ip]
-            print(f"\n  {Colors.RED}IP: {ip}{Colors.RESET}")
-            print(f"    OS: {profile['os']}")
-            if profile['distance'] is not None:
-                print(f"    Distance: {profile['distance']} hops")
-            if profile['services']:
-                services = ', '.join(sorted(profile['services']))
-                print(f"    Services: {services}")
+    # Scanner detection
+    app = tail.get('app')
+    if app is not None and cli_ip:
+        app_lower = app.lower()
+        if 'nmap' in app_lower or 'masscan' in app_lower or 'scanner' in app_lower:
+            store[cli_ip].add_scanner(app)
+            live_stats['scanners'] += 1
     
-    # Display scanners
-    if scanner_ips:
-        print(f"\n{Colors.RED}{Colors.BOLD}🔍 SCANNER ACTIVITY{Colors.RESET}")
-        for ip in sorted(scanner_ips)[:5]:
-            profile = ip_profiles[ip]
-            print(f"\n  {Colors.RED}IP: {ip}{Colors.RESET}")
-            scanners = ', '.join(sorted(profile['scanners']))
-            print(f"    Scanner: {scanners}")
-            if profile['os']:
-                print(f"    OS: {profile['os']}")
+    # Service detection - track on the SERVER side
+    port = event.srv_port
+    if srv_ip and port is not None:
+        key = pack_ip(srv_ip)
+        if store.profile(key).add_service(port):
+            store.dirty.add(key)
+
+def ingest_lines(lines, engine=None, scope=None, instruments=None):
+    """ingest_line() for a batch of lines, profiled under one lock"""
+    if instruments is not None:
+        instruments.lines += len(lines)
+    with stage(instruments, 'parse'):
+        wanted = [line for line in lines if not is_unused_module(line)]
+        events = [event for event in map(parse_event, wanted) if event is not None]
+    if len(wanted) != len(lines):
+        with stats_lock:
+            live_stats['unused_module_lines'] += len(lines) - len(wanted)
+    profiled = events
+    if scope is not None:
+        scoped = [(event, scope.restrict(event)) for event in events]
+        profiled = [view for _, view in scoped if view is not None]
+        if len(profiled) != len(events):
+            with stats_lock:
+                live_stats['out_of_scope'] += len(events) - len(profiled)
+            events = [event for event, view in scoped if view is not None]
+    with stage(instruments, 'profile'):
+        update_live_stats_batch(profiled)
     
-    # Display servers (top 10)
-    if server_ips:
-        print(f"\n{Colors.CYAN}{Colors.BOLD}💻 SERVERS{Colors.RESET}")
-        for ip in sorted(server_ips)[:10]:
-            profile = ip_profiles[ip]
-            print(f"\n  {Colors.CYAN}IP: {ip}{Colors.RESET}")
-            print(f"    OS: {profile['os']}")
-            if profile['distance'] is not None:
-                print(f"    Distance: {profile['distance']} hops")
-            if profile['services']:
-                services = ', '.join(sorted(profile['services']))
-                print(f"    Services: {services}")
+    if engine is not None:
+        with stage(instruments, 'categories'):
+            for event in events:
+                engine.feed(event)
     
-    # Display hosts with services (top 10)
-    if service_ips and not server_ips:  # Only show if we haven't shown servers
-        print(f"\n{Colors.MAGENTA}{Colors.BOLD}🔓 SERVICES DISCOVERED{Colors.RESET}")
-        for ip in sorted(service_ips)[:10]:
-            profile = ip_profiles[ip]
-            services = ', '.join(sorted(profile['services']))
-            print(f"\n  {Colors.MAGENTA}IP: {ip}{Colors.RESET}")
-            print(f"    Services: {services}")
-            if profile['os']:
-                print(f"    OS: {profile['os']}")
+    # Show packet details if verbose
+    if verbose_mode:
+        with stage(instruments, 'highlight'):
+            shown = [highlight_line(event, instruments) or event.text.strip() for event in events]
+        with stage(instruments, 'print'):
+            for text in shown:
+                print(text)
+    return events
+
+def ingest_line(line, engine=None, scope=None, instruments=None):
+    """Parse one full.log line once and hand it to every consumer"""
+    if is_unused_module(line):
+        with stats_lock:
+            live_stats['unused_module_lines'] += 1
+        return None
+    event = parse_event(line)
+    if event is None:
+        return None
+    profiled = event
+    if scope is not None:
+        profiled = scope.restrict(event)
+        if profiled is None:
+            with stats_lock:
+                live_stats['out_of_scope'] += 1
+            return None
     
-    # Summary counts
-    total_services = sum(len(p['services']) for p in ip_profiles.values())
-    if total_services > 0:
-        print(f"\n{Colors.YELLOW}Total: {len(eol_ips)} EOL, {len(scanner_ips)} scanners, "
-              f"{len(server_ips)} servers, {total_services} services{Colors.RESET}")
+    update_live_stats(profiled)
+    if engine is not None:
+        engine.feed(event)
     
-    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
-
-def tail_log_file(logfile, show_stats_interval=15):
-    """Tail the log file and show periodic intelligence summaries"""
-    print(f"\n{Colors.GREEN}[+] Live capture active - showing intelligence updates every {show_stats_interval}s{Colors.RESET}")
+    # In verbose mode, show packet details
     if verbose_mode:
-        print(f"{Colors.CYAN}[+] Verbose mode: showing packet-level details{Colors.RESET}\n")
-    else:
-        print(f"{Colors.CYAN}[+] Quiet mode: showing summaries only (use -v for packet details){Colors.RESET}")
-        print(f"{Colors.CYAN}[+] Press Ctrl+C to stop and generate final report{Colors.RESET}\n")
-        print(f"{Colors.YELLOW}Collecting traffic... first update in {show_stats_interval}s{Colors.RESET}")
-    
-    last_update_time = time.time()
+        highlighted = highlight_line(event, instruments)
+        print(highlighted if highlighted else event.text.strip())
+    return event
+
+class LowestKeys:
+    """Set of profile keys that yields its lowest ones in numeric IP order.
+
+    A binary heap per key type (unparsable string keys come last):
+    add() is O(log n), discard() is O(1) and leaves the heap entry to be
+    skipped later, and first(k) pops and pushes back k entries, so
+    O(k log n). The heap is rebuilt once skipped entries outnumber the
+    members.
+    """
+    __slots__ = ('heaps', 'members', 'stale')
+
+    def __init__(self):
+        self.heaps = ([], [])    # int keys, str keys
+        self.members = set()
+        self.stale = 0           # heap entries that are not a member's (first) entry
+
+    def add(self, key):
+        if key not in self.members:
+            self.members.add(key)
+            heapq.heappush(self.heaps[key.__class__ is not int], key)
+
+    def discard(self, key):
+        if key in self.members:
+            self.members.discard(key)
+            self.stale += 1
+            if self.stale > len(self.members) + 64:
+                self.heaps = ([], [])
+                for member in self.members:
+                    self.heaps[member.__class__ is not int].append(member)
+                for heap in self.heaps:
+                    heapq.heapify(heap)
+                self.stale = 0
+
+    def first(self, count):
+        keys = []
+        for heap in self.heaps:
+            taken = set()
+            while heap and len(keys) < count:
+                key = heapq.heappop(heap)
+                if key in self.members and key not in taken:
+                    taken.add(key)
+                    keys.append(key)
+                else:
+                    self.stale -= 1
+            for key in taken:
+                heapq.heappush(heap, key)
+        return keys
+
+    def __len__(self):
+        return len(self.members)
+
+class PriorityIndex:
+    """Live-update buckets and totals, maintained as snapshots change hosts.
+
+    Each host sits in the first bucket it qualifies for (EOL > scanner >
+    server > services), so print_live_intelligence_update() reads the
+    lowest IPs and the sizes instead of re-bucketing every host.
+    """
+    BUCKETS = ('eol', 'scanner', 'server', 'service')
+
+    def __init__(self):
+        self.buckets = {name: LowestKeys() for name in self.BUCKETS}
+        self.windows = 0
+        self.linux = 0
+        self.services = 0
+
+    @staticmethod
+    def bucket(profile):
+        if profile.flags & PROFILE_EOL:
+            return 'eol'
+        if profile.scanners:
+            return 'scanner'
+        if profile.flags & PROFILE_SERVER:
+            return 'server'
+        if profile.service_bits or profile.rare_ports:
+            return 'service'
+        return None
+
+    def _count(self, profile, sign):
+        name = profile.os
+        if name:
+            if 'Windows' in name:
+                self.windows += sign
+            if 'Linux' in name:
+                self.linux += sign
+        self.services += sign * (bin(profile.service_bits).count('1') + len(profile.rare_ports or ()))
+
+    def update(self, key, old, new):
+        """Move one host from its old profile's place to its new one's (None = absent)"""
+        before = after = None
+        if old is not None:
+            self._count(old, -1)
+            before = self.bucket(old)
+        if new is not None:
+            self._count(new, 1)
+            after = self.bucket(new)
+        if before != after:
+            if before is not None:
+                self.buckets[before].discard(key)
+            if after is not None:
+                self.buckets[after].add(key)
+
+    def view(self, limit=10):
+        """{bucket: (size, lowest `limit` keys)} plus the totals, for a snapshot"""
+        view = {name: (len(keys), keys.first(limit)) for name, keys in self.buckets.items()}
+        view['windows'] = self.windows
+        view['linux'] = self.linux
+        view['services'] = self.services
+        return view
+
+def _ip_order(key):
+    """Sort key putting pack_ip() keys in numeric IP order (string keys last)"""
+    return (key.__class__ is not int, key)
+
+class ProfileColumns:
+    """NumPy structured-array copy of the host profiles (needs numpy).
+
+    One row per host holding the packed IP (kind = v4/v6 tag bits, then
+    the address split into two 64-bit halves), OS-family code, distance,
+    flag bits and service bitmask. Like PriorityIndex it is refreshed by
+    take_snapshot() for the hosts that changed only; rows of hosts that
+    went away are reused. frozen() gives the HostColumns reports query.
+    """
+    DTYPE = [('kind', 'u1'), ('hi', 'u8'), ('lo', 'u8'), ('family', 'u1'),
+             ('distance', 'i2'), ('flags', 'u1'), ('services', 'u4')]
+    TEXT = 4        # kind of an unparsable (string) key
+    FREE = 255      # kind of an unused row
+    # flag bits on top of PROFILE_NAT/SERVER/EOL
+    SCANNER = 8
+    SUSPICIOUS = 16
+    RARE_PORTS = 32
+
+    def __init__(self, capacity=1024):
+        self.rows = np.zeros(capacity, self.DTYPE)
+        self.keys = []            # row -> key (None for free rows)
+        self.index = {}           # key -> row
+        self.free = []
+        self.families = [None]    # family code -> os_family() name
+        self._family_codes = {None: 0}
+        self._os_families = [0]   # os_id -> family code
+
+    def family(self, os_id):
+        codes = self._os_families
+        while len(codes) <= os_id:
+            name = os_family(OS_TABLE[len(codes)])
+            code = self._family_codes.get(name)
+            if code is None:
+                code = self._family_codes[name] = len(self.families)
+                self.families.append(name)
+            codes.append(code)
+        return codes[os_id]
+
+    def update(self, changed):
+        """Rewrite the rows of changed hosts ((key, profile) pairs, profile None = removed)"""
+        rows, records = [], []
+        for key, profile in changed:
+            if profile is None:
+                self.remove(key)
+            else:
+                rows.append(self.row(key))
+                records.append(self.record(key, profile))
+        if rows:
+            self.rows[rows] = np.array(records, self.DTYPE)
+
+    def row(self, key):
+        """Row index for a key, allocated on first use"""
+        row = self.index.get(key)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+                self.keys[row] = key
+            else:
+                row = len(self.keys)
+                if row == len(self.rows):
+                    self.rows = np.concatenate([self.rows, np.zeros(len(self.rows), self.DTYPE)])
+                self.keys.append(key)
+            self.index[key] = row
+        return row
+
+    def remove(self, key):
+        row = self.index.pop(key, None)
+        if row is not None:
+            self.keys[row] = None
+            self.rows['kind'][row] = self.FREE
+            self.free.append(row)
+
+    def record(self, key, profile):
+        if key.__class__ is int:
+            kind, hi, lo = key >> 128, (key >> 64) & 0xFFFFFFFFFFFFFFFF, key & 0xFFFFFFFFFFFFFFFF
+        else:
+            kind, hi, lo = self.TEXT, 0, 0
+        flags = profile.flags
+        if profile.scanners:
+            flags |= self.SCANNER
+        if profile.suspicious:
+            flags |= self.SUSPICIOUS
+        if profile.rare_ports:
+            flags |= self.RARE_PORTS
+        distance = profile.distance if profile.distance is not None else -1
+        return (kind, hi, lo, self.family(profile.os_id), distance, flags, profile.service_bits)
+
+    def frozen(self):
+        """HostColumns copy of the live rows"""
+        used = self.rows[:len(self.keys)]
+        live = np.flatnonzero(used['kind'] != self.FREE)
+        keys = self.keys
+        return HostColumns(used[live], [keys[row] for row in live.tolist()], self.families)
+
+class HostColumns:
+    """Columnar view of one snapshot's hosts: vectorised counts, filters and aggregates.
+
+    `rows` is a ProfileColumns.DTYPE array and `keys[i]` the pack_ip()
+    key of row i. Masks are boolean arrays over the rows.
+    """
+    def __init__(self, rows, keys, families):
+        self.rows = rows
+        self.keys = keys
+        self.families = families
+
+    def __len__(self):
+        return len(self.keys)
+
+    def flagged(self, bits):
+        return (self.rows['flags'] & bits) != 0
+
+    def has_services(self):
+        return (self.rows['services'] != 0) | self.flagged(ProfileColumns.RARE_PORTS)
+
+    def os_family(self, name):
+        if name not in self.families:
+            return np.zeros(len(self.rows), bool)
+        return self.rows['family'] == self.families.index(name)
+
+    def lowest(self, mask, limit):
+        """Keys of the first `limit` masked hosts in numeric IP order"""
+        rows = np.flatnonzero(mask)
+        table = self.rows[rows]
+        numeric = table['kind'] != ProfileColumns.TEXT
+        table = table[numeric]
+        order = np.lexsort((table['lo'], table['hi'], table['kind']))[:limit]
+        keys = [self.keys[row] for row in rows[numeric][order].tolist()]
+        if len(keys) < limit:
+            keys += sorted(self.keys[row] for row in rows[~numeric].tolist())[:limit - len(keys)]
+        return keys
+
+    def distance_histogram(self):
+        """Hosts per hop count (index = distance), unknown distances left out"""
+        distance = self.rows['distance']
+        return np.bincount(distance[distance >= 0])
+
+    def os_by_subnet(self, limit=10):
+        """Busiest IPv4 /24s as [(cidr, hosts, [(os family, hosts), ...])]"""
+        v4 = self.rows[self.rows['kind'] == 0]
+        cells, counts = np.unique((v4['lo'] >> 8 << 8) | v4['family'], return_counts=True)
+        nets = cells >> 8
+        subnets, starts, sizes = np.unique(nets, return_index=True, return_counts=True)
+        totals = np.add.reduceat(counts, starts) if len(starts) else counts
+        busiest = np.lexsort((subnets, -totals))[:limit]
+        pivot = []
+        for index in busiest.tolist():
+            start, size = starts[index], sizes[index]
+            by_family = sorted(zip(counts[start:start + size].tolist(), (cells[start:start + size] & 0xFF).tolist()),
+                               key=lambda item: -item[0])
+            cidr = f"{format_ip(int(subnets[index]) << 8)}/24"
+            pivot.append((cidr, int(totals[index]),
+                          [(self.families[code] or 'unknown', hosts) for hosts, code in by_family]))
+        return pivot
+
+    def service_cooccurrence(self):
+        """(ports, matrix): matrix[i, j] = hosts offering both ports[i] and ports[j]"""
+        ports = list(_SERVICE_BITS)
+        services = self.rows['services']
+        bits = ((services[:, None] >> np.arange(len(ports), dtype=np.uint32)) & 1).astype(np.int32)
+        return ports, bits.T @ bits
+
+_ABSENT = object()
+
+class SnapshotHosts:
+    """Read-only hosts mapping of a ProfileSnapshot (packed key -> frozen profile).
+
+    Persistent, so snapshots share storage instead of each copying every
+    host: a snapshot is a stack of layers, newest first, each holding the
+    keys that changed at one snapshot (None for a host that left the
+    store). A new layer is merged into the one below while it is at least
+    half that one's size, like a binary counter, so there are O(log n)
+    layers and a snapshot costs amortised O(changed log n). Iteration is
+    in first-seen order: `order` is an append-only key list shared by the
+    snapshots, of which this one sees the first `length` keys, and
+    `positions` maps each key to its index there. The first
+    full walk flattens the layers into one dict, so reports pay the
+    layered lookups once.
+    """
+    __slots__ = ('layers', 'order', 'positions', 'length', 'size', 'flat')
+
+    def __init__(self, layers=(), order=None, positions=None, size=0):
+        self.layers = list(layers)
+        self.order = order if order is not None else []
+        self.positions = positions if positions is not None else {}
+        self.length = len(self.order)
+        self.size = size
+        self.flat = None
+
+    def derive(self, changed, added=()):
+        """New SnapshotHosts with `changed` ({key: frozen profile or None}) applied.
+
+        `added` gives the order in which new keys were created; only the
+        latest snapshot may be derived from, as `order` is shared.
+        """
+        order, positions, size = self.order, self.positions, self.size
+        for key, profile in changed.items():
+            present = self.get(key) is not None
+            if profile is None:
+                size -= present
+            elif not present:
+                size += 1
+        for key in itertools.chain(added, changed):
+            if key not in positions and changed.get(key) is not None:
+                positions[key] = len(order)
+                order.append(key)
+
+        layers = list(self.layers)
+        if changed:
+            layers.insert(0, changed)
+        while len(layers) > 1 and 2 * len(layers[0]) >= len(layers[1]):
+            merged = dict(layers[1])
+            merged.update(layers[0])
+            del layers[:2]
+            if not layers:
+                # Bottom layer: tombstones no longer hide anything
+                merged = {key: profile for key, profile in merged.items() if profile is not None}
+            layers.insert(0, merged)
+
+        hosts = SnapshotHosts(layers, order, positions, size)
+        if len(order) > 2 * size + 1024:
+            # Mostly hosts that were evicted: start a fresh order list
+            hosts.order = [key for key in order if hosts.get(key) is not None]
+            hosts.positions = {key: index for index, key in enumerate(hosts.order)}
+            hosts.length = len(hosts.order)
+        return hosts
+
+    def get(self, key, default=None):
+        flat = self.flat
+        if flat is not None:
+            return flat.get(key, default)
+        for layer in self.layers:
+            profile = layer.get(key, _ABSENT)
+            if profile is not _ABSENT:
+                return default if profile is None else profile
+        return default
+
+    def __getitem__(self, key):
+        profile = self.get(key)
+        if profile is None:
+            raise KeyError(key)
+        return profile
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.size
+
+    def flatten(self):
+        """This snapshot's hosts as one dict in first-seen order (built once)"""
+        flat = self.flat
+        if flat is None:
+            merged = {}
+            for layer in reversed(self.layers):
+                merged.update(layer)
+            flat = {key: merged[key] for key in itertools.islice(self.order, self.length)
+                    if merged.get(key) is not None}
+            # Same contents, so a later derive() can build on the flat dict
+            self.layers = [flat]
+            self.flat = flat
+        return flat
+
+    def ordered(self, keys):
+        """The given keys that are present, in first-seen order, without a full walk"""
+        return sorted((key for key in keys if key in self), key=self.positions.__getitem__)
+
+    def __iter__(self):
+        return iter(self.flatten())
+
+    def keys(self):
+        return self.flatten().keys()
+
+    def items(self):
+        return self.flatten().items()
+
+    def values(self):
+        return self.flatten().values()
+
+class ProfileSnapshot:
+    """Point-in-time copy of ip_profiles and live_stats for reporting.
+
+    hosts maps packed IP keys -> frozen HostProfile copies (a SnapshotHosts
+    for live snapshots, a dict once merged with spilled hosts); neither it
+    nor stats is touched by ingestion, so reports can walk them without
+    stats_lock.
+    """
+    __slots__ = ('epoch', 'taken', 'stats', 'hosts', 'spill', 'priority')
+
+    def __init__(self, epoch, stats, hosts, spill=None, priority=None):
+        self.epoch = epoch
+        self.taken = time.time()
+        self.stats = stats
+        self.hosts = hosts
+        self.spill = spill        # (resident, spilled, evictions/min) in bounded mode
+        self.priority = priority  # PriorityIndex.view() of these hosts
+
+    def items(self):
+        for key, profile in self.hosts.items():
+            yield format_ip(key), profile
+
+_last_snapshot = None
+_snapshot_lock = threading.Lock()
+_priority_index = PriorityIndex()
+_subnet_index = SubnetIndex()
+_profile_columns = ProfileColumns() if np is not None else None
+
+def take_snapshot():
+    """Return a consistent ProfileSnapshot of the current profiles.
+
+    Copy-on-write: only hosts marked dirty since the previous snapshot are
+    copied while stats_lock is held, so ingestion is blocked for
+    O(changed hosts); everything else is shared with the previous
+    snapshot through SnapshotHosts layers.
+    """
+    global _last_snapshot
+    with _snapshot_lock:
+        previous = _last_snapshot
+        previous_hosts = previous.hosts if previous is not None else SnapshotHosts()
+        with stats_lock:
+            dirty, ip_profiles.dirty = ip_profiles.dirty, set()
+            added, ip_profiles.added = ip_profiles.added, []
+            for tracker in ip_profiles.trackers:
+                tracker.pending.update(dirty)
+            hosts = ip_profiles.hosts
+            changed = {}
+            for key in dirty:
+                profile = hosts.get(key)
+                changed[key] = profile.frozen() if profile is not None else None
+            stats = defaultdict(int, live_stats)
+            spill = None
+            if ip_profiles.spill is not None:
+                spill = (len(hosts), ip_profiles.spill.evicted, ip_profiles.spill.rate())
+
+        for key, profile in changed.items():
+            old = previous_hosts.get(key)
+            _priority_index.update(key, old, profile)
+            _subnet_index.update(key, old, profile)
+        if _profile_columns is not None:
+            _profile_columns.update(changed.items())
+        hosts = previous_hosts.derive(changed, added)
+
+        _last_snapshot = ProfileSnapshot(previous.epoch + 1 if previous else 1, stats, hosts, spill,
+                                         _priority_index.view())
+        return _last_snapshot
+
+def report_snapshot():
+    """Snapshot for final output: resident hosts plus any spilled to disk"""
+    snapshot = take_snapshot()
+    if ip_profiles.spill is not None:
+        snapshot = ip_profiles.spill.merged(snapshot)
+    return snapshot
+
+def host_columns(snapshot):
+    """HostColumns for a snapshot, or None without numpy.
+
+    The latest snapshot is served from the incrementally maintained
+    columns; any other (e.g. merged with spilled hosts) is built afresh.
+    """
+    if np is None:
+        return None
+    with _snapshot_lock:
+        if snapshot is _last_snapshot and _profile_columns is not None:
+            return _profile_columns.frozen()
+    columns = ProfileColumns(max(len(snapshot.hosts), 1))
+    columns.update(snapshot.hosts.items())
+    return columns.frozen()
+
+def network_hosts(snapshot, network):
+    """Keys of a snapshot's hosts inside a CIDR (or at an address), in IP order.
+
+    Answered from the SubnetIndex, which follows the latest snapshot.
+    Hosts only ever leave the store in bounded mode, so there a snapshot
+    other than the latest (e.g. one merged with spilled hosts) is scanned.
+    """
+    low, high = network_range(*parse_network(network))
+    with _snapshot_lock:
+        if snapshot is _last_snapshot or ip_profiles.spill is None:
+            keys = _subnet_index.within(low, high)
+        else:
+            keys = None
+    if keys is None:
+        return sorted(key for key in snapshot.hosts
+                      if key.__class__ is int and low <= key & ~_V6_EXPANDED < high)
+    return [key for key in keys if key in snapshot.hosts]
+
+def reset_profiles():
+    """Forget all profiles, stats and snapshots"""
+    global _last_snapshot, _priority_index, _subnet_index, _profile_columns
+    with _snapshot_lock, stats_lock:
+        ip_profiles.clear()
+        live_stats.clear()
+        _last_snapshot = None
+        _priority_index = PriorityIndex()
+        _subnet_index = SubnetIndex()
+        if _profile_columns is not None:
+            _profile_columns = ProfileColumns()
+
+def open_profile_db(path, resume=False):
+    """Open the --db profile database for ip_profiles, loading what it holds with --resume"""
+    db = ip_profiles.db = ProfileDatabase(path, resume)
+    ip_profiles.trackers.append(db)
+    if resume:
+        hosts = db.load(ip_profiles)
+        print(f"{Colors.GREEN}[+] Resumed {hosts} hosts from {path}{Colors.RESET}")
+    return db
+
+def close_profile_db():
+    """Write the last batch and report the sustained write rate"""
+    db = ip_profiles.db
+    if db is None:
+        return
+    db.close()
+    ip_profiles.trackers.remove(db)
+    print(f"{Colors.GREEN}[+] Profile database {db.path}: {db.summary()}{Colors.RESET}")
+    ip_profiles.db = None
+
+def print_live_stats(snapshot=None, instruments=None):
+    """Print current live statistics in a clean format"""
+    snapshot = snapshot or take_snapshot()
+    stats = snapshot.stats
+    if stats['total_packets'] == 0:
+        return
+    
+    print(f"\n{Colors.BOLD}{'='*70}{Colors.RESET}")
+    print(f"{Colors.BOLD}📊 LIVE STATISTICS{Colors.RESET}")
+    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
+    print(f"Total Packets:     {stats['total_packets']:>6}")
+    print(f"OS Identified:     {stats['total_os']:>6}")
+    print(f"  └─ Windows:      {stats['windows']:>6}")
+    print(f"  └─ Linux:        {stats['linux']:>6}")
+    if snapshot.spill:
+        resident, spilled, rate = snapshot.spill
+        print(f"Hosts Resident:    {resident:>6}")
+        print(f"Hosts Spilled:     {spilled:>6}  ({rate:.1f}/min)")
+    if stats['eol_systems'] > 0:
+        print(f"{Colors.RED}EOL Systems:       {stats['eol_systems']:>6}{Colors.RESET}")
+    if stats['close_hosts'] > 0:
+        print(f"{Colors.GREEN}Close Hosts:       {stats['close_hosts']:>6}{Colors.RESET}")
+    if stats['nat_detected'] > 0:
+        print(f"{Colors.YELLOW}NAT Detected:      {stats['nat_detected']:>6}{Colors.RESET}")
+    if stats['suspicious_ua'] > 0:
+        print(f"{Colors.YELLOW}Suspicious UA:     {stats['suspicious_ua']:>6}{Colors.RESET}")
+    if stats['scanners'] > 0:
+        print(f"{Colors.RED}Scanners:          {stats['scanners']:>6}{Colors.RESET}")
+    if instruments is not None:
+        print(f"{Colors.CYAN}{'-'*70}{Colors.RESET}")
+        for line in instruments.report_lines():
+            print(line)
+    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
+
+def print_live_intelligence_update(iteration, snapshot=None, category_counts=None, latency=None, rates=None):
+    """Print actionable intelligence summary grouped by IP"""
+    snapshot = snapshot or take_snapshot()
+    hosts = snapshot.hosts
+    stats = snapshot.stats
+    
+    print(f"\n{Colors.BOLD}{'='*70}{Colors.RESET}")
+    print(f"{Colors.BOLD}📊 LIVE INTELLIGENCE UPDATE #{iteration}{Colors.RESET} - {datetime.now().strftime('%H:%M:%S')}")
+    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
+    
+    # Buckets and totals are maintained by take_snapshot()
+    priority = snapshot.priority
+    if priority is None:
+        index = PriorityIndex()
+        for key, profile in hosts.items():
+            index.update(key, None, profile)
+        priority = index.view()
+    
+    def lowest(bucket, limit):
+        count, keys = priority[bucket]
+        return count, [(format_ip(key), hosts[key]) for key in keys[:limit]]
+    
+    # Quick stats
+    print(f"Packets: {stats['total_packets']} | Unique Hosts: {len(hosts)} | "
+          f"Win: {priority['windows']} | Linux: {priority['linux']}")
+    if snapshot.spill:
+        resident, spilled, rate = snapshot.spill
+        print(f"Hosts: {resident} resident | {spilled} spilled | {rate:.1f} evictions/min")
+    if rates:
+        print("Interfaces: " + " | ".join(f"{interface} {rate:,.1f}/s ({lines} lines)"
+                                          for interface, (rate, lines) in rates.items()))
+    if latency:
+        print(f"Latency: {latency}")
+    if ip_profiles.db is not None and ip_profiles.db.summary():
+        print(f"Database: {ip_profiles.db.summary()}")
+    
+    # Category files maintained by the rule engine
+    if category_counts:
+        hits = sorted(((count, log) for log, count in category_counts.items() if count), reverse=True)
+        if hits:
+            top = ', '.join(f"{log.rsplit('.', 1)[0]}: {count}" for count, log in hits[:6])
+            print(f"Categories: {len(hits)} with entries | {top}")
+    
+    # IPs grouped by priority: EOL > Scanners > Servers > Services > Others,
+    # lowest addresses first
+    eol_count, eol_ips = lowest('eol', 10)
+    scanner_count, scanner_ips = lowest('scanner', 5)
+    server_count, server_ips = lowest('server', 10)
+    _, service_ips = lowest('service', 10)
+    
+    # Display EOL systems
+    if eol_ips:
+        print(f"\n{Colors.RED}{Colors.BOLD}🎯 CRITICAL: END-OF-LIFE SYSTEMS{Colors.RESET}")
+        for ip, profile in eol_ips:
+            print(f"\n  {Colors.RED}IP: {ip}{Colors.RESET}")
+            print(f"    OS: {profile['os']}")
+            if profile['distance'] is not None:
+                print(f"    Distance: {profile['distance']} hops")
+            if profile['services']:
+                services = ', '.join(sorted(profile['services']))
+                print(f"    Services: {services}")
+    
+    # Display scanners
+    if scanner_ips:
+        print(f"\n{Colors.RED}{Colors.BOLD}🔍 SCANNER ACTIVITY{Colors.RESET}")
+        for ip, profile in scanner_ips:
+            print(f"\n  {Colors.RED}IP: {ip}{Colors.RESET}")
+            scanners = ', '.join(sorted(profile['scanners']))
+            print(f"    Scanner: {scanners}")
+            if profile['os']:
+                print(f"    OS: {profile['os']}")
+    
+    # Display servers (top 10)
+    if server_ips:
+        print(f"\n{Colors.CYAN}{Colors.BOLD}💻 SERVERS{Colors.RESET}")
+        for ip, profile in server_ips:
+            print(f"\n  {Colors.CYAN}IP: {ip}{Colors.RESET}")
+            print(f"    OS: {profile['os']}")
+            if profile['distance'] is not None:
+                print(f"    Distance: {profile['distance']} hops")
+            if profile['services']:
+                services = ', '.join(sorted(profile['services']))
+                print(f"    Services: {services}")
+    
+    # Display hosts with services (top 10)
+    if service_ips and not server_ips:  # Only show if we haven't shown servers
+        print(f"\n{Colors.MAGENTA}{Colors.BOLD}🔓 SERVICES DISCOVERED{Colors.RESET}")
+        for ip, profile in service_ips:
+            services = ', '.join(sorted(profile['services']))
+            print(f"\n  {Colors.MAGENTA}IP: {ip}{Colors.RESET}")
+            print(f"    Services: {services}")
+            if profile['os']:
+                print(f"    OS: {profile['os']}")
+    
+    # Summary counts
+    if priority['services'] > 0:
+        print(f"\n{Colors.YELLOW}Total: {eol_count} EOL, {scanner_count} scanners, "
+              f"{server_count} servers, {priority['services']} services{Colors.RESET}")
+    
+    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
+
+class LatencyMeter:
+    """End-to-end delay from the p0f event timestamp to its processing.
+    
+    p0f stamps events with whole seconds, so each event is assumed to
+    have happened in the middle of its second (±0.5s).
+    """
+    def __init__(self):
+        self.events = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._epochs = {}
+
+    def _epoch(self, stamp):
+        epoch = self._epochs.get(stamp)
+        if epoch is None:
+            try:
+                epoch = time.mktime(time.strptime(stamp, '%Y/%m/%d %H:%M:%S')) + 0.5
+            except ValueError:
+                epoch = False
+            if len(self._epochs) >= _CACHE_LIMIT:
+                self._epochs.clear()
+            self._epochs[stamp] = epoch
+        return epoch
+
+    def observe(self, events, now=None):
+        now = time.time() if now is None else now
+        for event in events:
+            epoch = self._epoch(event.timestamp)
+            if epoch is False:
+                continue
+            delay = max(now - epoch, 0.0)
+            self.events += 1
+            self.total += delay
+            if delay > self.max:
+                self.max = delay
+
+    def summary(self):
+        if not self.events:
+            return None
+        return f"avg {self.total / self.events * 1000:.0f} ms, max {self.max * 1000:.0f} ms (±500 ms)"
+
+class Instrumentation:
+    """Opt-in hot-path metrics (--instrument).
+
+    Stage times are clocked per batch of lines rather than per line, and
+    stats_lock, once given the instance, only reads the clock when it is
+    contended. Rule match counts are exact; rule costs are
+    sampled: one line in SAMPLE is re-run rule by rule and the time scaled
+    up, so the matchers themselves stay untouched.
+    """
+    SAMPLE = 64
+    STAGES = ('parse', 'profile', 'categories', 'highlight', 'print')
+
+    def __init__(self):
+        self.started = time.time()
+        self.lines = 0
+        self.stages = dict.fromkeys(self.STAGES, 0.0)
+        self.high_value = defaultdict(lambda: [0, 0.0])   # tag -> [matches, est. seconds]
+        self.category_cost = defaultdict(float)           # output file -> est. seconds
+        self.category_counts = {}                         # the live CategoryEngine's counts
+        self.high_value_calls = 0
+        self.lock_acquired = 0
+        self.lock_contended = 0
+        self.lock_wait = 0.0
+        self.lock_wait_max = 0.0
+        self.lag = 0
+        self.lag_max = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+    def waited(self, seconds):
+        self.lock_contended += 1
+        self.lock_wait += seconds
+        if seconds > self.lock_wait_max:
+            self.lock_wait_max = seconds
+
+    def reader_lag(self, backlog):
+        """Bytes p0f has written that have not been read yet"""
+        self.lag = backlog
+        if backlog > self.lag_max:
+            self.lag_max = backlog
+
+    def sample_high_value(self, matcher, line, tags):
+        for tag, _ in tags:
+            self.high_value[tag][0] += 1
+        self.high_value_calls += 1
+        if self.high_value_calls % self.SAMPLE:
+            return
+        started = time.perf_counter()
+        candidates = matcher.candidates(line)
+        self.high_value['(literal scan)'][1] += (time.perf_counter() - started) * self.SAMPLE
+        for index in candidates:
+            regex = matcher.confirm.get(index)
+            if regex is not None:
+                started = time.perf_counter()
+                regex.search(line)
+                self.high_value[matcher.tags_by_index[index][0]][1] += (time.perf_counter() - started) * self.SAMPLE
+
+    def sample_categories(self, engine, text, candidates):
+        cost = self.category_cost
+        started = time.perf_counter()
+        found = engine.matcher.find(text)
+        cost['(literal scan)'] += (time.perf_counter() - started) * self.SAMPLE
+        for rule in candidates:
+            started = time.perf_counter()
+            rule.matches(text, found)
+            cost[rule.output] += (time.perf_counter() - started) * self.SAMPLE
+
+    def summary(self, limit=10):
+        """JSON-serialisable metrics (the costliest `limit` rules of each kind)"""
+        elapsed = max(time.time() - self.started, 1e-9)
+        high_value = sorted(self.high_value.items(), key=lambda item: -item[1][1])[:limit]
+        categories = sorted(self.category_cost.items(), key=lambda item: -item[1])[:limit]
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'lines': self.lines,
+            'lines_per_sec': round(self.lines / elapsed, 1),
+            'stage_seconds': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'high_value_rules': {tag: {'matches': matches if tag != '(literal scan)' else None,
+                                       'seconds': round(seconds, 4)}
+                                 for tag, (matches, seconds) in high_value},
+            'category_rules': {output: {'matches': self.category_counts.get(output), 'seconds': round(seconds, 4)}
+                               for output, seconds in categories},
+            'stats_lock': {'acquired': self.lock_acquired, 'contended': self.lock_contended,
+                           'wait_seconds': round(self.lock_wait, 4),
+                           'max_wait_ms': round(self.lock_wait_max * 1000, 3)},
+            'reader_lag_bytes': self.lag,
+            'reader_lag_max_bytes': self.lag_max,
+        }
+
+    def report_lines(self, limit=5):
+        """print_live_stats() block"""
+        summary = self.summary(limit)
+        lock = summary['stats_lock']
+        stages = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in summary['stage_seconds'].items())
+        lines = [
+            f"Lines/sec:         {summary['lines_per_sec']:>9,.0f}  ({self.lines} lines)",
+            f"Stage time:        {stages}",
+            f"stats_lock wait:   {lock['wait_seconds']:.3f}s over {lock['contended']}/{lock['acquired']} "
+            f"contended acquisitions (max {lock['max_wait_ms']:.1f} ms)",
+            f"Reader lag:        {self.lag:,} bytes (max {self.lag_max:,})",
+        ]
+        for title, rules in (('High-value rules', summary['high_value_rules']),
+                             ('Category rules', summary['category_rules'])):
+            if rules:
+                costliest = ', '.join(f"{name} {rule['seconds'] * 1000:.0f}ms"
+                                      + (f" ({rule['matches']} hits)" if rule['matches'] is not None else '')
+                                      for name, rule in rules.items())
+                lines.append(f"{title + ':':<19}{costliest}")
+        return lines
+
+class TimedLock:
+    """Lock that reports contended waits to `instruments`, an Instrumentation, when it has one"""
+    def __init__(self, lock, instruments=None):
+        self.lock = lock
+        self.instruments = instruments
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.instruments is None:
+            return self.lock.acquire(blocking, timeout)
+        self.instruments.lock_acquired += 1
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.instruments.waited(time.perf_counter() - started)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+stats_lock = TimedLock(threading.Lock())
+
+def enable_instrumentation():
+    """Instrumentation for --instrument, with stats_lock reporting its waits to it"""
+    instruments = stats_lock.instruments = Instrumentation()
+    return instruments
+
+def stage(instruments, name):
+    """Context manager timing a pipeline stage in `instruments` (a no-op for None)"""
+    return instruments.stage(name) if instruments is not None else _UNTIMED
+
+_UNTIMED = contextlib.nullcontext()
+
+LIVE_DIR = "p0f_live"              # private p0f logs while capturing live
+LOG_POLL_INTERVAL = 0.05           # log checks where inotify is missing
+_IN_MODIFY = 0x2
+_INOTIFY_EVENT = struct.Struct('iIII')
+_FALLOC_PUNCH_HOLE = 0x03          # FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE
+_libc = None
+
+def linux_libc():
+    """libc through ctypes for inotify and hole punching, or None where they are missing"""
+    global _libc
+    if _libc is None:
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            for name in ('inotify_init1', 'inotify_add_watch'):
+                getattr(libc, name)
+            libc.fallocate64.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+        except (OSError, AttributeError):
+            libc = False
+        _libc = libc
+    return _libc or None
+
+class LogWatch:
+    """inotify watch on the p0f logs, so the follower sleeps until p0f writes.
+    
+    fileno() is None where inotify is unavailable; the follower then
+    checks the logs every LOG_POLL_INTERVAL instead.
+    """
+    def __init__(self):
+        self.fd = None
+        self.watches = {}        # watch descriptor -> P0fProcess
+        libc = linux_libc()
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            self.fd = fd if fd >= 0 else None
+
+    def fileno(self):
+        return self.fd
+
+    def add(self, path, p0f):
+        if self.fd is not None:
+            watch = linux_libc().inotify_add_watch(self.fd, os.fsencode(path), _IN_MODIFY)
+            if watch >= 0:
+                self.watches[watch] = p0f
+
+    def changed(self):
+        """The P0fProcesses whose log was written since the last call"""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                watch, _, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size + length
+                if watch in self.watches:
+                    changed.add(self.watches[watch])
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class P0fProcess:
+    """Managed p0f child whose log is followed as it grows.
+    
+    p0f 3 only logs to a regular file it can flock() (its open_log()
+    refuses pipes and /dev/fd/N links), so every child gets a private log
+    under LIVE_DIR. It is read from the last offset in large chunks and
+    split into lines here; complete lines are optionally teed to a
+    SegmentedLog (owned by the caller, as several captures may share it),
+    and the consumed part is punched out of the file where the filesystem
+    allows, so the private copy takes no lasting disk space. p0f's stderr
+    is a pipe: it carries the reason when p0f refuses to start, and its
+    EOF tells the follower that p0f exited. A `bpf` expression is passed
+    to p0f, so the kernel drops what it rejects before p0f ever sees it.
+    """
+    CHUNK = 1 << 20
+    PUNCH_BYTES = 64 << 20
+
+    def __init__(self, interface, promiscuous=False, bpf=None, directory=LIVE_DIR):
+        self.interface = interface
+        self.promiscuous = promiscuous
+        self.bpf = bpf
+        self.path = os.path.join(directory, re.sub(r'[^\w.-]', '_', interface) + '.log')
+        self.tee = None
+        self.proc = None
+        self.fd = None
+        self.offset = 0
+        self.punched = 0
+        self.partial = b''
+        self.stderr = b''
+        self.bytes_read = 0
+        self.lines = 0
+    
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self, settle=2):
+        """Spawn p0f; with `settle`, wait that long to see it does not exit at once"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Created here so it is open for reading before p0f appends to it
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        cmd = ['p0f', '-i', self.interface, '-o', self.path]
+        if self.promiscuous:
+            cmd.insert(3, '-p')
+        if self.bpf:
+            cmd.append(self.bpf)
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.PIPE)
+        except OSError as e:
+            self.stderr = str(e).encode()
+            return False
+        os.set_blocking(self.proc.stderr.fileno(), False)
+        return self.running(settle) if settle else True
+
+    def running(self, timeout=0):
+        """False if p0f exits within `timeout` seconds (it does so straight
+        away on a bad interface, a bad filter or missing privileges)"""
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return True
+        self.read_stderr()
+        return False
+
+    def stderr_fileno(self):
+        return self.proc.stderr.fileno()
+
+    def read_stderr(self):
+        """Keep the tail of what p0f printed on stderr; False once p0f closed it"""
+        try:
+            data = os.read(self.stderr_fileno(), 4096)
+        except BlockingIOError:
+            return True
+        self.stderr = (self.stderr + data)[-4096:]
+        return bool(data)
+
+    def reason(self):
+        """Why p0f stopped: its '[-] ...' error lines, else its last stderr line"""
+        text = re.sub(r'\x1b\[[0-9;]*m', '', self.stderr.decode(errors='replace'))
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        errors = [line for line in lines if line.startswith(('[-]', 'OS message'))]
+        if errors or lines:
+            return ' / '.join(errors or lines[-1:])
+        return f"exit status {self.proc.returncode}" if self.proc else "not started"
+
+    def read(self):
+        """Return the complete lines logged since the last call (at most CHUNK bytes)"""
+        chunk = os.pread(self.fd, self.CHUNK, self.offset)
+        if not chunk:
+            return []
+        self.offset += len(chunk)
+        self.bytes_read += len(chunk)
+        if self.offset - self.punched >= self.PUNCH_BYTES:
+            self._punch()
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            self.partial += chunk
+            return []
+        data = self.partial + chunk[:end + 1]
+        self.partial = chunk[end + 1:]
+        return self._emit(data)
+
+    def _punch(self):
+        libc = linux_libc()
+        if libc is not None:
+            libc.fallocate64(self.fd, _FALLOC_PUNCH_HOLE, 0, self.offset)
+        self.punched = self.offset
+
+    def backlog(self):
+        """Bytes p0f has logged that are not processed yet (unread log + partial line)"""
+        return os.fstat(self.fd).st_size - self.offset + len(self.partial)
+
+    def _emit(self, data):
+        if self.tee is not None:
+            self.tee.write(data)
+        lines = data.decode(errors='surrogateescape').splitlines(True)
+        self.lines += len(lines)
+        return lines
+
+    def drain(self):
+        """Every line left in the log (p0f has exited), including a final unterminated one"""
+        lines = []
+        if self.fd is None:
+            return lines
+        while self.backlog() > len(self.partial):
+            lines.extend(self.read())
+        if self.partial:
+            data, self.partial = self.partial, b''
+            lines.extend(self._emit(data + b'\n'))
+        return lines
+
+    def stop(self, timeout=5):
+        if self.alive():
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stderr.close()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            with contextlib.suppress(OSError):
+                os.remove(self.path)
+
+class LiveCapture:
+    """One managed p0f child per interface, read as a single event stream.
+    
+    Every child has its own log and is tracked by its Popen handle (so
+    by PID, never by matching process names); all of them tee into one
+    SegmentedLog, so full.log stays a single merged log. Line counts are
+    kept per interface for the live rates.
+    """
+
+    def __init__(self, interfaces, promiscuous=False, tee="full.log", rotate_bytes=None, rotate_seconds=None,
+                 bpf=None):
+        self.processes = [P0fProcess(interface, promiscuous, bpf) for interface in interfaces]
+        self.tee_path = tee
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.tee = None
+        self.watch = LogWatch()
+        self.previous = None      # (time, {interface: lines}) at the last rates() call
+
+    def start(self, settle=2):
+        """Spawn every p0f; returns the P0fProcesses that failed to start"""
+        failed = [p0f for p0f in self.processes if not p0f.start(settle=0)]
+        deadline = time.time() + settle
+        failed.extend(p0f for p0f in self.processes
+                      if p0f not in failed and not p0f.running(max(deadline - time.time(), 0)))
+        if failed:
+            return failed
+        for p0f in self.processes:
+            self.watch.add(p0f.path, p0f)
+        if self.tee_path:
+            self.tee = SegmentedLog(self.tee_path, self.rotate_bytes, self.rotate_seconds)
+            for p0f in self.processes:
+                p0f.tee = self.tee
+        return failed
+
+    def backlog(self):
+        return sum(p0f.backlog() for p0f in self.processes if p0f.fd is not None)
+
+    def rates(self):
+        """{interface: (lines/s since the previous call, total lines)}"""
+        now = time.time()
+        counts = {p0f.interface: p0f.lines for p0f in self.processes}
+        since, before = self.previous or (now, {})
+        self.previous = (now, counts)
+        elapsed = now - since
+        return {interface: ((lines - before.get(interface, 0)) / elapsed if elapsed > 0 else 0.0, lines)
+                for interface, lines in counts.items()}
+
+    def stop(self, timeout=5):
+        for p0f in self.processes:
+            if p0f.alive():
+                p0f.proc.terminate()
+        for p0f in self.processes:
+            p0f.stop(timeout)
+
+    def drain(self):
+        """Lines every p0f logged before exiting"""
+        lines = []
+        for p0f in self.processes:
+            lines.extend(p0f.drain())
+        return lines
+
+    def close(self):
+        for p0f in self.processes:
+            p0f.close()
+        self.watch.close()
+        with contextlib.suppress(OSError):
+            os.rmdir(LIVE_DIR)
+        if self.tee is not None:
+            self.tee.close()
+            self.tee = None
+
+def follow_p0f(capture, show_stats_interval=15, engine=None, latency=None, deltas=None, scope=None,
+               instruments=None):
+    """Process p0f events as they arrive and show periodic intelligence summaries.
+    
+    Blocks on an inotify watch over every p0f log plus the p0f stderr
+    pipes (no polling where inotify exists); a signal wakeup fd interrupts
+    the wait so Ctrl+C is handled at once. Returns when every p0f has
+    exited or a shutdown is requested.
+    """
+    print(f"\n{Colors.GREEN}[+] Live capture active - showing intelligence updates every {show_stats_interval}s{Colors.RESET}")
+    if verbose_mode:
+        print(f"{Colors.CYAN}[+] Verbose mode: showing packet-level details{Colors.RESET}\n")
+    else:
+        print(f"{Colors.CYAN}[+] Quiet mode: showing summaries only (use -v for packet details){Colors.RESET}")
+        print(f"{Colors.CYAN}[+] Press Ctrl+C to stop and generate final report{Colors.RESET}\n")
+        print(f"{Colors.YELLOW}Collecting traffic... first update in {show_stats_interval}s{Colors.RESET}")
+    
+    next_update = time.time() + show_stats_interval
     update_count = 0
+    renderer = None
+    
+    def render(iteration, snapshot, category_counts, latency_summary, rates):
+        with stage(instruments, 'print'):
+            print_live_intelligence_update(iteration, snapshot, category_counts, latency_summary, rates)
+            if instruments is not None:
+                print_live_stats(snapshot, instruments)
+    
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    previous_wakeup = signal.set_wakeup_fd(wake_w)
+    selector = selectors.DefaultSelector()
+    for p0f in capture.processes:
+        selector.register(p0f.stderr_fileno(), selectors.EVENT_READ, p0f)
+    watch = capture.watch
+    if watch.fileno() is not None:
+        selector.register(watch.fileno(), selectors.EVENT_READ, watch)
+    selector.register(wake_r, selectors.EVENT_READ)
+    running = set(capture.processes)
+    pending = set(running)        # logs that may hold unread lines
+    capture.rates()
+    
+    def ingest(lines):
+        events = ingest_lines(lines, engine, scope, instruments)
+        if latency is not None:
+            latency.observe(events)
+        if instruments is not None:
+            instruments.reader_lag(capture.backlog())
     
     try:
-        with open(logfile, 'r') as f:
-            f.seek(0, 2)  # Go to end of file
+        while not shutdown_flag:
+            timeout = max(next_update - time.time(), 0)
+            if pending:
+                timeout = 0
+            elif watch.fileno() is None:
+                timeout = min(timeout, LOG_POLL_INTERVAL)
+            for key, _ in selector.select(timeout):
+                if key.fd == wake_r:
+                    os.read(wake_r, 512)
+                elif key.data is watch:
+                    pending |= watch.changed()
+                elif not key.data.read_stderr():
+                    # p0f closed stderr, so it exited: take what it logged last
+                    p0f = key.data
+                    selector.unregister(key.fd)
+                    running.discard(p0f)
+                    pending.discard(p0f)
+                    p0f.running(1)
+                    ingest(p0f.drain())
+                    if not running:
+                        print(f"{Colors.YELLOW}[!] p0f exited ({p0f.reason()}), stopping capture{Colors.RESET}")
+                        return
+                    print(f"{Colors.YELLOW}[!] p0f on {p0f.interface} exited (pid {p0f.pid}: {p0f.reason()}), "
+                          f"{len(running)} interface(s) still capturing{Colors.RESET}")
+            if watch.fileno() is None:
+                pending |= running
             
-            while not shutdown_flag:
-                line = f.readline()
-                if line:
-                    if line.startswith('[') and ']' in line and '|' in line:
-                        update_live_stats(line)
-                        
-                        # In verbose mode, show packet details
-                        if verbose_mode:
-                            highlighted = highlight_line(line.strip())
-                            if highlighted:
-                                print(highlighted)
-                            else:
-                                print(line.strip())
-                        
-                        # Show intelligence update periodically
-                        if time.time() - last_update_time > show_stats_interval:
-                            update_count += 1
-                            if not verbose_mode or update_count % 3 == 0:  # Show summary even in verbose every 3rd time
-                                print_live_intelligence_update(update_count)
-                            last_update_time = time.time()
-                else:
-                    time.sleep(0.1)
-    except FileNotFoundError:
-        print(f"{Colors.YELLOW}[!] Waiting for p0f to create log file...{Colors.RESET}")
-        time.sleep(2)
-    except Exception as e:
-        print(f"{Colors.RED}[!] Error reading log: {e}{Colors.RESET}")
+            for p0f in list(pending):
+                lines = p0f.read()
+                if p0f.backlog() <= len(p0f.partial):
+                    pending.discard(p0f)
+                if lines:
+                    ingest(lines)
+            
+            if deltas is not None and deltas.due():
+                deltas.write()
+            
+            # Show intelligence update periodically
+            if time.time() >= next_update:
+                next_update = time.time() + show_stats_interval
+                if not live_stats['total_packets']:
+                    continue
+                update_count += 1
+                if engine is not None:
+                    engine.flush()
+                if capture.tee is not None:
+                    capture.tee.flush()
+                if not verbose_mode or update_count % 3 == 0:  # Show summary even in verbose every 3rd time
+                    # Render from a snapshot in the background so ingest keeps draining p0f
+                    if renderer is not None and renderer.is_alive():
+                        continue
+                    renderer = threading.Thread(
+                        target=render,
+                        args=(update_count, take_snapshot(),
+                              dict(engine.counts) if engine else None,
+                              latency.summary() if latency else None,
+                              capture.rates()),
+                        daemon=True)
+                    renderer.start()
+    finally:
+        if renderer is not None:
+            renderer.join()
+        signal.set_wakeup_fd(previous_wakeup)
+        selector.close()
+        os.close(wake_r)
+        os.close(wake_w)
 
 def list_interfaces():
     """List available network interfaces using p0f"""
@@ -703,82 +3162,917 @@ def list_interfaces():
     print(result.stdout)
     sys.exit(0)
 
-def start_p0f_live(interface, promiscuous=False):
-    """Start p0f in live capture mode as a background process"""
-    promisc_flag = "-p" if promiscuous else ""
-    cmd = f"p0f -i {interface} {promisc_flag} -o full.log -d"
-    
-    print(f"{Colors.GREEN}[+] Starting live capture on {interface}...{Colors.RESET}")
-    subprocess.run(cmd, shell=True, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-    
-    time.sleep(2)
-    
-    check = subprocess.run("pgrep -f 'p0f.*-i'", shell=True, capture_output=True)
-    if check.returncode != 0:
-        print(f"{Colors.RED}[!] Failed to start p0f{Colors.RESET}")
+def start_p0f_live(interfaces, promiscuous=False, tee="full.log", rotate_bytes=None, rotate_seconds=None, bpf=None):
+    """Start one managed p0f child per interface in live capture mode, capturing only `bpf` traffic"""
+    print(f"{Colors.GREEN}[+] Starting live capture on {', '.join(interfaces)}...{Colors.RESET}")
+    capture = LiveCapture(interfaces, promiscuous, tee, rotate_bytes, rotate_seconds, bpf)
+    failed = capture.start()
+    if failed:
+        capture.stop()
+        capture.close()
+        for p0f in failed:
+            print(f"{Colors.RED}[!] Failed to start p0f on {p0f.interface}: {p0f.reason()}{Colors.RESET}")
         sys.exit(1)
     
-    print(f"{Colors.GREEN}[+] p0f is now capturing traffic{Colors.RESET}")
-    return True
+    for p0f in capture.processes:
+        print(f"{Colors.GREEN}[+] p0f is now capturing traffic on {p0f.interface} (pid {p0f.pid}){Colors.RESET}")
+    return capture
+
+# ------------------------------------------------------------------
+# Live query endpoint
+# ------------------------------------------------------------------
+# --http PORT serves the live state on 127.0.0.1 from snapshots, so a
+# poll costs the ingest path at most one take_snapshot() per second no
+# matter how many requests arrive.
+HOST_FLAGS = {
+    'eol': lambda profile: profile.flags & PROFILE_EOL,
+    'server': lambda profile: profile.flags & PROFILE_SERVER,
+    'nat': lambda profile: profile.flags & PROFILE_NAT,
+    'scanner': lambda profile: profile.scanners,
+    'suspicious': lambda profile: profile.suspicious,
+    'services': lambda profile: profile.service_bits or profile.rare_ports,
+}
+
+def resident_memory():
+    """Resident set size of this process in bytes (peak RSS where /proc is missing)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def host_filter(params):
+    """Predicate over HostProfile for /hosts query parameters.
+
+    os=TEXT (case-insensitive substring), port=N, flag=eol|server|nat|
+    scanner|suspicious|services (repeatable, all must hold), min_dist=N
+    and max_dist=N. Raises ValueError on a bad value.
+    """
+    tests = []
+    if 'os' in params:
+        needle = params['os'][0].lower()
+        os_ids = {index for index, name in enumerate(OS_TABLE) if name and needle in name.lower()}
+        tests.append(lambda profile: profile.os_id in os_ids)
+    if 'port' in params:
+        port = int(params['port'][0])
+        bit = _SERVICE_BITS.get(port)
+        if bit is not None:
+            tests.append(lambda profile: profile.service_bits & bit)
+        else:
+            tests.append(lambda profile: profile.rare_ports and port in profile.rare_ports)
+    for flag in params.get('flag', ()):
+        if flag not in HOST_FLAGS:
+            raise ValueError(f"unknown flag {flag!r} (one of {', '.join(HOST_FLAGS)})")
+        tests.append(HOST_FLAGS[flag])
+    if 'min_dist' in params:
+        low = int(params['min_dist'][0])
+        tests.append(lambda profile: profile.distance is not None and profile.distance >= low)
+    if 'max_dist' in params:
+        high = int(params['max_dist'][0])
+        tests.append(lambda profile: profile.distance is not None and profile.distance <= high)
+    return lambda profile: all(test(profile) for test in tests)
+
+class LiveQueryServer:
+    """Loopback HTTP server for a running capture (--http PORT).
+
+    GET /metrics              Prometheus text: live_stats counters, hosts, ingest rate, memory
+    GET /hosts                ?cidr=&os=&port=&flag=&min_dist=&max_dist=&offset=&limit= (JSON page)
+    GET /hosts/<ip>           one host profile
+    GET /categories           rule category entry counts
+
+    Requests are answered from a snapshot at most `max_age` seconds old;
+    filtered host lists are cached per snapshot, so pages of the same
+    query only filter once. cidr= (a network or address) narrows the
+    hosts through the subnet index and lists them in IP order.
+    """
+    PAGE = 100
+    MAX_PAGE = 1000
+
+    def __init__(self, port, engine=None, latency=None, capture=None, max_age=1.0, instruments=None):
+        self.engine = engine
+        self.latency = latency
+        self.capture = capture
+        self.instruments = instruments
+        self.max_age = max_age
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate = 0.0
+        self.previous = None
+        self.results = {}
+        self.results_epoch = None
 
-def stop_p0f():
-    """Stop background p0f process"""
-    subprocess.run("pkill -f 'p0f.*-i'", shell=True, stderr=subprocess.DEVNULL)
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True    # headers and body go out as separate writes
+
+            def do_GET(self):
+                server.requests += 1
+                status, content_type, body = server.handle(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def snapshot(self):
+        """Latest snapshot, taking a new one only when it is older than max_age"""
+        snapshot = _last_snapshot
+        if snapshot is not None and time.time() - snapshot.taken <= self.max_age:
+            return snapshot
+        with self.lock:
+            snapshot = _last_snapshot
+            if snapshot is None or time.time() - snapshot.taken > self.max_age:
+                snapshot = take_snapshot()
+            previous = self.previous
+            if previous is None or snapshot.taken - previous.taken >= 1.0:
+                if previous is not None:
+                    self.rate = ((snapshot.stats['total_packets'] - previous.stats['total_packets'])
+                                 / (snapshot.taken - previous.taken))
+                self.previous = snapshot
+        return snapshot
+
+    def handle(self, path):
+        """(status, content type, body bytes) for a GET path"""
+        url = urllib.parse.urlsplit(path)
+        params = urllib.parse.parse_qs(url.query)
+        route = url.path.rstrip('/')
+        try:
+            if route == '/metrics':
+                return 200, 'text/plain; version=0.0.4', self.metrics().encode()
+            if route == '/hosts':
+                return self.json(200, self.hosts(params))
+            if route.startswith('/hosts/'):
+                ip = urllib.parse.unquote(route[len('/hosts/'):])
+                profile = self.snapshot().hosts.get(pack_ip(ip))
+                if profile is None:
+                    return self.json(404, {'error': f"no resident profile for {ip}"})
+                record = {'ip': ip}
+                record.update(host_record(profile))
+                return self.json(200, record)
+            if route == '/categories':
+                counts = dict(self.engine.counts) if self.engine is not None else {}
+                return self.json(200, {'lines': self.engine.lines if self.engine is not None else 0,
+                                       'categories': counts})
+            return self.json(404, {'error': 'not found',
+                                   'endpoints': ['/metrics', '/hosts', '/hosts/<ip>', '/categories']})
+        except ValueError as e:
+            return self.json(400, {'error': str(e)})
+
+    @staticmethod
+    def json(status, document):
+        return status, 'application/json', json.dumps(document).encode()
+
+    def hosts(self, params):
+        snapshot = self.snapshot()
+        offset = int(params.get('offset', ['0'])[0])
+        limit = min(int(params.get('limit', [str(self.PAGE)])[0]), self.MAX_PAGE)
+        if offset < 0 or limit < 0:
+            raise ValueError("offset and limit must not be negative")
+        query = tuple(sorted((name, tuple(values)) for name, values in params.items()
+                             if name not in ('offset', 'limit')))
+        with self.lock:
+            if self.results_epoch != snapshot.epoch:
+                self.results = {}
+                self.results_epoch = snapshot.epoch
+            keys = self.results.get(query)
+        if keys is None:
+            hosts = snapshot.hosts
+            keys = network_hosts(snapshot, params['cidr'][0]) if 'cidr' in params else list(hosts)
+            if query:
+                matches = host_filter(params)
+                keys = [key for key in keys if matches(hosts[key])]
+            with self.lock:
+                if self.results_epoch == snapshot.epoch and len(self.results) < 64:
+                    self.results[query] = keys
+        page = []
+        for key in keys[offset:offset + limit]:
+            record = {'ip': format_ip(key)}
+            record.update(host_record(snapshot.hosts[key]))
+            page.append(record)
+        return {'epoch': snapshot.epoch, 'total': len(keys), 'offset': offset, 'limit': limit, 'hosts': page}
+
+    def metrics(self):
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append(f"# HELP p0f_miner_{name} {description}")
+            lines.append(f"# TYPE p0f_miner_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"p0f_miner_{name}{labels} {value}")
+
+        metric('stat', 'gauge', 'live_stats counters',
+               [(f'{{name="{name}"}}', value) for name, value in sorted(snapshot.stats.items())])
+        metric('hosts', 'gauge', 'Host profiles in memory', [('', len(snapshot.hosts))])
+        if snapshot.spill:
+            metric('hosts_spilled_total', 'counter', 'Host profiles evicted to the spill file',
+                   [('', snapshot.spill[1])])
+        metric('ingest_events_per_second', 'gauge', 'p0f events profiled per second (over the last second or more)',
+               [('', f"{self.rate:.2f}")])
+        metric('resident_memory_bytes', 'gauge', 'Resident set size of p0f-miner', [('', resident_memory())])
+        metric('snapshot_age_seconds', 'gauge', 'Age of the snapshot these values come from',
+               [('', f"{time.time() - snapshot.taken:.3f}")])
+        metric('uptime_seconds', 'gauge', 'Seconds since the endpoint started', [('', f"{time.time() - self.started:.0f}")])
+        metric('http_requests_total', 'counter', 'Requests served by this endpoint', [('', self.requests)])
+        if self.engine is not None:
+            metric('category_entries', 'gauge', 'Entries per rule category file',
+                   [(f'{{file="{output}"}}', count) for output, count in sorted(self.engine.counts.items())])
+        if self.capture is not None:
+            metric('interface_lines_total', 'counter', 'p0f lines read per capture interface',
+                   [(f'{{interface="{p0f.interface}"}}', p0f.lines) for p0f in self.capture.processes])
+        if self.latency is not None and self.latency.events:
+            metric('latency_seconds_avg', 'gauge', 'Average delay from p0f event to processing (+-0.5s)',
+                   [('', f"{self.latency.total / self.latency.events:.3f}")])
+        instruments = self.instruments
+        if instruments is not None:
+            metric('stage_seconds_total', 'counter', 'Time spent per ingest stage (--instrument)',
+                   [(f'{{stage="{name}"}}', f"{seconds:.4f}") for name, seconds in instruments.stages.items()])
+            metric('stats_lock_wait_seconds_total', 'counter', 'Time spent waiting for stats_lock',
+                   [('', f"{instruments.lock_wait:.4f}")])
+            metric('reader_lag_bytes', 'gauge', 'Bytes written by p0f and not yet read', [('', instruments.lag)])
+        return '\n'.join(lines) + '\n'
+
+# ------------------------------------------------------------------
+# Category rule engine
+# ------------------------------------------------------------------
+# The ONELINERS above stay the source of truth, but the grep/awk/sort
+# subset they use is compiled into native rules so that full.log is read
+# once for all categories instead of once per pipeline.
+SOURCE_FILTER = r'^\[.+\]'
+_AWK_PRINT_RE = re.compile(r'^\{\{print (\$\d+(?:,\$\d+)*)\}\}$')
+_AWK_STRIP_RE = re.compile(r'^\{\{ip=\$(\d+); sub\(/(.+)/,"",ip\); print ip\}\}$')
+_AWK_LOOP_RE = re.compile(r'^\{\{for\(i=1;i<=NF;i\+\+\)if\(\$i~/(.+)/\)print \$(\d+),\$i\}\}$')
+_GREP_FLAGS_RE = re.compile(r'^-[vEF]+$')
+
+# Address tests grep cannot express (CIDR membership, IPv6): per category,
+# (endpoint, PrefixTrie) pairs that must all match once the text filters
+# of its ONELINERS pipeline have. Endpoints are 'cli', 'srv' or 'subj'.
+private_networks = PrefixTrie(PRIVATE_NETWORKS)
+NETWORK_RULES = {
+    "internal-only": (('cli', private_networks), ('srv', private_networks)),
+    "same-subnet":   (('subj', private_networks),),
+}
+
+def is_event_line(line):
+    """True for p0f event lines ('[timestamp] mod=...|...')"""
+    return line.startswith('[') and '|' in line
+
+class CategoryRule:
+    """A ONELINERS pipeline compiled to native filters and projection"""
+    __slots__ = ('name', 'output', 'filters', 'projection', 'unique', 'networks', 'gate')
+
+    def __init__(self, name, output, filters, projection=None, unique=False, networks=()):
+        self.name = name
+        self.output = output
+        self.filters = filters          # [(negate, fixed_strings, regex)]
+        self.projection = projection    # fields -> list of output strings
+        self.unique = unique            # trailing `sort -u`
+        self.networks = networks        # NETWORK_RULES entry, checked on the parsed event
+
+        # Gate on the most selective positive filter: one of its literals
+        # must be present for the rule to match at all
+        gates = [fixed if fixed is not None else _regex_prefixes(regex.pattern)
+                 for negate, fixed, regex in filters if not negate]
+        gates = [gate for gate in gates if gate and min(map(len, gate)) >= 3]
+        self.gate = max(gates, key=lambda gate: min(map(len, gate)), default=None)
+
+    def literals(self):
+        literals = [literal for _, fixed, _ in self.filters if fixed for literal in fixed]
+        return literals + list(self.gate or ())
+
+    def matches(self, text, found):
+        """Apply all filters; `found` holds the literals present in text"""
+        for negate, fixed, regex in self.filters:
+            if fixed is not None:
+                hit = not found.isdisjoint(fixed)
+            else:
+                hit = regex.search(text) is not None
+            if hit == negate:
+                return False
+        return True
+
+    def on_networks(self, event):
+        """Whether the event's endpoints fall in this rule's networks"""
+        for endpoint, networks in self.networks:
+            ip = event.cli_ip if endpoint == 'cli' else event.srv_ip if endpoint == 'srv' else event.subject_ip
+            if not ip or networks.match(ip) is None:
+                return False
+        return True
+
+class LiteralMatcher:
+    """Report which of many literal strings occur in a line in one scan.
+
+    The literals are folded into a trie-shaped regex inside a lookahead,
+    so every start position is tried once and overlapping occurrences are
+    not lost; shorter literals that prefix the longest hit at a position
+    are added from a precomputed table.
+    """
+
+    def __init__(self, literals):
+        self.literals = frozenset(literals)
+        trie = {}
+        for literal in self.literals:
+            node = trie
+            for ch in literal:
+                node = node.setdefault(ch, {})
+            node[''] = True
+        body = self._build(trie) if trie else '(?!)'
+        self.regex = re.compile(f'(?=({body}))')
+        self.prefixes = {literal: tuple(p for p in self.literals if literal.startswith(p))
+                         for literal in self.literals}
+
+    @classmethod
+    def _build(cls, node):
+        branches = [re.escape(ch) + cls._build(node[ch]) for ch in sorted(k for k in node if k)]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    def find(self, text):
+        found = set()
+        for hit in self.regex.findall(text):
+            found.update(self.prefixes[hit])
+        return found
+
+class HighValueMatcher:
+    """All HIGH_VALUE_PATTERNS evaluated with one literal scan per line.
+
+    `[:/]NNNN\\b` rules become a port lookup table fed by a single port
+    regex, pure literal alternations are answered by the literal scan
+    alone, and the remaining patterns are confirmed with their own regex
+    only when one of their literal prefixes is present. Tags come back in
+    HIGH_VALUE_PATTERNS order, exactly as sequential re.search() would.
+    """
+    PORT_RULE = re.compile(r'^\[:/\](\d+)\\b$')
+    PORT_SCAN = re.compile(r'[:/](\d+)\b')
+
+    def __init__(self, patterns):
+        self.tags_by_index = [(tag, color) for _, tag, color in patterns]
+        self.ports = defaultdict(list)       # port string -> [index]
+        self.literals = defaultdict(list)    # literal -> [index]
+        self.confirm = {}                    # index -> compiled regex
+        self.ungated = []                    # indices without a usable prefix
+
+        for index, (pattern, _, _) in enumerate(patterns):
+            m = self.PORT_RULE.match(pattern)
+            if m:
+                self.ports[m.group(1)].append(index)
+                continue
+            literals = _literal_alternation(pattern)
+            if literals is None:
+                self.confirm[index] = re.compile(pattern)
+                literals = _regex_prefixes(pattern)
+            if literals:
+                for literal in literals:
+                    self.literals[literal].append(index)
+            else:
+                self.ungated.append(index)
+
+        self.matcher = LiteralMatcher(self.literals)
+
+    def candidates(self, line):
+        """Indices of the patterns whose literals or port occur in line, in order"""
+        hits = set(self.ungated)
+        for literal in self.matcher.find(line):
+            hits.update(self.literals[literal])
+        if self.ports:
+            for port in self.PORT_SCAN.findall(line):
+                hits.update(self.ports.get(port, ()))
+        return sorted(hits)
+
+    def tags(self, line):
+        tags = []
+        for index in self.candidates(line):
+            regex = self.confirm.get(index)
+            if regex is None or regex.search(line):
+                tags.append(self.tags_by_index[index])
+        return tags
+
+def _awk_field(fields, n):
+    return fields[n - 1] if 0 < n <= len(fields) else ''
+
+def _compile_awk(program):
+    """Translate the awk one-liner shapes used by ONELINERS, or None"""
+    m = _AWK_PRINT_RE.match(program)
+    if m:
+        cols = [int(c[1:]) for c in m.group(1).split(',')]
+        return lambda fields: [' '.join(_awk_field(fields, c) for c in cols)]
+    m = _AWK_STRIP_RE.match(program)
+    if m:
+        col, strip = int(m.group(1)), re.compile(m.group(2))
+        return lambda fields: [strip.sub('', _awk_field(fields, col), count=1)]
+    m = _AWK_LOOP_RE.match(program)
+    if m:
+        test, col = re.compile(m.group(1)), int(m.group(2))
+        return lambda fields: [f"{_awk_field(fields, col)} {f}" for f in fields if test.search(f)]
+    return None
+
+def _literal_alternation(pattern):
+    """Split an ERE like 'app=X|http=X|:22 ' into literals, or None.
+
+    Substring tests are far cheaper than regex alternations whose
+    branches share no prefix, and most ONELINERS filters are of this form.
+    """
+    literals = []
+    for branch in pattern.split('|'):
+        literal = re.sub(r'\\([.\[\]])', r'\1', branch)
+        if not branch or re.search(r'(?<!\\)[.\[\](){}*+?^$]', branch) or '\\' in literal:
+            return None
+        literals.append(literal)
+    return tuple(literals)
+
+def _regex_prefixes(pattern):
+    """Literal prefixes of every top-level branch of an ERE, or None.
+
+    A line can only match the pattern if it contains one of them, which
+    lets regex-only rules be skipped as cheaply as literal ones.
+    """
+    if '(' in pattern and '|' in pattern:
+        return None
+    prefixes = []
+    for branch in pattern.split('|'):
+        m = re.match(r'(?:[^\\.\[\](){}*+?^$|]|\\[.\[\]])+', branch)
+        if not m:
+            return None
+        prefix = re.sub(r'\\([.\[\]])', r'\1', m.group(0))
+        # A quantifier applies to the last character, which is then optional
+        if m.end() < len(branch) and branch[m.end()] in '*?{':
+            prefix = prefix[:-1]
+        if not prefix:
+            return None
+        prefixes.append(prefix)
+    return frozenset(prefixes)
+
+def _compile_grep(args):
+    """Translate grep flags + pattern into a (negate, fixed, regex) filter"""
+    flags = ''.join(a[1:] for a in args[:-1])
+    pattern = args[-1]
+    if 'F' in flags:
+        return ('v' in flags, frozenset([pattern]), None)
+    if 'E' not in flags:
+        # Basic regex: these characters are literals unless escaped
+        pattern = re.sub(r'([+?|(){}])', r'\\\1', pattern)
+    literals = _literal_alternation(pattern)
+    if literals is not None:
+        return ('v' in flags, frozenset(literals), None)
+    return ('v' in flags, None, re.compile(pattern))
+
+def compile_oneliner(name, cmd):
+    """Compile a ONELINERS pipeline into a CategoryRule.
+
+    Returns None when the pipeline uses anything outside the supported
+    grep/awk/sort subset; such rules are run through the shell instead.
+    """
+    try:
+        lexer = shlex.shlex(cmd, posix=True, punctuation_chars='|>')
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return None
+
+    filters, projection, unique, output = [], None, False, None
+    i = 0
+    while i < len(tokens):
+        prog = tokens[i]
+        i += 1
+        if prog == 'grep':
+            args = []
+            while i < len(tokens) and _GREP_FLAGS_RE.match(tokens[i]):
+                args.append(tokens[i])
+                i += 1
+            if i >= len(tokens) or projection is not None or unique:
+                return None
+            args.append(tokens[i])
+            i += 1
+            if i < len(tokens) and tokens[i] == 'full.log':
+                i += 1
+            negate, fixed, regex = _compile_grep(args)
+            # The source filter also matches the '[timestamp]' prefix of
+            # every event line; event selection is done by is_event_line()
+            if not (negate and regex is not None and regex.pattern == SOURCE_FILTER):
+                filters.append((negate, fixed, regex))
+        elif prog == 'awk':
+            if tokens[i:i + 2] != ['-F', '|'] or i + 2 >= len(tokens) or projection is not None:
+                return None
+            projection = _compile_awk(tokens[i + 2])
+            if projection is None:
+                return None
+            i += 3
+        elif prog == 'sort':
+            if i >= len(tokens) or tokens[i] != '-u':
+                return None
+            unique = True
+            i += 1
+        else:
+            return None
+
+        if i >= len(tokens):
+            break
+        if tokens[i] == '>' and i + 2 == len(tokens):
+            output = tokens[i + 1]
+            break
+        if tokens[i] != '|':
+            return None
+        i += 1
+
+    if output is None:
+        return None
+    return CategoryRule(name, output, filters, projection, unique, NETWORK_RULES.get(name, ()))
+
+def oneliner_output(cmd):
+    """Output file a ONELINERS pipeline writes to"""
+    return cmd.split(">")[-1].strip()
+
+class CategoryEngine:
+    """Evaluate every ONELINERS category against p0f event lines in one pass.
+
+    Plain categories are streamed to their files through buffered writers;
+    `sort -u` categories are deduplicated in memory and written sorted on
+    close(). close() returns the same {log_file: entries} counts that
+    counting the finished files would give. A state from checkpoint()
+    picks up where that engine left off instead of truncating the files.
+    Raw lines of hosts outside `scope` are skipped; events from
+    ingest_lines() arrive scoped already.
+    """
+
+    def __init__(self, oneliners=None, state=None, scope=None, instruments=None):
+        oneliners = ONELINERS if oneliners is None else oneliners
+        self.scope = scope
+        self.instruments = instruments
+        self.rules = []
+        self.shell_rules = {}
+        for name, cmd in oneliners.items():
+            rule = compile_oneliner(name, cmd)
+            if rule is None:
+                self.shell_rules[name] = cmd
+            else:
+                self.rules.append(rule)
+
+        self.matcher = LiteralMatcher(lit for rule in self.rules for lit in rule.literals())
+        self.ungated = [rule for rule in self.rules if rule.gate is None]
+        self.gated = defaultdict(list)
+        for rule in self.rules:
+            for literal in rule.gate or ():
+                self.gated[literal].append(rule)
+
+        self.counts = {rule.output: 0 for rule in self.rules}
+        self.unique = {rule.output: set() for rule in self.rules if rule.unique}
+        self.writers = {}
+        self.lines = 0
+        sizes = {}
+        if state is not None:
+            self.counts.update(state['counts'])
+            self.unique.update(state['unique'])
+            self.lines = state['lines']
+            sizes = state['sizes']
+        for rule in self.rules:
+            if not rule.unique and rule.output not in self.writers:
+                if rule.output in sizes:
+                    # Drop anything written after the checkpoint, then append
+                    writer = open(rule.output, 'a', buffering=1 << 16, errors='surrogateescape')
+                    writer.truncate(sizes[rule.output])
+                else:
+                    writer = open(rule.output, 'w', buffering=1 << 16, errors='surrogateescape')
+                self.writers[rule.output] = writer
+        if instruments is not None:
+            instruments.category_counts = self.counts
+
+    def feed(self, event):
+        """Evaluate one P0fEvent (or raw full.log line) against every category"""
+        if not isinstance(event, P0fEvent):
+            if not is_event_line(event) or is_unused_module(event):
+                return
+            text = event.rstrip('\n')
+            event = None
+            if self.scope is not None:
+                # Events from ingest_lines() were scoped already
+                event = parse_event(text)
+                if event is None or not self.scope.allows(event):
+                    return
+        else:
+            text = event.text
+        self.lines += 1
+        found = self.matcher.find(text)
+        candidates = {rule for literal in found for rule in self.gated.get(literal, ())}
+        candidates.update(self.ungated)
+        fields = None
+        for rule in candidates:
+            if not rule.matches(text, found):
+                continue
+            if rule.networks:
+                if event is None:
+                    event = parse_event(text)
+                if event is None or not rule.on_networks(event):
+                    continue
+            if rule.projection is None:
+                out = [text]
+            else:
+                if fields is None:
+                    fields = text.split('|')
+                out = rule.projection(fields)
+
+            if rule.unique:
+                entries = self.unique[rule.output]
+                for entry in out:
+                    if entry not in entries:
+                        entries.add(entry)
+                        if entry.strip():
+                            self.counts[rule.output] += 1
+            else:
+                writer = self.writers[rule.output]
+                for entry in out:
+                    writer.write(entry + '\n')
+                    if entry.strip():
+                        self.counts[rule.output] += 1
+        if self.instruments is not None and not self.lines % Instrumentation.SAMPLE:
+            self.instruments.sample_categories(self, text, candidates)
+
+    def flush(self):
+        """Push buffered category lines to disk (sort -u files are written on close)"""
+        for writer in self.writers.values():
+            writer.flush()
+
+    def checkpoint(self):
+        """Picklable state for resuming this engine (flushes the category files)"""
+        self.flush()
+        return {
+            'lines': self.lines,
+            'counts': dict(self.counts),
+            'unique': self.unique,
+            'sizes': {output: writer.tell() for output, writer in self.writers.items()},
+        }
+
+    def close(self):
+        """Flush all category files and return the counts dict"""
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+        for output, entries in self.unique.items():
+            with open(output, 'w', errors='surrogateescape') as f:
+                for entry in collated(entries):
+                    f.write(entry + '\n')
+
+        for name, cmd in self.shell_rules.items():
+            self.counts[oneliner_output(cmd)] = run_oneliner(name, cmd, oneliner_output(cmd))
+        return dict(self.counts)
+
+def _collation_key(entry):
+    try:
+        return locale.strxfrm(entry)
+    except ValueError:
+        # embedded NUL: strcoll can't see past it either
+        return entry
+
+def use_collation_locale():
+    """Take LC_COLLATE from LC_ALL / LC_COLLATE / LANG, as sort(1) does.
+
+    setlocale() is process-wide: call this at startup, before any
+    threads, rather than around each sort.
+    """
+    try:
+        locale.setlocale(locale.LC_COLLATE, '')
+    except locale.Error:
+        # unknown locale in the environment; sort(1) falls back to C too
+        locale.setlocale(locale.LC_COLLATE, 'C')
+
+def collated(entries):
+    """entries sorted the way `sort -u` orders them, under the use_collation_locale() collation"""
+    return sorted(entries, key=_collation_key)
 
 def run_oneliner(name, cmd, log_file):
     """Process full.log with grep/awk pipeline"""
     subprocess.run(cmd, shell=True, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
     return count_lines(log_file)
 
-def process_intelligence(quiet=False):
-    """Process all detection rules and return counts"""
-    counts = {}
-    
+def process_intelligence(quiet=False, logfile="full.log"):
+    """Process all detection rules in a single pass and return counts"""
     if not quiet:
         print(f"\n{Colors.CYAN}[+] Processing {len(ONELINERS)} detection rules...{Colors.RESET}")
     
-    for name, cmd in ONELINERS.items():
-        log = cmd.split(">")[-1].strip()
-        counts[log] = run_oneliner(name, cmd, log)
+    engine = CategoryEngine()
+    for line in read_log_lines(logfile):
+        engine.feed(line)
     
-    return counts
+    return engine.close()
 
-def save_json_report():
-    """Save IP profiles to JSON for programmatic access"""
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    json_file = f"p0f_profiles_{timestamp}.json"
-    
-    # Convert IP profiles to JSON-serializable format
-    export_data = {
-        'timestamp': timestamp,
-        'stats': dict(live_stats),
-        'hosts': {}
+def host_record(profile):
+    """JSON-serialisable export fields for one host profile"""
+    return {
+        'os': profile['os'],
+        'os_detail': profile['os_detail'],
+        'distance': profile['distance'],
+        'services': list(profile['services']),
+        'scanners': list(profile['scanners']),
+        'suspicious': list(profile['suspicious']),
+        'nat': profile['nat'],
+        'uptime': profile['uptime'],
+        'link': profile['link'],
+        'is_server': profile['is_server'],
+        'is_eol': profile['is_eol']
     }
-    
-    for ip, profile in ip_profiles.items():
-        export_data['hosts'][ip] = {
-            'os': profile['os'],
-            'os_detail': profile['os_detail'],
-            'distance': profile['distance'],
-            'services': list(profile['services']),
-            'scanners': list(profile['scanners']),
-            'suspicious': list(profile['suspicious']),
-            'nat': profile['nat'],
-            'uptime': profile['uptime'],
-            'link': profile['link'],
-            'is_server': profile['is_server'],
-            'is_eol': profile['is_eol']
-        }
+
+def write_ndjson_hosts(f, items):
+    """One {"ip": ..., <host_record>} line per (ip, profile); returns the count"""
+    count = 0
+    for ip, profile in items:
+        record = {'ip': ip}
+        record.update(host_record(profile))
+        f.write(json.dumps(record) + '\n')
+        count += 1
+    return count
+
+def save_json_report(snapshot=None, instruments=None):
+    """Save IP profiles to JSON (or NDJSON) for programmatic access.
+
+    Hosts are serialised one at a time straight to the file, so the
+    export never holds a second copy of the profiles. The JSON layout is
+    byte-for-byte what json.dump(indent=2) gives for the whole document.
+    """
+    snapshot = snapshot or report_snapshot()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
     try:
-        with open(json_file, 'w') as f:
-            json.dump(export_data, f, indent=2)
+        if export_format == 'ndjson':
+            json_file = f"p0f_profiles_{timestamp}.ndjson"
+            with open(json_file, 'w') as f:
+                write_ndjson_hosts(f, snapshot.items())
+        else:
+            json_file = f"p0f_profiles_{timestamp}.json"
+            with open(json_file, 'w') as f:
+                f.write('{\n  "timestamp": ' + json.dumps(timestamp))
+                stats = dict(snapshot.stats)
+                if instruments is not None:
+                    stats['instrumentation'] = instruments.summary()
+                f.write(',\n  "stats": ' + json.dumps(stats, indent=2).replace('\n', '\n  '))
+                f.write(',\n  "hosts": {')
+                separator = '\n    '
+                for ip, profile in snapshot.items():
+                    f.write(separator + json.dumps(ip) + ': '
+                            + json.dumps(host_record(profile), indent=2).replace('\n', '\n    '))
+                    separator = ',\n    '
+                f.write('\n  }\n}' if separator != '\n    ' else '}\n}')
         print(f"{Colors.GREEN}[+] JSON export saved to: {json_file}{Colors.RESET}")
     except Exception as e:
         print(f"{Colors.YELLOW}[!] Could not save JSON: {e}{Colors.RESET}")
 
-def print_final_statistics(counts, save_to_file=True):
+class DeltaExporter:
+    """Live mode: every `interval` seconds write the hosts changed since the
+    previous delta to <directory>/delta-NNNNNN.ndjson.
+
+    Files are renamed into place once complete, so a follower can pick up
+    each new file as soon as it appears. A host spilled from memory with
+    changes not yet written goes out in the state it was spilled in,
+    followed by its new record if it has come back since.
+    """
+
+    def __init__(self, directory="p0f_deltas", interval=60):
+        self.directory = directory
+        self.interval = interval
+        self.pending = set()      # keys changed since the last delta (filled by take_snapshot)
+        self.spilled = []         # (key, profile) evicted with changes not yet written
+        self.sequence = 0
+        self.hosts = 0
+        self.next_write = time.time() + interval
+        Path(directory).mkdir(parents=True, exist_ok=True)
+
+    def evicted(self, spilled, dirty):
+        self.spilled.extend(item for item in spilled if item[0] in dirty or item[0] in self.pending)
+
+    def due(self):
+        return time.time() >= self.next_write
+
+    def write(self, snapshot=None):
+        """Write one delta from a fresh snapshot; returns its path (None if nothing changed)"""
+        snapshot = snapshot or take_snapshot()
+        self.next_write = time.time() + self.interval
+        keys, self.pending = self.pending, set()
+        spilled, self.spilled = self.spilled, []
+        hosts = snapshot.hosts
+        changed = [(format_ip(key), profile) for key, profile in spilled]
+        changed.extend((format_ip(key), hosts[key]) for key in keys if key in hosts)
+        if not changed:
+            return None
+        self.sequence += 1
+        path = os.path.join(self.directory, f"delta-{self.sequence:06d}.ndjson")
+        with open(path + '.tmp', 'w') as f:
+            self.hosts += write_ndjson_hosts(f, changed)
+        os.replace(path + '.tmp', path)
+        return path
+
+REPORT_LIMITS = {'eol': 20, 'scanner': 10, 'server': 20, 'suspicious': 10, 'other': 15}
+SUBNET_REPORT_LIMIT = 10
+
+def report_groups(snapshot, columns=None):
+    """Final-report partitions: {group: (hosts, lowest keys)}, plus OS and service totals.
+
+    'other' is hosts with services that are not EOL, scanner or server.
+    With a HostColumns view every count and filter is an array operation;
+    without numpy the profiles are walked once.
+    """
+    if columns is not None:
+        eol = columns.flagged(PROFILE_EOL)
+        scanner = columns.flagged(ProfileColumns.SCANNER)
+        server = columns.flagged(PROFILE_SERVER)
+        service = columns.has_services()
+        masks = {
+            'eol': eol, 'scanner': scanner, 'server': server,
+            'suspicious': columns.flagged(ProfileColumns.SUSPICIOUS),
+            'other': service & ~(eol | scanner | server),
+        }
+        groups = {name: (int(np.count_nonzero(mask)), columns.lowest(mask, REPORT_LIMITS[name]))
+                  for name, mask in masks.items()}
+        groups['service'] = int(np.count_nonzero(service))
+        groups['windows'] = int(np.count_nonzero(columns.os_family('Windows')))
+        groups['linux'] = int(np.count_nonzero(columns.os_family('Linux')))
+        return groups
+
+    members = {name: [] for name in REPORT_LIMITS}
+    services = windows = linux = 0
+    for key, profile in snapshot.hosts.items():
+        flags = profile.flags
+        listed = False
+        if flags & PROFILE_EOL:
+            members['eol'].append(key)
+            listed = True
+        if profile.scanners:
+            members['scanner'].append(key)
+            listed = True
+        if flags & PROFILE_SERVER:
+            members['server'].append(key)
+            listed = True
+        if profile.suspicious:
+            members['suspicious'].append(key)
+        if profile.service_bits or profile.rare_ports:
+            services += 1
+            if not listed:
+                members['other'].append(key)
+        name = profile.os
+        if name:
+            if 'Windows' in name:
+                windows += 1
+            elif 'Linux' in name:
+                linux += 1
+    groups = {name: (len(keys), heapq.nsmallest(REPORT_LIMITS[name], keys, key=_ip_order))
+              for name, keys in members.items()}
+    groups['service'] = services
+    groups['windows'] = windows
+    groups['linux'] = linux
+    return groups
+
+def analytics_lines(columns, limit=10):
+    """Report lines for --analytics: distance histogram, OS family per /24, service pairs"""
+    lines = [f"\n📐 ANALYTICS"]
+    histogram = columns.distance_histogram()
+    if histogram.any():
+        lines.append(f"\n  Distance (hops):")
+        peak = int(histogram.max())
+        for hops, count in enumerate(histogram.tolist()):
+            if count:
+                lines.append(f"     {hops:>3}  {'█' * max(1, count * 40 // peak):<40} {count:>6}")
+
+    pivot = columns.os_by_subnet(limit)
+    if pivot:
+        lines.append(f"\n  Busiest /24s by OS family:")
+        for cidr, total, families in pivot:
+            mix = ', '.join(f"{name} {count}" for name, count in families)
+            lines.append(f"     {cidr:<18} {total:>6}  {mix}")
+
+    ports, matrix = columns.service_cooccurrence()
+    pairs = [(int(matrix[i, j]), i, j) for i in range(len(ports)) for j in range(i + 1, len(ports)) if matrix[i, j]]
+    if pairs:
+        lines.append(f"\n  Services seen together (hosts):")
+        for count, i, j in heapq.nlargest(limit, pairs):
+            pair = f"{service_label(ports[i])} + {service_label(ports[j])}"
+            lines.append(f"     {pair:<32} {count:>6}")
+    return lines
+
+def print_final_statistics(counts, save_to_file=True, instruments=None):
     """Print comprehensive final statistics report grouped by IP"""
+    snapshot = report_snapshot()
+    hosts = snapshot.hosts
+    stats = snapshot.stats
     output_lines = []
     
     def log(line=""):
@@ -791,78 +4085,83 @@ def print_final_statistics(counts, save_to_file=True):
     log(f"{'='*70}")
     
     # Traffic Statistics
-    total_hosts = len(ip_profiles)
-    windows_count = sum(1 for p in ip_profiles.values() if p['os'] and 'Windows' in p['os'])
-    linux_count = sum(1 for p in ip_profiles.values() if p['os'] and 'Linux' in p['os'])
+    total_hosts = len(hosts)
+    columns = host_columns(snapshot)
+    groups = report_groups(snapshot, columns)
+    windows_count = groups['windows']
+    linux_count = groups['linux']
     
     log(f"\nTRAFFIC SUMMARY:")
-    log(f"  Total Packets Processed:    {live_stats['total_packets']:>6}")
-    log(f"  OS Fingerprints:            {live_stats['total_os']:>6}")
+    log(f"  Total Packets Processed:    {stats['total_packets']:>6}")
+    log(f"  OS Fingerprints:            {stats['total_os']:>6}")
     log(f"  Unique Hosts Discovered:    {total_hosts:>6}")
     log(f"  Windows Hosts:              {windows_count:>6}")
     log(f"  Linux Hosts:                {linux_count:>6}")
+    if stats.get('native_fingerprints'):
+        log(f"  Native Fingerprints:        {stats['native_fingerprints']:>6}  "
+            f"(no p0f; OS labels tagged '{NATIVE_TAG.strip()}' are lower confidence)")
+    if stats.get('out_of_scope'):
+        log(f"  Out-of-Scope Lines Dropped: {stats['out_of_scope']:>6}")
+    if stats.get('unused_module_lines'):
+        log(f"  Unused p0f Module Lines:    {stats['unused_module_lines']:>6}")
+    dropped = stats.get('out_of_scope', 0) + stats.get('unused_module_lines', 0)
+    if dropped:
+        log(f"  Ingest Reduction:           {dropped / (dropped + stats['total_packets']):>6.1%} of p0f lines never profiled")
+    segments, stored, raw = log_footprint("full.log")
+    if segments > 1 and raw:
+        log(f"  Raw Log On Disk:    {stored / 2**20:>10.1f} MiB for {raw / 2**20:.1f} MiB of p0f output "
+            f"({1 - stored / raw:.0%} saved, {segments} segments)")
     
-    # Group IPs by category
-    eol_ips = []
-    scanner_ips = []
-    server_ips = []
-    suspicious_ips = []
-    service_ips = []
-    
-    for ip, profile in ip_profiles.items():
-        if profile['is_eol']:
-            eol_ips.append(ip)
-        if profile['scanners']:
-            scanner_ips.append(ip)
-        if profile['is_server']:
-            server_ips.append(ip)
-        if profile['suspicious']:
-            suspicious_ips.append(ip)
-        if profile['services']:
-            service_ips.append(ip)
+    # Group IPs by category: (count, lowest IPs) each
+    eol_count, eol_keys = groups['eol']
+    scanner_count, scanner_keys = groups['scanner']
+    server_count, server_keys = groups['server']
+    suspicious_count, suspicious_keys = groups['suspicious']
+    other_count, other_keys = groups['other']
+    service_count = groups['service']
     
     # CRITICAL: EOL SYSTEMS
-    if eol_ips:
-        log(f"\n🎯 CRITICAL: END-OF-LIFE SYSTEMS ({len(eol_ips)})")
-        for ip in sorted(eol_ips)[:20]:
-            profile = ip_profiles[ip]
-            log(f"\n  ▸ IP: {ip}")
+    if eol_count:
+        log(f"\n🎯 CRITICAL: END-OF-LIFE SYSTEMS ({eol_count})")
+        for key in eol_keys:
+            profile = hosts[key]
+            log(f"\n  ▸ IP: {format_ip(key)}")
             log(f"     OS: {profile['os']}")
             if profile['distance'] is not None:
                 log(f"     Distance: {profile['distance']} hops")
             if profile['services']:
                 log(f"     Services: {', '.join(sorted(profile['services']))}")
-        if len(eol_ips) > 20:
-            log(f"\n  ... and {len(eol_ips) - 20} more (see eol.log)")
+        if eol_count > REPORT_LIMITS['eol']:
+            log(f"\n  ... and {eol_count - REPORT_LIMITS['eol']} more (see eol.log)")
     
     # SCANNERS DETECTED
-    if scanner_ips:
-        log(f"\n🔍 SCANNER ACTIVITY ({len(scanner_ips)})")
-        for ip in sorted(scanner_ips)[:10]:
-            profile = ip_profiles[ip]
-            log(f"\n  ▸ IP: {ip}")
+    if scanner_count:
+        log(f"\n🔍 SCANNER ACTIVITY ({scanner_count})")
+        for key in scanner_keys:
+            profile = hosts[key]
+            log(f"\n  ▸ IP: {format_ip(key)}")
             log(f"     Scanner: {', '.join(sorted(profile['scanners']))}")
             if profile['os']:
                 log(f"     OS: {profile['os']}")
-        if len(scanner_ips) > 10:
-            log(f"\n  ... and {len(scanner_ips) - 10} more")
+        if scanner_count > REPORT_LIMITS['scanner']:
+            log(f"\n  ... and {scanner_count - REPORT_LIMITS['scanner']} more")
     
     # SUSPICIOUS ACTIVITY
-    if suspicious_ips:
-        log(f"\n⚠️  SUSPICIOUS HOSTS ({len(suspicious_ips)})")
-        for ip in sorted(suspicious_ips)[:10]:
-            profile = ip_profiles[ip]
-            log(f"\n  ▸ IP: {ip}")
+    if suspicious_count:
+        log(f"\n⚠️  SUSPICIOUS HOSTS ({suspicious_count})")
+        for key in suspicious_keys:
+            profile = hosts[key]
+            log(f"\n  ▸ IP: {format_ip(key)}")
             log(f"     Flags: {', '.join(sorted(profile['suspicious']))}")
             if profile['os']:
                 log(f"     OS: {profile['os']}")
     
     # SERVERS DISCOVERED
-    if server_ips:
-        log(f"\n💻 SERVERS ({len(server_ips)})")
-        for ip in sorted(server_ips)[:20]:
-            profile = ip_profiles[ip]
-            log(f"\n  ▸ IP: {ip}")
+    if server_count:
+        log(f"\n💻 SERVERS ({server_count})")
+        for key in server_keys:
+            profile = hosts[key]
+            log(f"\n  ▸ IP: {format_ip(key)}")
             log(f"     OS: {profile['os']}")
             if profile['distance'] is not None:
                 log(f"     Distance: {profile['distance']} hops")
@@ -870,29 +4169,48 @@ def print_final_statistics(counts, save_to_file=True):
                 log(f"     Services: {', '.join(sorted(profile['services']))}")
             if profile['nat']:
                 log(f"     NAT: Yes")
-        if len(server_ips) > 20:
-            log(f"\n  ... and {len(server_ips) - 20} more")
+        if server_count > REPORT_LIMITS['server']:
+            log(f"\n  ... and {server_count - REPORT_LIMITS['server']} more")
     
     # SERVICES DISCOVERED (hosts not already listed as servers)
-    non_server_service_ips = [ip for ip in service_ips if ip not in server_ips and ip not in eol_ips and ip not in scanner_ips]
-    if non_server_service_ips:
-        log(f"\n🔓 OTHER HOSTS WITH SERVICES ({len(non_server_service_ips)})")
-        for ip in sorted(non_server_service_ips)[:15]:
-            profile = ip_profiles[ip]
-            log(f"\n  ▸ IP: {ip}")
+    if other_count:
+        log(f"\n🔓 OTHER HOSTS WITH SERVICES ({other_count})")
+        for key in other_keys:
+            profile = hosts[key]
+            log(f"\n  ▸ IP: {format_ip(key)}")
             log(f"     Services: {', '.join(sorted(profile['services']))}")
             if profile['os']:
                 log(f"     OS: {profile['os']}")
-        if len(non_server_service_ips) > 15:
-            log(f"\n  ... and {len(non_server_service_ips) - 15} more")
+        if other_count > REPORT_LIMITS['other']:
+            log(f"\n  ... and {other_count - REPORT_LIMITS['other']} more")
+    
+    # SUBNETS: hosts, OS mix and services per network
+    subnets = subnet_summary(hosts, *subnet_prefixes)
+    if subnets:
+        prefix, prefix6 = subnet_prefixes
+        log(f"\n🌐 SUBNETS (IPv4 /{prefix}, IPv6 /{prefix6}): {len(subnets)} networks")
+        for cidr, count, families, ports in subnets[:SUBNET_REPORT_LIMIT]:
+            mix = sorted(families.items(), key=lambda item: (-item[1], item[0]))
+            log(f"\n  ▸ {cidr}: {count} host{'s' if count != 1 else ''}")
+            log(f"     OS: {', '.join(f'{name} {n}' for name, n in mix)}")
+            if ports:
+                busiest = sorted(ports.items(), key=lambda item: (-item[1], item[0]))[:8]
+                log(f"     Services: {', '.join(f'{service_label(port)} {n}' for port, n in busiest)}")
+        if len(subnets) > SUBNET_REPORT_LIMIT:
+            log(f"\n  ... and {len(subnets) - SUBNET_REPORT_LIMIT} more")
+    
+    # ANALYTICS (--analytics, vectorised over the columnar view)
+    if report_analytics and columns is not None and total_hosts:
+        for line in analytics_lines(columns):
+            log(line)
     
     log(f"\n{'='*70}")
     
     # Summary
     if total_hosts > 0:
         log(f"[✓] Analysis complete: {total_hosts} unique hosts profiled")
-        log(f"[i] Priority: {len(eol_ips)} EOL, {len(scanner_ips)} scanners, "
-              f"{len(server_ips)} servers, {len(service_ips)} with services")
+        log(f"[i] Priority: {eol_count} EOL, {scanner_count} scanners, "
+              f"{server_count} servers, {service_count} with services")
     else:
         log(f"[!] No hosts fingerprinted in captured traffic")
     
@@ -908,7 +4226,7 @@ def print_final_statistics(counts, save_to_file=True):
             print(f"\n{Colors.YELLOW}[!] Could not save report: {e}{Colors.RESET}")
         
         # Also save JSON export
-        save_json_report()
+        save_json_report(snapshot, instruments)
 
 def print_compact_summary(counts):
     """Print a compact summary of top findings"""
@@ -966,105 +4284,1147 @@ def print_compact_summary(counts):
     print(f"{Colors.BOLD}🎯 KEY FINDINGS{Colors.RESET}")
     print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
     
-    found_any = False
-    for label, log in important:
-        count = counts.get(log, 0)
-        if count > 0:
-            print(f"{Colors.GREEN}✓{Colors.RESET} {label:<35} : {Colors.BOLD}{count:>4}{Colors.RESET} entries")
-            found_any = True
+    found_any = False
+    for label, log in important:
+        count = counts.get(log, 0)
+        if count > 0:
+            print(f"{Colors.GREEN}✓{Colors.RESET} {label:<35} : {Colors.BOLD}{count:>4}{Colors.RESET} entries")
+            found_any = True
+    
+    if not found_any:
+        print(f"{Colors.YELLOW}No high-value targets detected{Colors.RESET}")
+    
+    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
+
+# ------------------------------------------------------------------
+# Offline checkpoints
+# ------------------------------------------------------------------
+# A checkpoint is <logfile>.ckpt: the byte offset reached, the rule engine
+# and profile state at that offset, and fingerprints of the pcap and of
+# the log (and any segments) as they were then. A rerun whose pcap and full.log still match
+# skips p0f and resumes at the offset; anything else starts over.
+CHECKPOINT_VERSION = 1
+_FINGERPRINT_BLOCK = 1 << 16
+_FINGERPRINT_SAMPLES = 16
+
+def file_fingerprint(path, length=None):
+    """(length, hash) of the first `length` bytes of a file without reading them all.
+
+    Hashes the first and last 64 KiB plus 4 KiB at evenly spaced offsets,
+    so replaced, truncated or rewritten files are caught in a few reads.
+    """
+    if length is None:
+        length = os.path.getsize(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(length, _FINGERPRINT_BLOCK)))
+        for sample in range(1, _FINGERPRINT_SAMPLES):
+            f.seek(length * sample // _FINGERPRINT_SAMPLES)
+            digest.update(f.read(min(4096, length - f.tell())))
+        f.seek(max(length - _FINGERPRINT_BLOCK, 0))
+        digest.update(f.read(min(length, _FINGERPRINT_BLOCK)))
+    return length, digest.hexdigest()
+
+def save_checkpoint(logfile, offset, engine, pcap_fingerprint):
+    """Atomically write the state needed to resume `logfile` at `offset`"""
+    path = logfile + '.ckpt'
+    with stats_lock:
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'pcap': pcap_fingerprint,
+            'log': [(path, file_fingerprint(path)) for path in log_segments(logfile)],
+            'offset': offset,
+            'engine': engine.checkpoint(),
+            'stats': dict(live_stats),
+            'hosts': ip_profiles.hosts,
+            'v6_text': _v6_text,
+        }
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+def load_checkpoint(logfile, pcap_fingerprint):
+    """The checkpoint for `logfile` if the pcap, log and category files still match it"""
+    try:
+        with open(logfile + '.ckpt', 'rb') as f:
+            state = pickle.load(f)
+        if state['version'] != CHECKPOINT_VERSION or state['pcap'] != pcap_fingerprint:
+            return None
+        segments = log_segments(logfile)
+        if segments[:len(state['log'])] != [path for path, _ in state['log']]:
+            return None
+        for path, (length, digest) in state['log']:
+            if os.path.getsize(path) < length or file_fingerprint(path, length) != (length, digest):
+                return None
+        for output, size in state['engine']['sizes'].items():
+            if os.path.getsize(output) < size:
+                return None
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError):
+        return None
+    return state
+
+def restore_checkpoint(state):
+    """Replace the profiles and stats with those saved in a checkpoint"""
+    reset_profiles()
+    with stats_lock:
+        _v6_text.update(state['v6_text'])
+        ip_profiles.hosts.update(state['hosts'])
+        ip_profiles.dirty.update(ip_profiles.hosts)
+        ip_profiles.added.extend(ip_profiles.hosts)
+        live_stats.update(state['stats'])
+
+# ------------------------------------------------------------------
+# Parallel offline analysis
+# ------------------------------------------------------------------
+RUNS_DIR = "p0f_runs"
+
+def expand_pcaps(patterns):
+    """Expand -r arguments (files or globs) into an ordered list of pcaps"""
+    pcaps = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"{Colors.YELLOW}[!] No pcaps match: {pattern}{Colors.RESET}")
+        for pcap in matches:
+            if not Path(pcap).is_file():
+                sys.exit(f"{Colors.RED}[!] pcap not found: {pcap}{Colors.RESET}")
+            key = os.path.realpath(pcap)
+            if key not in seen:
+                seen.add(key)
+                pcaps.append(pcap)
+    return pcaps
+
+def run_p0f_offline(pcap, logfile="full.log", bpf=None):
+    """Run p0f over a pcap to completion (only packets matching `bpf`); True if it produced a log"""
+    rule = f" {shlex.quote(bpf)}" if bpf else ""
+    result = subprocess.run(
+        f"p0f -r {shlex.quote(pcap)} -o {shlex.quote(logfile)}{rule}",
+        shell=True,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    return result.returncode == 0 and Path(logfile).exists()
+
+def build_profiles(logfile="full.log", checkpoint_every=0, resume=None, pcap_fingerprint=None, scope=None,
+                   instruments=None):
+    """Build IP profiles and category files from a p0f log in one pass.
+
+    With checkpoint_every (seconds) progress is saved to <logfile>.ckpt
+    as it goes; `resume` is a loaded checkpoint to carry on from. Hosts
+    outside `scope` (a NetworkScope) are left out of both. `instruments`
+    is the Instrumentation for --instrument, if any.
+    Returns (category counts, event lines).
+    """
+    if resume is not None:
+        offset = resume['offset']
+        engine = CategoryEngine(state=resume['engine'], scope=scope, instruments=instruments)
+    else:
+        offset = 0
+        engine = CategoryEngine(scope=scope, instruments=instruments)
+        if checkpoint_every:
+            # p0f is done: a crash from here on never needs to re-run it
+            save_checkpoint(logfile, 0, engine, pcap_fingerprint)
+    next_checkpoint = time.time() + checkpoint_every
+    
+    with LogStream(logfile) as f:
+        f.skip(offset)
+        while True:
+            lines = f.readlines(1 << 20)
+            if not lines:
+                break
+            offset += sum(map(len, lines))
+            ingest_lines([line.decode('utf-8', 'surrogateescape') for line in lines], engine, scope, instruments)
+            if checkpoint_every and time.time() >= next_checkpoint:
+                save_checkpoint(logfile, offset, engine, pcap_fingerprint)
+                next_checkpoint = time.time() + checkpoint_every
+    return engine.close(), engine.lines
+
+def profile_pcap(pcap, logfile="full.log", checkpoint_every=0, quiet=False, scope=None, bpf=None, native=False,
+                 instruments=None):
+    """run_p0f_offline() + build_profiles(), resuming from a matching checkpoint.
+
+    p0f only sees the packets matching `bpf`, hosts outside `scope` are
+    not profiled. With `native`, write_native_log() stands in for p0f.
+
+    Returns (counts, lines), or None if p0f failed.
+    """
+    fingerprint = state = None
+    if checkpoint_every:
+        fingerprint = file_fingerprint(pcap)
+        if bpf:
+            # A log written under another filter must not be resumed
+            fingerprint += (bpf,)
+        if native:
+            fingerprint += ('native',)
+        state = load_checkpoint(logfile, fingerprint)
+    if state is not None:
+        done = state['offset'] / max(log_footprint(logfile)[2], 1)
+        print(f"{Colors.GREEN}[+] Resuming {logfile} from checkpoint at byte {state['offset']} "
+              f"({done:.0%}), skipping p0f{Colors.RESET}")
+        restore_checkpoint(state)
+    elif native:
+        if not quiet:
+            print(f"{Colors.GREEN}[+] Fingerprinting SYN and SYN+ACK packets natively (no p0f)...{Colors.RESET}")
+        try:
+            _, lines = write_native_log(pcap, logfile)
+        except ValueError as e:
+            print(f"{Colors.RED}[!] {e}{Colors.RESET}")
+            return None
+        with stats_lock:
+            live_stats['native_fingerprints'] += lines
+    else:
+        if not quiet:
+            print(f"{Colors.GREEN}[+] Running p0f analysis...{Colors.RESET}")
+        if not run_p0f_offline(pcap, logfile, bpf):
+            return None
     
-    if not found_any:
-        print(f"{Colors.YELLOW}No high-value targets detected{Colors.RESET}")
+    if not quiet:
+        print(f"{Colors.CYAN}[+] Building IP profiles and processing {len(ONELINERS)} detection rules...{Colors.RESET}")
+    result = build_profiles(logfile, checkpoint_every, state, fingerprint, scope, instruments)
+    if checkpoint_every:
+        os.remove(logfile + '.ckpt')
+    return result
+
+def analyse_pcap(pcap, run_dir, verbose=False, checkpoint_every=0, scope=None, bpf=None, native=False):
+    """Process-pool worker: p0f + profile build for one pcap in its own directory"""
+    global verbose_mode
+    verbose_mode = verbose
+    # Spawned (not forked) pool processes start with the C collation
+    use_collation_locale()
+    # Pool processes are reused, so start every pcap from empty state;
+    # only the parent writes the profile database and deltas
+    ip_profiles.db = None
+    ip_profiles.trackers = []
+    reset_profiles()
+
+    pcap = os.path.abspath(pcap)
+    started = time.time()
+    Path(run_dir).mkdir(parents=True, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(run_dir)
+    try:
+        result = profile_pcap(pcap, checkpoint_every=checkpoint_every, quiet=True, scope=scope, bpf=bpf,
+                              native=native)
+        if result is None:
+            return {'pcap': pcap, 'dir': run_dir, 'ok': False}
+        counts, lines = result
+    finally:
+        os.chdir(cwd)
+
+    return {
+        'pcap': pcap,
+        'dir': run_dir,
+        'ok': True,
+        'counts': counts,
+        'lines': lines,
+        'seconds': time.time() - started,
+        'stats': dict(live_stats),
+        'profiles': dict(ip_profiles.items()),
+    }
+
+def merge_profiles(profiles, stats):
+    """Fold one worker's profiles and stats into the globals.
+
+    The result matches ingesting that worker's log after everything merged
+    so far: first OS/distance wins, flags and sets accumulate, and the
+    per-host counters only move when a host gains its first OS/distance.
+    """
+    with stats_lock:
+        for key in ('total_packets', 'nat_detected', 'suspicious_ua', 'scanners', 'out_of_scope',
+                    'unused_module_lines', 'native_fingerprints'):
+            if stats.get(key):
+                live_stats[key] += stats[key]
+
+        for ip, incoming in profiles.items():
+            profile = ip_profiles[ip]
+            gained_os, gained_distance = profile.absorb(incoming)
+            if gained_os:
+                os_name = profile.os
+                live_stats['total_os'] += 1
+                if 'Windows' in os_name:
+                    live_stats['windows'] += 1
+                    if profile.flags & PROFILE_EOL:
+                        live_stats['eol_systems'] += 1
+                elif 'Linux' in os_name:
+                    live_stats['linux'] += 1
+            if gained_distance and profile.distance <= 2:
+                live_stats['close_hosts'] += 1
+
+def merge_category_outputs(results):
+    """Combine per-pcap category files into the current directory.
+
+    Streamed categories are concatenated in pcap order; sort -u categories
+    are unioned and re-sorted. Returns the merged counts.
+    """
+    counts = {}
+    outputs = {}
+    for name, cmd in ONELINERS.items():
+        rule = compile_oneliner(name, cmd)
+        output = rule.output if rule else oneliner_output(cmd)
+        unique = rule.unique if rule else 'sort -u' in cmd
+        outputs[output] = outputs.get(output, False) or unique
+
+    for output, unique in outputs.items():
+        parts = [Path(result['dir'], output) for result in results]
+        if unique:
+            entries = set()
+            for part in parts:
+                if part.exists():
+                    with open(part, 'r', errors='surrogateescape') as f:
+                        entries.update(line.rstrip('\n') for line in f)
+            with open(output, 'w', errors='surrogateescape') as f:
+                for entry in collated(entries):
+                    f.write(entry + '\n')
+            counts[output] = sum(1 for entry in entries if entry.strip())
+        else:
+            with open(output, 'wb') as out:
+                for part in parts:
+                    if part.exists():
+                        with open(part, 'rb') as f:
+                            shutil.copyfileobj(f, out)
+            counts[output] = sum(result['counts'].get(output, 0) for result in results)
+    return counts
+
+SHARDS_DIR = "p0f_shards"
+SLIM_DIR = "p0f_slim"
+
+# Classic pcap magic -> (byte order, header struct)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': '<', b'\xa1\xb2\xc3\xd4': '>',  # microsecond
+    b'\x4d\x3c\xb2\xa1': '<', b'\xa1\xb2\x3c\x4d': '>',  # nanosecond
+}
+PCAPNG_MAGIC = b'\n\r\r\n'    # section header block type, the same in either byte order
+PCAPNG_ORDER = {b'\x4d\x3c\x2b\x1a': '<', b'\x1a\x2b\x3c\x4d': '>'}
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+_VLAN_TYPES = (0x8100, 0x88a8, 0x9100)
+
+class PcapReader:
+    """Memory-mapped reader for classic (libpcap) capture files.
+
+    Iterating yields (record start, data start, data end) offsets into
+    self.data, so packets can be copied out without decoding them;
+    copy() writes one out as a classic pcap record under self.header.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"empty capture: {path}")
+        self.view = memoryview(self.data)
+        self.skipped = 0
+        self._open()
+
+    def _open(self):
+        order = PCAP_MAGIC.get(self.data[:4])
+        if order is None:
+            self.close()
+            raise ValueError(f"not a pcap or pcapng file: {self.path}")
+        self.record = struct.Struct(order + 'IIII')
+        self.header = self.data[:24]
+        self.linktype = struct.unpack(order + 'I', self.data[20:24])[0] & 0x0fffffff
+
+    def __iter__(self):
+        data = self.data
+        size = len(data)
+        unpack = self.record.unpack_from
+        offset = 24
+        while offset + 16 <= size:
+            caplen = unpack(data, offset)[2]
+            start = offset + 16
+            end = start + caplen
+            if end > size:
+                break  # truncated final record
+            yield offset, start, end
+            offset = end
+
+    def chunks(self, size):
+        """Yield (record offsets, data starts, data ends, None) lists for up to `size` packets at a time.
+
+        The packet loop of __iter__ without a tuple per packet, for callers
+        that hand the offsets to numpy. The last item is there for
+        PcapngReader, whose timestamps can't be read back by offset.
+        """
+        data = self.data
+        total = len(data)
+        unpack = self.record.unpack_from
+        offset = 24
+        done = False
+        while not done:
+            records, starts, ends = [], [], []
+            for _ in range(size):
+                start = offset + 16
+                if start > total:
+                    done = True
+                    break
+                end = start + unpack(data, offset)[2]
+                if end > total:
+                    done = True
+                    break  # truncated final record
+                records.append(offset)
+                starts.append(start)
+                ends.append(end)
+                offset = end
+            if records:
+                yield records, starts, ends, None
+
+    def copy(self, out, record, start, end):
+        out.write(self.view[record:end])
+
+    def seconds(self, record):
+        """Capture time (whole seconds) of a record"""
+        return self.record.unpack_from(self.data, record)[0]
+
+    def close(self):
+        self.view.release()
+        self.data.close()
+        self.file.close()
+
+class PcapngReader(PcapReader):
+    """Memory-mapped reader for pcapng files, with the PcapReader interface.
+
+    Enhanced, simple and obsolete packet blocks are yielded as offsets of
+    their packet data; copy() writes a classic record header (timestamp
+    scaled from the interface's if_tsresol) before it. A classic pcap has
+    one link type, so packets of interfaces with another link type than
+    the first are counted in `skipped` instead.
+    """
+    def _open(self):
+        data = self.data
+        if data[:4] != PCAPNG_MAGIC or PCAPNG_ORDER.get(data[8:12]) is None:
+            self.close()
+            raise ValueError(f"not a pcap or pcapng file: {self.path}")
+        self.linktype = None
+        for _ in self._blocks():
+            if self.interfaces:
+                self.linktype = self.interfaces[0][0]
+                break
+        if self.linktype is None:
+            self.close()
+            raise ValueError(f"pcapng without an interface description: {self.path}")
+        self.header = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 262144, self.linktype)
+        self.record = struct.Struct('<IIII')
+        self.stamp = None
+
+    def _blocks(self):
+        """Yield (offset, type, length) of every block, tracking section byte order and interfaces"""
+        data = self.data
+        size = len(data)
+        offset = 0
+        while offset + 12 <= size:
+            if data[offset:offset + 4] == PCAPNG_MAGIC:
+                order = PCAPNG_ORDER.get(data[offset + 8:offset + 12])
+                if order is None:
+                    return
+                self.order = order
+                self.block = struct.Struct(order + 'II')
+                self.interfaces = []    # (link type, timestamp units per second, offset in seconds)
+            kind, length = self.block.unpack_from(data, offset)
+            if length < 12 or length % 4 or offset + length > size:
+                return  # truncated or corrupt
+            if kind == 1:
+                self.interfaces.append(self._interface(offset, length))
+            yield offset, kind, length
+            offset += length
+
+    def _interface(self, offset, length):
+        data = self.data
+        linktype = struct.unpack_from(self.order + 'H', data, offset + 8)[0]
+        units, shift = 10 ** 6, 0
+        option = offset + 16
+        end = offset + length - 4
+        while option + 4 <= end:
+            code, size = struct.unpack_from(self.order + 'HH', data, option)
+            if code == 0:
+                break
+            if code == 9 and size == 1:       # if_tsresol
+                resolution = data[option + 4]
+                units = 1 << (resolution & 0x7f) if resolution & 0x80 else 10 ** resolution
+            elif code == 14 and size == 8:    # if_tsoffset
+                shift = struct.unpack_from(self.order + 'q', data, option + 4)[0]
+            option += 4 + (size + 3) // 4 * 4
+        return linktype, units, shift
+
+    def __iter__(self):
+        data = self.data
+        order = None
+        for offset, kind, length in self._blocks():
+            if kind not in (2, 3, 6):
+                continue
+            if order != self.order:
+                order = self.order
+                enhanced = struct.Struct(order + 'IIIII')
+                obsolete = struct.Struct(order + 'HHIIII')
+                simple = struct.Struct(order + 'I')
+            if kind == 6:
+                interface, high, low, caplen, origlen = enhanced.unpack_from(data, offset + 8)
+                start = offset + 28
+            elif kind == 3:
+                interface, high, low = 0, 0, 0
+                origlen = simple.unpack_from(data, offset + 8)[0]
+                caplen = min(origlen, length - 16)
+                start = offset + 12
+            else:
+                interface, _, high, low, caplen, origlen = obsolete.unpack_from(data, offset + 8)
+                start = offset + 28
+            if interface >= len(self.interfaces) or start + caplen > offset + length:
+                continue
+            linktype, units, shift = self.interfaces[interface]
+            if linktype != self.linktype:
+                self.skipped += 1
+                continue
+            seconds, fraction = divmod((high << 32) | low, units)
+            self.stamp = (seconds + shift, fraction * 1000000 // units, caplen, origlen)
+            yield offset, start, start + caplen
+
+    def chunks(self, size):
+        """PcapReader.chunks(), with each packet's capture second as the last list"""
+        packets = iter(self)
+        while True:
+            records, starts, ends, seconds = [], [], [], []
+            for record, start, end in itertools.islice(packets, size):
+                records.append(record)
+                starts.append(start)
+                ends.append(end)
+                seconds.append(self.stamp[0])
+            if not records:
+                return
+            yield records, starts, ends, seconds
+
+    def copy(self, out, record, start, end):
+        """Write the packet just yielded as a classic pcap record"""
+        out.write(self.record.pack(*self.stamp))
+        out.write(self.view[start:end])
+
+    def seconds(self, record):
+        return self.stamp[0]
+
+def open_capture(path):
+    """PcapReader or PcapngReader for a capture file, by its magic number"""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return PcapngReader(path) if magic == PCAPNG_MAGIC else PcapReader(path)
+
+def _network_offset(data, offset, end, linktype):
+    """Offset of the IP header inside a packet, or None"""
+    if linktype == LINKTYPE_ETHERNET:
+        offset += 14
+        if offset > end:
+            return None
+        ethertype = (data[offset - 2] << 8) | data[offset - 1]
+        while ethertype in _VLAN_TYPES and offset + 4 <= end:
+            ethertype = (data[offset + 2] << 8) | data[offset + 3]
+            offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        offset += 16
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        offset += 4
+    elif linktype not in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return None
+    return offset if offset < end else None
+
+def flow_key(data, offset, end, linktype):
+    """Direction-independent 5-tuple of a packet as bytes (None if not IP).
+
+    Both directions of a flow give the same key, so a SYN and its SYN+ACK
+    (and the HTTP exchange that follows) always land in the same shard.
+    Fragments and non-TCP/UDP packets fall back to the address pair.
+    """
+    ip = _network_offset(data, offset, end, linktype)
+    if ip is None:
+        return None
+    version = data[ip] >> 4
+    if version == 4 and ip + 20 <= end:
+        proto = data[ip + 9]
+        src, dst = data[ip + 12:ip + 16], data[ip + 16:ip + 20]
+        transport = ip + (data[ip] & 0x0f) * 4
+        fragment = ((data[ip + 6] & 0x1f) << 8) | data[ip + 7]
+    elif version == 6 and ip + 40 <= end:
+        proto = data[ip + 6]
+        src, dst = data[ip + 8:ip + 24], data[ip + 24:ip + 40]
+        transport = ip + 40
+        fragment = 0
+    else:
+        return None
+
+    if proto in (6, 17) and not fragment and transport + 4 <= end:
+        src += data[transport:transport + 2]
+        dst += data[transport + 2:transport + 4]
+    if dst < src:
+        src, dst = dst, src
+    return bytes((proto,)) + src + dst
+
+def shard_pcap(pcap, shards, directory=SHARDS_DIR):
+    """Split a pcap into N shard pcaps by flow hash; returns the shard paths"""
+    started = time.time()
+    reader = open_capture(pcap)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    stem = Path(pcap).name
+    paths = [os.path.join(directory, f"{stem}.shard{index:02d}.pcap") for index in range(shards)]
+    writers = [open(path, 'wb', buffering=1 << 20) for path in paths]
+    counts = [0] * shards
+    unkeyed = 0
+    try:
+        for writer in writers:
+            writer.write(reader.header)
+        data = reader.data
+        linktype = reader.linktype
+        for record, start, end in reader:
+            key = flow_key(data, start, end, linktype)
+            if key is None:
+                shard = 0
+                unkeyed += 1
+            else:
+                shard = zlib.crc32(key) % shards
+            reader.copy(writers[shard], record, start, end)
+            counts[shard] += 1
+    finally:
+        for writer in writers:
+            writer.close()
+        reader.close()
+
+    total = sum(counts)
+    print(f"{Colors.CYAN}[+] Sharded {Path(pcap).name}: {total} packets into {shards} shards "
+          f"in {time.time() - started:.1f}s (largest {max(counts)}, non-IP {unkeyed}){Colors.RESET}")
+    return paths
+
+# What p0f fingerprints: SYN and SYN+ACK headers, and the start of HTTP
+# requests and responses on flows it saw open (it reads at most
+# MAX_FLOW_DATA = 8 KiB of a flow's payload)
+_TCP_FIN, _TCP_SYN, _TCP_RST, _TCP_ACK = 0x01, 0x02, 0x04, 0x10
+_HTTP_STARTS = (b'GET ', b'POST ', b'HEAD ', b'PUT ', b'DELETE ', b'OPTIONS ', b'PATCH ',
+                b'CONNECT ', b'TRACE ', b'HTTP/1.')
+HTTP_HEADER_LIMIT = 8192
+_SLIM_FLOW_LIMIT = 1 << 20      # directions awaiting HTTP headers; the oldest quarter goes past this
+
+def slim_pcap(pcap, directory=SLIM_DIR):
+    """Copy the packets p0f can fingerprint into a slim classic pcap; returns its path.
+
+    Kept: SYN and SYN+ACK segments, FIN/RST (so p0f retires flows as it
+    would on the full capture), and per direction of a flow seen from its
+    SYN, the data packets from an HTTP request or response line until the
+    blank line ending its headers (or HTTP_HEADER_LIMIT bytes). Headers
+    are read from the mapped file in place; kept packets are written
+    straight from it.
+    """
+    started = time.time()
+    reader = open_capture(pcap)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(directory, f"{Path(pcap).stem}.slim.pcap")
+    network_offset = _network_offset
+    flows = {}      # directional (addresses, ports) -> HTTP header bytes kept so far
+    total = written = syns = synacks = http = closes = 0
+    try:
+        with open(path, 'wb', buffering=1 << 20) as out:
+            out.write(reader.header)
+            data = reader.data
+            linktype = reader.linktype
+            copy = reader.copy
+            for record, start, end in reader:
+                total += 1
+                ip = network_offset(data, start, end, linktype)
+                if ip is None:
+                    continue
+                version = data[ip] >> 4
+                if version == 4:
+                    if data[ip + 9] != 6 or ip + 20 > end or (data[ip + 6] & 0x1f) or data[ip + 7]:
+                        continue
+                    tcp = ip + (data[ip] & 0x0f) * 4
+                    stop = min(end, ip + ((data[ip + 2] << 8) | data[ip + 3]))
+                    address, width = ip + 12, 4
+                elif version == 6:
+                    if ip + 40 > end or data[ip + 6] != 6:
+                        continue
+                    tcp = ip + 40
+                    stop = min(end, tcp + ((data[ip + 4] << 8) | data[ip + 5]))
+                    address, width = ip + 8, 16
+                else:
+                    continue
+                if tcp + 20 > stop:
+                    continue
+
+                flags = data[tcp + 13]
+                if flags & _TCP_SYN:
+                    if flags & _TCP_ACK:
+                        synacks += 1
+                    else:
+                        syns += 1
+                        if len(flows) >= _SLIM_FLOW_LIMIT:
+                            for key in list(itertools.islice(flows, _SLIM_FLOW_LIMIT // 4)):
+                                del flows[key]
+                        middle = address + width
+                        flows[data[address:middle + width] + data[tcp:tcp + 4]] = 0
+                        flows[data[middle:middle + width] + data[address:middle]
+                              + data[tcp + 2:tcp + 4] + data[tcp:tcp + 2]] = 0
+                    written += 1
+                    copy(out, record, start, end)
+                    continue
+
+                keep = False
+                payload = tcp + (data[tcp + 12] >> 4) * 4
+                if payload < stop or flags & (_TCP_FIN | _TCP_RST):
+                    key = data[address:address + 2 * width] + data[tcp:tcp + 4]
+                    kept = flows.get(key)
+                    if kept is not None and payload < stop:
+                        if kept or data[payload:payload + 8].startswith(_HTTP_STARTS):
+                            keep = True
+                            http += 1
+                            kept += stop - payload
+                            if kept >= HTTP_HEADER_LIMIT or data.find(b'\r\n\r\n', payload, stop) >= 0:
+                                del flows[key]
+                            else:
+                                flows[key] = kept
+                        else:
+                            del flows[key]
+                    if flags & (_TCP_FIN | _TCP_RST):
+                        keep = True
+                        closes += 1
+                        flows.pop(key, None)
+                        if flags & _TCP_RST:
+                            middle = address + width
+                            flows.pop(data[middle:middle + width] + data[address:middle]
+                                      + data[tcp + 2:tcp + 4] + data[tcp:tcp + 2], None)
+                if keep:
+                    written += 1
+                    copy(out, record, start, end)
+        skipped = reader.skipped
+    finally:
+        reader.close()
+
+    total += skipped
+    size, slim = os.path.getsize(pcap), os.path.getsize(path)
+    print(f"{Colors.CYAN}[+] Pre-filtered {Path(pcap).name}: kept {written:,} of {total:,} packets "
+          f"({written / max(total, 1):.1%}), {slim / 2**20:.1f} of {size / 2**20:.1f} MiB "
+          f"({slim / max(size, 1):.1%}) in {time.time() - started:.1f}s{Colors.RESET}")
+    print(f"{Colors.CYAN}    {syns:,} SYN, {synacks:,} SYN+ACK, {http:,} HTTP header, {closes:,} FIN/RST"
+          f"{f', {skipped:,} on interfaces of another link type' if skipped else ''}{Colors.RESET}")
+    return path
+
+# ------------------------------------------------------------------
+# Native SYN fingerprints
+# ------------------------------------------------------------------
+# --native skips p0f: SYN and SYN+ACK headers are decoded here and written
+# to full.log as p0f-style syn / syn+ack lines, so profiles, categories
+# and reports work unchanged. Only TTL, window and TCP option layout are
+# looked at, against a handful of common stacks, so every label carries
+# NATIVE_TAG and should be trusted less than a p0f match.
+NATIVE_TAG = " (native guess)"
+# (module, initial TTL, option layout or None for any, windows or None, label); first match wins
+NATIVE_SIGNATURES = (
+    ('syn', 128, 'mss,nop,nop,sok', (16384, 64512, 65535), 'Windows XP'),
+    ('syn', 128, 'mss,nop,nop,sok', (8192,), 'Windows 7 or 8'),
+    ('syn', 128, 'mss,nop,ws,nop,nop,sok', (8192,), 'Windows 7 or 8'),
+    ('syn', 128, None, None, 'Windows NT kernel'),
+    ('syn', 64, 'mss,sok,ts,nop,ws', None, 'Linux'),
+    ('syn', 64, 'mss,nop,nop,sok,nop,ws', None, 'Linux'),
+    ('syn', 64, 'mss,sok,ts', None, 'Linux'),
+    ('syn', 64, 'mss,nop,ws,nop,nop,ts,sok,eol+1', None, 'Mac OS X'),
+    ('syn', 64, 'mss,nop,ws,sok,ts', None, 'FreeBSD'),
+    ('syn', 64, 'mss,nop,nop,sok,nop,ws,nop,nop,ts', None, 'OpenBSD'),
+    ('syn+ack', 128, None, None, 'Windows NT kernel'),
+    ('syn+ack', 64, 'mss,sok,ts,nop,ws', None, 'Linux'),
+    ('syn+ack', 64, 'mss,nop,nop,sok,nop,ws', None, 'Linux'),
+    ('syn+ack', 64, 'mss,nop,nop,sok', None, 'Linux'),
+    ('syn+ack', 64, 'mss,sok,ts', None, 'Linux'),
+    ('syn+ack', 64, 'mss,nop,ws,sok,ts', None, 'FreeBSD'),
+    ('syn+ack', 64, 'mss,nop,ws,nop,nop,ts,sok,eol+1', None, 'Mac OS X'),
+)
+_TCP_OPTION_NAMES = {2: 'mss', 3: 'ws', 4: 'sok', 5: 'sack', 8: 'ts'}
+_IPV4_HEADER = struct.Struct('!BxHHHBBH4s4s')
+_IPV6_HEADER = struct.Struct('!IHBB16s16s')
+_TCP_HEADER = struct.Struct('!HHIIBBH')
+
+def initial_ttl(ttl):
+    """The TTL a packet most likely left its host with (32, 64, 128 or 255)"""
+    for guess in (32, 64, 128):
+        if ttl <= guess:
+            return guess
+    return 255
+
+def tcp_option_layout(data, start, end):
+    """(layout, mss, window scale) of raw TCP options, layout as in p0f's raw_sig ('mss,nop,ws,...')"""
+    names = []
+    mss = scale = None
+    while start < end:
+        kind = data[start]
+        if kind == 0:
+            names.append(f"eol+{end - start - 1}")
+            break
+        if kind == 1:
+            names.append('nop')
+            start += 1
+            continue
+        if start + 2 > end:
+            break
+        length = data[start + 1]
+        if length < 2 or start + length > end:
+            break
+        if kind == 2 and length == 4:
+            mss = (data[start + 2] << 8) | data[start + 3]
+        elif kind == 3 and length == 3:
+            scale = data[start + 2]
+        names.append(_TCP_OPTION_NAMES.get(kind) or f"?{kind}")
+        start += length
+    return ','.join(names), mss, scale
+
+def native_label(module, ttl, layout, window):
+    """(os label, params) for a SYN ('syn') or SYN+ACK ('syn+ack') signature"""
+    for signature_module, signature_ttl, signature_layout, windows, label in NATIVE_SIGNATURES:
+        if (signature_module == module and signature_ttl == ttl
+                and (signature_layout is None or signature_layout == layout)
+                and (windows is None or window in windows)):
+            return label + NATIVE_TAG, 'generic' if signature_layout is None else 'none'
+    return '???', 'none'
+
+# IP header offset from the packet start for link types without a variable header
+_LINK_HEADER_SIZES = {LINKTYPE_ETHERNET: 14, LINKTYPE_LINUX_SLL: 16, LINKTYPE_NULL: 4, LINKTYPE_LOOP: 4,
+                      LINKTYPE_RAW: 0, LINKTYPE_IPV4: 0, LINKTYPE_IPV6: 0}
+NATIVE_BATCH = 1 << 16
+
+def _syn_offset(data, start, end, linktype):
+    """Offset of the IP header of a TCP SYN or SYN+ACK packet, or None for anything else"""
+    ip = _network_offset(data, start, end, linktype)
+    if ip is None:
+        return None
+    version = data[ip] >> 4
+    if version == 4:
+        tcp = ip + (data[ip] & 0x0f) * 4
+        protocol = data[ip + 9]
+    elif version == 6:
+        tcp = ip + 40
+        protocol = data[ip + 6]
+    else:
+        return None
+    if protocol != 6 or tcp + 20 > end or not data[tcp + 13] & _TCP_SYN:
+        return None
+    return ip
+
+def syn_packets(reader, counts):
+    """Yield (end, IP header offset, capture second) of a capture's TCP SYN and SYN+ACK packets.
+
+    counts['packets'] is advanced by every packet read, SYN or not.
+
+    With numpy the link, IP and TCP headers of NATIVE_BATCH packets at a
+    time are checked as arrays, so the bulk of a capture (data segments,
+    ACKs, UDP) never reaches Python; VLAN-tagged frames and captures
+    without numpy are checked packet by packet.
+    """
+    data = reader.data
+    linktype = reader.linktype
+    if np is None or linktype not in _LINK_HEADER_SIZES:
+        for record, start, end in reader:
+            counts['packets'] += 1
+            ip = _syn_offset(data, start, end, linktype)
+            if ip is not None:
+                yield end, ip, reader.seconds(record)
+        return
+
+    buf = np.frombuffer(data, np.uint8)
+    last = len(buf) - 1
+
+    def byte(offsets):
+        return buf[np.minimum(offsets, last)].astype(np.int64)
+
+    for records, starts, ends, stamps in reader.chunks(NATIVE_BATCH):
+        counts['packets'] += len(records)
+        end = np.array(ends, np.int64)
+        ip = np.array(starts, np.int64) + _LINK_HEADER_SIZES[linktype]
+        tagged = np.zeros(len(records), bool)
+        if linktype == LINKTYPE_ETHERNET:
+            tagged = (ip <= end) & np.isin((byte(ip - 2) << 8) | byte(ip - 1), _VLAN_TYPES)
+        first = byte(ip)
+        v4 = first >> 4 == 4
+        tcp = np.where(v4, ip + (first & 0x0f) * 4, ip + 40)
+        protocol = byte(np.where(v4, ip + 9, ip + 6))
+        syn = ((ip < end) & (v4 | (first >> 4 == 6)) & (protocol == 6) & (tcp + 20 <= end)
+               & (byte(tcp + 13) & _TCP_SYN != 0) & ~tagged)
+        for row in np.flatnonzero(syn | tagged).tolist():
+            if tagged[row]:
+                offset = _syn_offset(data, starts[row], ends[row], linktype)
+                if offset is None:
+                    continue
+            else:
+                offset = int(ip[row])
+            yield ends[row], offset, reader.seconds(records[row]) if stamps is None else stamps[row]
+
+def write_native_log(pcap, logfile="full.log"):
+    """Fingerprint a pcap's SYN and SYN+ACK packets without p0f into a p0f-style log.
+
+    Like p0f, a SYN+ACK is only fingerprinted when its SYN was seen.
+    Returns (packets read, lines written); raises ValueError for files
+    that are not pcap or pcapng.
+    """
+    reader = open_capture(pcap)
+    ipv4, ipv6, tcp_header = _IPV4_HEADER.unpack_from, _IPV6_HEADER.unpack_from, _TCP_HEADER.unpack_from
+    ntop = socket.inet_ntop
+    labels = {}
+    opened = {}          # (client, port, server, port) of SYNs awaiting their SYN+ACK
+    counts = {'packets': 0}
+    written = 0
+    second = stamp = None
+    batch = []
+    try:
+        with open(logfile, 'w', buffering=1 << 20) as out:
+            data = reader.data
+            for end, ip, seconds in syn_packets(reader, counts):
+                version = data[ip] >> 4
+                if version == 4:
+                    tcp = ip + (data[ip] & 0x0f) * 4
+                    _, length, ident, fragment, ttl, _, _, src, dst = ipv4(data, ip)
+                    stop = ip + length
+                    if fragment & 0x1fff:
+                        continue
+                    family = socket.AF_INET
+                    if fragment & 0x4000:
+                        quirks = 'df,id+' if ident else 'df'
+                    else:
+                        quirks = 'id-' if not ident else ''
+                else:
+                    tcp = ip + 40
+                    head, length, _, ttl, src, dst = ipv6(data, ip)
+                    stop = tcp + length
+                    family = socket.AF_INET6
+                    quirks = 'flow' if head & 0xfffff else ''
+                sport, dport, _, _, offset, flags, window = tcp_header(data, tcp)
+                options = tcp + (offset >> 4) * 4
+                if options > end:
+                    continue
+
+                if flags & _TCP_ACK:
+                    if opened.pop((dst, dport, src, sport), None) is None:
+                        continue
+                    module, subject = 'syn+ack', 'srv'
+                    client, client_port, server, server_port = dst, dport, src, sport
+                else:
+                    if len(opened) >= _SLIM_FLOW_LIMIT:
+                        for key in list(itertools.islice(opened, _SLIM_FLOW_LIMIT // 4)):
+                            del opened[key]
+                    opened[src, sport, dst, dport] = True
+                    module, subject = 'syn', 'cli'
+                    client, client_port, server, server_port = src, sport, dst, dport
+
+                layout, mss, scale = tcp_option_layout(data, tcp + 20, options)
+                guess = initial_ttl(ttl)
+                key = (module, guess, layout, window)
+                label = labels.get(key)
+                if label is None:
+                    if len(labels) >= _CACHE_LIMIT:
+                        labels.clear()
+                    label = labels[key] = native_label(module, guess, layout, window)
+                os_name, params = label
+                if seconds != second:
+                    second = seconds
+                    stamp = time.strftime('%Y/%m/%d %H:%M:%S', time.localtime(seconds))
+                batch.append(
+                    f"[{stamp}] mod={module}|cli={ntop(family, client)}/{client_port}"
+                    f"|srv={ntop(family, server)}/{server_port}|subj={subject}|os={os_name}"
+                    f"|dist={guess - ttl}|params={params}|raw_sig={version}:{ttl}+{guess - ttl}:0:"
+                    f"{mss if mss is not None else '*'}:{window},{scale if scale is not None else 0}"
+                    f":{layout}:{quirks}:{'+' if min(stop, end) > options else 0}\n")
+                if len(batch) >= 4096:
+                    out.writelines(batch)
+                    written += len(batch)
+                    batch.clear()
+            out.writelines(batch)
+            written += len(batch)
+    finally:
+        reader.close()
+    return counts['packets'], written
+
+def analyse_pcaps_parallel(pcaps, jobs=None, checkpoint_every=0, scope=None, bpf=None, native=False):
+    """Analyse many pcaps in a process pool and merge them into one report.
+
+    Each pcap runs in p0f_runs/NNNN-<name>/ (its own full.log and category
+    files); the merged category files and a concatenated full.log end up
+    in the current directory. Returns (counts, flows).
+    """
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(pcaps)))
+    run_dirs = [os.path.join(RUNS_DIR, f"{index:04d}-{Path(pcap).name}") for index, pcap in enumerate(pcaps)]
+    print(f"{Colors.GREEN}[+] Running p0f on {len(pcaps)} pcaps with {jobs} workers...{Colors.RESET}")
+
+    started = time.time()
+    results = [None] * len(pcaps)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(analyse_pcap, pcap, run_dir, verbose_mode, checkpoint_every,
+                               scope, bpf, native): index
+                   for index, (pcap, run_dir) in enumerate(zip(pcaps, run_dirs))}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            result = future.result()
+            results[index] = result
+            name = Path(pcaps[index]).name
+            if result['ok']:
+                print(f"{Colors.CYAN}[{done}/{len(pcaps)}] {name}: {result['lines']} flows, "
+                      f"{len(result['profiles'])} hosts in {result['seconds']:.1f}s{Colors.RESET}")
+            else:
+                print(f"{Colors.RED}[{done}/{len(pcaps)}] {name}: p0f failed{Colors.RESET}")
+
+    results = [result for result in results if result['ok']]
+    if not results:
+        print(f"{Colors.RED}[!] p0f failed on every pcap{Colors.RESET}")
+        sys.exit(1)
     
-    print(f"{Colors.BOLD}{'='*70}{Colors.RESET}")
+    busy = sum(result['seconds'] for result in results)
+    slowest = max(results, key=lambda result: result['seconds'])
+    print(f"{Colors.CYAN}[+] Worker time {busy:.1f}s over {time.time() - started:.1f}s wall "
+          f"(slowest: {Path(slowest['pcap']).name} {slowest['seconds']:.1f}s){Colors.RESET}")
+
+    # Merge in pcap order so "first seen" semantics follow the file order
+    print(f"{Colors.CYAN}[+] Merging {len(results)} host profile sets and category files...{Colors.RESET}")
+    for result in results:
+        merge_profiles(result.pop('profiles'), result['stats'])
+    counts = merge_category_outputs(results)
+
+    with open("full.log", 'wb') as out:
+        for result in results:
+            with open(Path(result['dir'], "full.log"), 'rb') as f:
+                shutil.copyfileobj(f, out)
+
+    return counts, sum(result['lines'] for result in results)
 
-def main_offline(pcap):
+def main_offline(pcaps, jobs=None, shards=0, checkpoint_every=60, prefilter=False, scope=None, bpf=None,
+                 native=False, instruments=None):
     """Offline pcap analysis mode with IP grouping"""
     global verbose_mode
     
-    if not Path(pcap).is_file():
-        sys.exit(f"{Colors.RED}[!] pcap not found: {pcap}{Colors.RESET}")
+    pcaps = expand_pcaps(pcaps)
+    if not pcaps:
+        sys.exit(f"{Colors.RED}[!] No pcaps to analyse{Colors.RESET}")
 
     print("="*70)
     print(f"{Colors.BOLD}p0f-miner: Offline Analysis Mode{Colors.RESET}")
     print("="*70)
-    print(f"Target: {pcap}")
+    if len(pcaps) == 1:
+        print(f"Target: {pcaps[0]}")
+    else:
+        print(f"Targets: {len(pcaps)} pcaps (per-file output in {RUNS_DIR}/)")
+    if shards > 1:
+        print(f"Shards: {shards} per pcap by flow hash")
+    if prefilter:
+        print(f"Pre-filter: SYN, SYN+ACK, FIN/RST and HTTP header packets only (slim copies in {SLIM_DIR}/)")
     print(f"Rules: {len(ONELINERS)} detection patterns")
+    if scope is not None:
+        print(f"Scope: {scope.describe()}")
+    if bpf:
+        print(f"Capture filter: {bpf}{' (not applied by --native)' if native else ''}")
+    if native:
+        print(f"Fingerprints: native SYN/SYN+ACK, no p0f (lower confidence, labels tagged '{NATIVE_TAG.strip()}')")
     print(f"Verbose: {verbose_mode}")
     print("="*70)
     
-    # Run p0f
-    print(f"{Colors.GREEN}[+] Running p0f analysis...{Colors.RESET}")
-    result = subprocess.run(
-        f"p0f -r {pcap} -o full.log",
-        shell=True,
-        stderr=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        text=True
-    )
+    if prefilter:
+        # p0f only fingerprints handshakes and HTTP headers: hand it those
+        try:
+            pcaps = [slim_pcap(pcap) for pcap in pcaps]
+        except ValueError as e:
+            sys.exit(f"{Colors.RED}[!] {e}{Colors.RESET}")
     
-    if result.returncode != 0 or not Path("full.log").exists():
-        print(f"{Colors.RED}[!] p0f failed{Colors.RESET}")
-        sys.exit(1)
+    if shards > 1:
+        # p0f keeps per-flow state, so split by flow and analyse the shards
+        shard_paths = []
+        for pcap in pcaps:
+            try:
+                shard_paths.extend(shard_pcap(pcap, shards))
+            except ValueError as e:
+                sys.exit(f"{Colors.RED}[!] {e}{Colors.RESET}")
+        counts, flows = analyse_pcaps_parallel(shard_paths, jobs, checkpoint_every, scope, bpf, native)
+        shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+    elif len(pcaps) > 1:
+        counts, flows = analyse_pcaps_parallel(pcaps, jobs, checkpoint_every, scope, bpf, native)
+    else:
+        # Run p0f (unless a checkpoint covers it), then build IP profiles
+        # and evaluate detection rules in a single pass
+        result = profile_pcap(pcaps[0], checkpoint_every=checkpoint_every, scope=scope, bpf=bpf, native=native,
+                              instruments=instruments)
+        if result is None:
+            print(f"{Colors.RED}[!] p0f failed{Colors.RESET}")
+            sys.exit(1)
+        counts, flows = result
+    if prefilter:
+        shutil.rmtree(SLIM_DIR, ignore_errors=True)
     
-    flows = count_lines("full.log")
     print(f"{Colors.GREEN}[+] Captured {flows} flows{Colors.RESET}")
-    
-    # Build IP profiles from the log
     if flows > 0:
-        print(f"{Colors.CYAN}[+] Building IP profiles...{Colors.RESET}")
-        
-        with open("full.log", 'r') as f:
-            for line in f:
-                if line.startswith('[') and '|' in line:
-                    update_live_stats(line)
-                    
-                    # Show packet details if verbose
-                    if verbose_mode:
-                        highlighted = highlight_line(line.strip())
-                        print(highlighted if highlighted else line.strip())
-        
         print(f"{Colors.GREEN}[+] Profiled {len(ip_profiles)} unique hosts{Colors.RESET}")
     
-    # Process intelligence rules
-    counts = process_intelligence()
-    
     # Show IP-grouped final report
-    print_final_statistics(counts, save_to_file=True)
+    print_final_statistics(counts, save_to_file=True, instruments=instruments)
     
     print(f"\n{Colors.GREEN}[+] All log files saved to current directory{Colors.RESET}")
     print(f"{Colors.YELLOW}[+] Review p0f_report_*.txt for full analysis{Colors.RESET}")
     print(f"{Colors.YELLOW}[+] Review p0f_profiles_*.json for programmatic access{Colors.RESET}")
 
-def main_live(interface, promiscuous=False, update_interval=15):
+def main_live(interfaces, promiscuous=False, update_interval=15, no_tee=False,
+              max_hosts=None, host_ttl=None, spill_file="p0f_spill.ndjson",
+              rotate_bytes=None, rotate_seconds=None, delta_every=None, http_port=None, scope=None, bpf=None,
+              instruments=None):
     """Live network capture mode with periodic intelligence summaries"""
+    
     print("="*70)
     print(f"{Colors.BOLD}p0f-miner: Live Capture Mode{Colors.RESET}")
     print("="*70)
-    print(f"Interface: {interface}")
+    print(f"Interface{'s' if len(interfaces) > 1 else ''}: {', '.join(interfaces)}")
     print(f"Promiscuous: {promiscuous}")
     print(f"Update Interval: {update_interval}s")
+    if no_tee:
+        print("Raw log: disabled")
+    elif rotate_bytes or rotate_seconds:
+        limits = [f"{rotate_bytes / 2**20:g} MiB" if rotate_bytes else None,
+                  f"{rotate_seconds}s" if rotate_seconds else None]
+        print(f"Raw log: full.log, rotated every {' or '.join(filter(None, limits))} into gzipped segments")
+    else:
+        print("Raw log: full.log")
+    if max_hosts or host_ttl:
+        print(f"Host limits: {max_hosts or 'no'} cap, {f'{host_ttl}s' if host_ttl else 'no'} TTL, spill to {spill_file}")
+    if scope is not None:
+        print(f"Scope: {scope.describe()}")
+    if bpf:
+        print(f"Capture filter: {bpf}")
     print(f"Verbose: {verbose_mode}")
     print(f"Rules: {len(ONELINERS)} detection patterns")
     print("="*70)
     
-    # Start p0f
-    start_p0f_live(interface, promiscuous)
+    spill = None
+    if max_hosts or host_ttl:
+        spill = ip_profiles.spill = ProfileSpill(spill_file, max_hosts, host_ttl)
+    deltas = None
+    if delta_every:
+        deltas = DeltaExporter(interval=delta_every)
+        ip_profiles.trackers.append(deltas)
     
-    # Wait for log file
-    timeout = 10
-    while not Path("full.log").exists() and timeout > 0:
-        time.sleep(1)
-        timeout -= 1
+    # Categories cover everything already in full.log; new events are
+    # maintained as they stream in, so shutdown only flushes them
+    engine = CategoryEngine(scope=scope, instruments=instruments)
+    for line in read_log_lines("full.log"):
+        engine.feed(line)
+    latency = LatencyMeter()
     
-    if not Path("full.log").exists():
-        print(f"{Colors.RED}[!] Log file not created{Colors.RESET}")
-        stop_p0f()
-        sys.exit(1)
+    # Start one p0f per interface
+    capture = start_p0f_live(interfaces, promiscuous, None if no_tee else "full.log",
+                             rotate_bytes, rotate_seconds, bpf)
+    endpoint = None
+    if http_port is not None:
+        try:
+            endpoint = LiveQueryServer(http_port, engine, latency, capture, instruments=instruments).start()
+            print(f"{Colors.GREEN}[+] Query endpoint: http://127.0.0.1:{endpoint.port}/ "
+                  f"(/metrics, /hosts, /hosts/<ip>, /categories){Colors.RESET}")
+        except OSError as e:
+            print(f"{Colors.YELLOW}[!] Could not start query endpoint on port {http_port}: {e}{Colors.RESET}")
     
     # Show live intelligence
     try:
-        tail_log_file("full.log", show_stats_interval=update_interval)
+        follow_p0f(capture, show_stats_interval=update_interval, engine=engine, latency=latency, deltas=deltas,
+                   scope=scope, instruments=instruments)
     except KeyboardInterrupt:
         pass
     finally:
@@ -1073,22 +5433,705 @@ def main_live(interface, promiscuous=False, update_interval=15):
         print(f"{Colors.BOLD}GENERATING FINAL REPORT{Colors.RESET}")
         print(f"{Colors.CYAN}{'='*70}{Colors.RESET}")
         
-        stop_p0f()
+        if endpoint is not None:
+            endpoint.stop()
         
-        if Path("full.log").exists():
-            flows = count_lines("full.log")
-            print(f"{Colors.GREEN}[+] Total flows captured: {flows}{Colors.RESET}")
-            
-            counts = process_intelligence(quiet=True)
-            print_final_statistics(counts, save_to_file=True)
-            
-            print(f"\n{Colors.GREEN}[+] All log files saved to current directory{Colors.RESET}")
-            print(f"{Colors.YELLOW}[+] Review p0f_report_*.txt for full analysis{Colors.RESET}")
-            print(f"{Colors.YELLOW}[+] Review p0f_profiles_*.json for programmatic access{Colors.RESET}")
-            print(f"{Colors.YELLOW}[+] Review *-candidates.log and eol.log for attack planning{Colors.RESET}")
+        # Process whatever p0f flushed before exiting
+        capture.stop()
+        ingest_lines(capture.drain(), engine, scope, instruments)
+        capture.close()
+        counts = engine.close()
+        
+        print(f"{Colors.GREEN}[+] Total flows captured: {engine.lines}{Colors.RESET}")
+        if len(capture.processes) > 1:
+            print(f"{Colors.GREEN}[+] Per interface: "
+                  f"{', '.join(f'{p0f.interface} {p0f.lines}' for p0f in capture.processes)}{Colors.RESET}")
+        if deltas is not None:
+            deltas.write()
+            ip_profiles.trackers.remove(deltas)
+            print(f"{Colors.GREEN}[+] Deltas: {deltas.sequence} files, {deltas.hosts} host records "
+                  f"in {deltas.directory}/{Colors.RESET}")
+        if spill is not None:
+            print(f"{Colors.GREEN}[+] Hosts: {len(ip_profiles)} resident, {spill.evicted} spilled "
+                  f"to {spill.path} ({spill.rate():.1f} evictions/min){Colors.RESET}")
+        if latency.summary():
+            print(f"{Colors.GREEN}[+] End-to-end latency: {latency.summary()}{Colors.RESET}")
+        
+        print_final_statistics(counts, save_to_file=True, instruments=instruments)
+        
+        print(f"\n{Colors.GREEN}[+] All log files saved to current directory{Colors.RESET}")
+        print(f"{Colors.YELLOW}[+] Review p0f_report_*.txt for full analysis{Colors.RESET}")
+        print(f"{Colors.YELLOW}[+] Review p0f_profiles_*.json for programmatic access{Colors.RESET}")
+        print(f"{Colors.YELLOW}[+] Review *-candidates.log and eol.log for attack planning{Colors.RESET}")
+        if spill is not None:
+            spill.close()
+            ip_profiles.spill = None
+
+# ------------------------------------------------------------------
+# Saved profile queries
+# ------------------------------------------------------------------
+# --query answers filter expressions over profile exports (or a --db
+# store) from in-memory indexes instead of re-grepping logs:
+#
+#   os~"Windows 2012" and port=445 and dist<=1
+#   (eol or scanner) and ip=10.20.0.0/16 and not nat
+#
+# Terms: os~TEXT (substring) / os=NAME, family=NAME, port=N|SERVICE,
+# dist with = != < <= > >=, ip=ADDRESS|CIDR, and the bare flags eol,
+# server, nat, scanner, suspicious, services. Combine with and / or /
+# not and parentheses; quote values that contain ' and ' or ' or '.
+QUERY_FLAGS = ('eol', 'server', 'nat', 'scanner', 'suspicious', 'services')
+_QUERY_TOKEN = re.compile(r'''\s*(?:
+    (?P<paren>[()])
+  | (?P<word>and|or|not)(?=[\s()]|$)
+  | (?P<field>[a-z_]+)\s*(?P<op>~|<=|>=|!=|=|<|>)\s*
+        (?:"(?P<quoted>[^"]*)"|(?P<value>.+?))(?=\s+(?:and|or)(?:[\s(]|$)|\s*\)|\s*$)
+  | (?P<flag>[a-z_]+)(?=[\s()]|$)
+)''', re.I | re.X)
+_COMPARE = {
+    '=': lambda a, b: a == b, '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b, '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b, '>=': lambda a, b: a >= b,
+}
+
+def parse_query(text):
+    """Parse a --query expression into nested ('and'|'or'|'not', ...) / ('term', field, op, value) tuples"""
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        m = _QUERY_TOKEN.match(text, position)
+        if m is None or m.end() == position:
+            raise ValueError(f"cannot parse query at: {text[position:]!r}")
+        position = m.end()
+        if m.group('paren'):
+            tokens.append(m.group('paren'))
+        elif m.group('word'):
+            tokens.append(m.group('word').lower())
+        elif m.group('field'):
+            value = m.group('quoted') if m.group('quoted') is not None else m.group('value').strip()
+            tokens.append(('term', m.group('field').lower(), m.group('op'), value))
+        else:
+            flag = m.group('flag').lower()
+            if flag not in QUERY_FLAGS:
+                raise ValueError(f"unknown flag {flag!r} (one of {', '.join(QUERY_FLAGS)})")
+            tokens.append(('term', 'flag', '=', flag))
+
+    def expression(index, operator='or'):
+        below = 'and' if operator == 'or' else None
+        node, index = expression(index, below) if below else unary(index)
+        while index < len(tokens) and tokens[index] == operator:
+            right, index = expression(index + 1, below) if below else unary(index + 1)
+            node = (operator, node, right)
+        return node, index
+
+    def unary(index):
+        if index >= len(tokens):
+            raise ValueError("query ends early")
+        token = tokens[index]
+        if token == 'not':
+            node, index = unary(index + 1)
+            return ('not', node), index
+        if token == '(':
+            node, index = expression(index + 1)
+            if index >= len(tokens) or tokens[index] != ')':
+                raise ValueError("missing ')'")
+            return node, index + 1
+        if isinstance(token, tuple):
+            return token, index + 1
+        raise ValueError(f"unexpected {token!r}")
+
+    if not tokens:
+        raise ValueError("empty query")
+    node, index = expression(0)
+    if index != len(tokens):
+        raise ValueError(f"unexpected {tokens[index]!r}")
+    return node
+
+def _record_ports(record):
+    """Server ports of an exported host record ('SMB:445', 'port-8080:8080', ...)"""
+    ports = []
+    for label in record.get('services') or ():
+        try:
+            ports.append(int(label.rsplit(':', 1)[1]))
+        except (IndexError, ValueError):
+            pass
+    return ports
+
+class ProfileIndex:
+    """Exported host records indexed for --query.
+
+    Records are kept in numeric IP order (the first record wins when an
+    IP repeats), so row numbers double as the IP-ordered output and a
+    CIDR is a contiguous row range found by bisection. OS name,
+    family, port, distance and flag indexes map to sets of rows.
+    """
+    VERSION = 1
+
+    def __init__(self, records):
+        keyed = sorted(((pack_ip(record['ip']), position, record) for position, record in enumerate(records)),
+                       key=lambda item: (_ip_order(item[0]), item[1]))
+        self.records = []
+        self.keys = []
+        for key, _, record in keyed:
+            if self.keys and self.keys[-1] == key:
+                continue
+            self.keys.append(key)
+            self.records.append(record)
+        self.numeric = sum(1 for key in self.keys if key.__class__ is int)
+
+        self.by_os = defaultdict(set)
+        self.by_family = defaultdict(set)
+        self.by_port = defaultdict(set)
+        self.by_distance = defaultdict(set)
+        self.by_flag = {flag: set() for flag in QUERY_FLAGS}
+        for row, record in enumerate(self.records):
+            name = record.get('os')
+            if name:
+                self.by_os[name].add(row)
+                self.by_family[os_family(name)].add(row)
+            if record.get('distance') is not None:
+                self.by_distance[record['distance']].add(row)
+            for port in _record_ports(record):
+                self.by_port[port].add(row)
+            flags = (('eol', record.get('is_eol')), ('server', record.get('is_server')),
+                     ('nat', record.get('nat')), ('scanner', record.get('scanners')),
+                     ('suspicious', record.get('suspicious')), ('services', record.get('services')))
+            for flag, present in flags:
+                if present:
+                    self.by_flag[flag].add(row)
+
+    def __len__(self):
+        return len(self.records)
+
+    def select(self, node):
+        """Rows matching a parse_query() tree"""
+        kind = node[0]
+        if kind == 'and':
+            return self.select(node[1]) & self.select(node[2])
+        if kind == 'or':
+            return self.select(node[1]) | self.select(node[2])
+        if kind == 'not':
+            return set(range(len(self.records))) - self.select(node[1])
+        _, field, op, value = node
+        rows = self.term(field, op if op != '!=' else '=', value)
+        return set(range(len(self.records))) - rows if op == '!=' else rows
+
+    def term(self, field, op, value):
+        if field == 'dist':
+            try:
+                limit = int(value)
+            except ValueError:
+                raise ValueError(f"dist needs a number, not {value!r}")
+            compare = _COMPARE.get(op)
+            if compare is None:
+                raise ValueError(f"dist does not support {op} (use = != < <= > >=)")
+            return set().union(*(rows for distance, rows in self.by_distance.items() if compare(distance, limit)))
+        if op not in ('=', '~'):
+            raise ValueError(f"{field} does not support {op}")
+        if field == 'os':
+            if op == '=':
+                return set(self.by_os.get(value, ()))
+            needle = value.lower()
+            return set().union(*(rows for name, rows in self.by_os.items() if needle in name.lower()))
+        if field == 'family':
+            return set().union(*(rows for name, rows in self.by_family.items()
+                                 if (value.lower() in name.lower() if op == '~' else name.lower() == value.lower())))
+        if field == 'port':
+            if value.isdigit():
+                return set(self.by_port.get(int(value), ()))
+            ports = [port for port, name in SERVICE_MAP.items() if name.lower() == value.lower()]
+            if not ports:
+                raise ValueError(f"unknown service {value!r}")
+            return set().union(*(self.by_port.get(port, ()) for port in ports))
+        if field == 'flag':
+            return set(self.by_flag[value.lower()])
+        if field == 'ip':
+            return self.network_rows(value)
+        raise ValueError(f"unknown field {field!r} (os, family, port, dist, ip)")
+
+    def network_rows(self, text):
+        """Rows whose IP equals an address or falls inside a CIDR"""
+        if '/' not in text:
+            key = pack_ip(text)
+            if key.__class__ is not int:
+                return {row for row in range(self.numeric, len(self.keys)) if self.keys[row] == key}
+            # An IPv6 address matches both p0f spellings of it
+            candidates = (key & ~_V6_EXPANDED, key | _V6_EXPANDED) if key >= _V6_TAG else (key,)
+            rows = set()
+            for key in candidates:
+                row = bisect.bisect_left(self.keys, key, 0, self.numeric)
+                if row < self.numeric and self.keys[row] == key:
+                    rows.add(row)
+            return rows
+        low, high = network_range(*parse_network(text))
+        spans = [(low, high)]
+        if low >= _V6_TAG:
+            # IPv6 keys spelled 'a:b:c:d:e:f:g:h' by p0f carry an extra tag bit
+            spans.append((low + _V6_EXPANDED, high + _V6_EXPANDED))
+        rows = set()
+        for low, high in spans:
+            first = bisect.bisect_left(self.keys, low, 0, self.numeric)
+            last = bisect.bisect_left(self.keys, high, 0, self.numeric)
+            rows.update(range(first, last))
+        return rows
+
+def query_cache_path(path):
+    """Per-user cache file for an export's --query index (never next to the export)"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    name = hashlib.sha256(os.fsencode(os.path.abspath(path))).hexdigest()[:32]
+    return os.path.join(base, 'p0f_miner', f"{name}.idx")
+
+def private_file(path):
+    """True if `path` is a regular file that only this user could have written or swapped in"""
+    if not hasattr(os, 'getuid'):
+        return os.path.isfile(path)
+    import stat
+    try:
+        info = os.lstat(path)
+        parent = os.stat(os.path.dirname(path))
+    except OSError:
+        return False
+    uid = os.getuid()
+    return (stat.S_ISREG(info.st_mode) and info.st_uid == uid and parent.st_uid == uid
+            and not (info.st_mode | parent.st_mode) & 0o022)
+
+def is_sqlite(path):
+    with open(path, 'rb') as f:
+        return f.read(16) == b'SQLite format 3\x00'
+
+def load_profile_records(path):
+    """Host records (host_record() fields plus 'ip') from a JSON/NDJSON export or a --db store"""
+    if is_sqlite(path):
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            records = {}
+            for ip, name, distance, flags, uptime, link in db.execute(
+                    "SELECT ip, os, distance, flags, uptime, link FROM hosts ORDER BY rowid"):
+                records[ip] = {'ip': ip, 'os': name, 'os_detail': name, 'distance': distance,
+                               'services': [], 'scanners': [], 'suspicious': [],
+                               'nat': bool(flags & PROFILE_NAT), 'uptime': uptime, 'link': link,
+                               'is_server': bool(flags & PROFILE_SERVER), 'is_eol': bool(flags & PROFILE_EOL)}
+            for ip, port in db.execute("SELECT ip, port FROM services"):
+                records[ip]['services'].append(service_label(port))
+            for ip, kind, value in db.execute("SELECT ip, kind, value FROM tags"):
+                records[ip]['scanners' if kind == 'scanner' else 'suspicious'].append(value)
+        finally:
+            db.close()
+        return list(records.values())
+    with open(path) as f:
+        if path.endswith('.ndjson'):
+            return [json.loads(line) for line in f if line.strip()]
+        hosts = json.load(f)['hosts']
+    records = []
+    for ip, record in hosts.items():
+        entry = {'ip': ip}
+        entry.update(record)
+        records.append(entry)
+    return records
+
+def load_query_index(paths):
+    """ProfileIndex over the given exports/stores; returns (index, how it was obtained).
+
+    Each export's index is pickled under the user's cache directory
+    (query_cache_path()) and reused while the export's size and mtime
+    are unchanged (--db stores are always read afresh). A cache file is
+    only unpickled when private_file() says no one else could have
+    planted it. Several inputs are merged by re-indexing their records.
+    """
+    indexes = []
+    sources = []
+    for path in paths:
+        stat = os.stat(path)
+        signature = (ProfileIndex.VERSION, stat.st_size, stat.st_mtime_ns)
+        cache = query_cache_path(path)
+        index = None
+        try:
+            if private_file(cache):
+                with open(cache, 'rb') as f:
+                    cached = pickle.load(f)
+                if cached['signature'] == signature:
+                    index = cached['index']
+                    sources.append('cached')
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError):
+            pass
+        if index is None:
+            index = ProfileIndex(load_profile_records(path))
+            sources.append('built')
+            if not is_sqlite(path):    # a live store changes under us; exports do not
+                try:
+                    os.makedirs(os.path.dirname(cache), mode=0o700, exist_ok=True)
+                    temporary = f"{cache}.{os.getpid()}.tmp"
+                    with open(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                        pickle.dump({'signature': signature, 'index': index}, f, pickle.HIGHEST_PROTOCOL)
+                    os.replace(temporary, cache)
+                except OSError:
+                    pass
+        indexes.append(index)
+    if len(indexes) == 1:
+        return indexes[0], sources[0]
+    return ProfileIndex([record for index in indexes for record in index.records]), 'merged'
+
+def latest_export():
+    exports = glob.glob("p0f_profiles_*.json") + glob.glob("p0f_profiles_*.ndjson")
+    return max(exports, key=os.path.getmtime) if exports else None
+
+def main_query(expression, paths, output='ips'):
+    """--query: print the hosts matching expression (IPs or JSON); returns the match count"""
+    try:
+        tree = parse_query(expression)
+    except ValueError as e:
+        sys.exit(f"{Colors.RED}[!] Bad query: {e}{Colors.RESET}")
+    started = time.perf_counter()
+    try:
+        index, source = load_query_index(paths)
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"{Colors.RED}[!] Could not load profiles: {e}{Colors.RESET}")
+    loaded = time.perf_counter()
+    try:
+        rows = sorted(index.select(tree))
+    except ValueError as e:
+        sys.exit(f"{Colors.RED}[!] Bad query: {e}{Colors.RESET}")
+    answered = time.perf_counter()
+
+    records = index.records
+    try:
+        if output == 'json':
+            json.dump([records[row] for row in rows], sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        elif output == 'ndjson':
+            for row in rows:
+                sys.stdout.write(json.dumps(records[row]) + '\n')
+        else:
+            for row in rows:
+                sys.stdout.write(records[row]['ip'] + '\n')
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Reader went away (| head): stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return len(rows)
+    print(f"{Colors.GREEN}[+] {len(rows)} of {len(index)} hosts in {(answered - loaded) * 1000:.1f} ms "
+          f"(index {source} in {(loaded - started) * 1000:.0f} ms){Colors.RESET}", file=sys.stderr)
+    return len(rows)
+
+# ------------------------------------------------------------------
+# Benchmarks
+# ------------------------------------------------------------------
+def synthetic_event_lines(hosts, seed=1):
+    """p0f log lines describing `hosts` distinct hosts (v4 and ~10% v6).
+
+    Mix per host: SYN with OS and distance, a well-known service on most
+    servers, a rare port on some, NAT/uptime/link extras and the odd
+    scanner user agent.
+    """
+    rng = random.Random(seed)
+    os_names = ['Windows 7 or 8', 'Windows NT kernel', 'Windows XP', 'Linux 3.11 and newer',
+                'Linux 2.2.x-3.x', 'Mac OS X', 'FreeBSD', '???']
+    well_known = list(SERVICE_MAP)
+    stamp = time.strftime('%Y/%m/%d %H:%M:%S')
+    lines = []
+    for index in range(hosts):
+        if index % 10 == 9:
+            ip = f"2001:db8:{index >> 16:x}:0:0:0:0:{index & 0xffff:x}"
+        else:
+            ip = f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+        peer = f"192.168.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        os_name = rng.choice(os_names)
+        port = rng.choice(well_known) if rng.random() < 0.9 else rng.randrange(1024, 65535)
+        lines.append(f"[{stamp}] mod=syn+ack|cli={peer}/{rng.randrange(1024, 65535)}|srv={ip}/{port}|"
+                     f"subj=srv|os={os_name}|dist={rng.randrange(0, 20)}|params=none|raw_sig=4:64+0:0:1460:mss*20,7:mss,sok,ts,nop,ws:df:0\n")
+        if rng.random() < 0.2:
+            lines.append(f"[{stamp}] mod=uptime|cli={peer}/1|srv={ip}/{port}|subj=srv|uptime={rng.randrange(1, 400)} days 3 hrs|raw_freq=1000.00 Hz\n")
+            lines.append(f"[{stamp}] mod=mtu|cli={peer}/1|srv={ip}/{port}|subj=srv|link=Ethernet or modem|raw_mtu=1500\n")
+        if rng.random() < 0.01:
+            lines.append(f"[{stamp}] mod=http request|cli={ip}/4444|srv={peer}/80|subj=cli|app=nmap NSE|lang=none|params=none|raw_sig=1:Host,User-Agent:Accept:nmap\n")
+    return lines
+
+def benchmark_profile_memory(hosts=100000):
+    """Print the memory each host profile costs in the store vs dicts of sets"""
+    import tracemalloc
+
+    lines = synthetic_event_lines(hosts)
+    events = [parse_event(line) for line in lines]
+    reset_profiles()
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    update_live_stats_batch(events)
+    compact = tracemalloc.get_traced_memory()[0] - base
+
+    # The layout the store replaced: IP string -> 12-key dict with three sets
+    base = tracemalloc.get_traced_memory()[0]
+    legacy = {}
+    for ip, profile in ip_profiles.items():
+        legacy[ip] = {
+            'os': profile['os'], 'os_detail': profile['os_detail'],
+            'distance': profile['distance'], 'services': set(profile['services']),
+            'scanners': set(profile['scanners']), 'suspicious': set(profile['suspicious']),
+            'nat': profile['nat'], 'uptime': profile['uptime'], 'link': profile['link'],
+            'first_seen': profile['first_seen'], 'is_server': profile['is_server'],
+            'is_eol': profile['is_eol'],
+        }
+    dicts = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    count = len(ip_profiles)
+    print(f"{Colors.BOLD}Profile memory ({count} hosts, {len(lines)} lines){Colors.RESET}")
+    print(f"  Compact store:   {compact / count:>7.0f} bytes/host  ({compact / 2**20:.1f} MiB)")
+    print(f"  Dicts of sets:   {dicts / count:>7.0f} bytes/host  ({dicts / 2**20:.1f} MiB)")
+    print(f"  OS table:        {len(OS_TABLE) - 1} strings")
+    reset_profiles()
+
+# Default mixes for the pipeline benchmark (weights)
+BENCH_SIZES = (100000, 1000000, 10000000)
+BENCH_MODULES = {'syn': 30, 'syn+ack': 30, 'mtu': 12, 'uptime': 10, 'http request': 12, 'http response': 6}
+BENCH_PORTS = {80: 8, 443: 8, 445: 6, 3389: 5, 22: 5, 139: 2, 3306: 2, 5432: 2,
+               8080: 2, 1521: 1, 5985: 1, 9418: 1, 6379: 1, 27017: 1}
+BENCH_OSES = {'Windows 7 or 8': 8, 'Windows NT kernel': 6, 'Windows 2012': 3, 'Windows XP': 1,
+              'Windows 2003': 1, 'Linux 3.11 and newer': 8, 'Linux 2.2.x-3.x': 4, 'Mac OS X': 3,
+              'FreeBSD 9.x': 1, 'Android 4': 1, '???': 4}
+BENCH_CLIENT_APPS = {'Firefox 10.x or newer': 10, 'Chrome 11.x or newer': 10, 'MSIE 8 or newer': 4,
+                     'curl': 2, 'Python-urllib': 1, 'nmap': 1, 'sqlmap': 1}
+BENCH_SERVER_APPS = {'Apache 2.x': 5, 'nginx': 5, 'IIS': 3, 'Jenkins': 1, 'Citrix': 1}
+BENCH_TOLERANCE = 0.10     # slower than baseline by more than this = regression
+
+def parse_mix(spec, convert=str):
+    """'445:5,3389,80:2' -> {445: 5, 3389: 1, 80: 2} (weight defaults to 1)"""
+    mix = {}
+    for item in spec.split(','):
+        name, separator, weight = item.strip().rpartition(':')
+        if not separator:
+            name, weight = weight, 1
+        try:
+            mix[convert(name.strip())] = int(weight)
+        except ValueError:
+            raise ValueError(f"bad entry {item.strip()!r} (NAME or NAME:WEIGHT)") from None
+    if any(weight < 0 for weight in mix.values()) or not sum(mix.values()):
+        raise ValueError(f"weights in {spec!r} must be non-negative and not all 0")
+    return mix
+
+def _weighted(rng, mix, count):
+    return rng.choices(list(mix), weights=list(mix.values()), k=count)
+
+def synthetic_log_lines(lines, hosts=50000, ports=None, oses=None, seed=1):
+    """Yield `lines` p0f log lines about `hosts` hosts (~10% IPv6).
+
+    Every host keeps one OS, distance and service port (drawn from the
+    `oses` / `ports` weight mixes) across its syn, syn+ack, mtu, uptime
+    and http lines, so profiles fill up the way they do on a real
+    capture. Peers are drawn from the same host pool.
+    """
+    rng = random.Random(seed)
+    ports = ports or BENCH_PORTS
+    oses = oses or BENCH_OSES
+    addresses = [f"2001:db8:{index >> 16:x}::{index & 0xffff:x}" if index % 10 == 9 else
+                 f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}" for index in range(hosts)]
+    host_os = _weighted(rng, oses, hosts)
+    host_port = _weighted(rng, ports, hosts)
+    host_dist = [rng.randrange(0, 20) for _ in range(hosts)]
+    links = ['Ethernet or modem', 'DSL', 'generic tunnel or VPN']
+    servers = list(BENCH_SERVER_APPS)
+    started = time.mktime((2024, 1, 1, 8, 0, 0, 0, 0, -1))
+    raw_sig = 'raw_sig=4:64+0:0:1460:mss*44,7:mss,sok,ts,nop,ws:df,id+:0'
+
+    done = 0
+    while done < lines:
+        count = min(8192, lines - done)
+        stamp = time.strftime('[%Y/%m/%d %H:%M:%S]', time.localtime(started + done // 1000))
+        mods = _weighted(rng, BENCH_MODULES, count)
+        clients = _weighted(rng, BENCH_CLIENT_APPS, count)
+        for mod, app in zip(mods, clients):
+            host = rng.randrange(hosts)
+            peer = rng.randrange(hosts)
+            ip, port = addresses[host], host_port[host]
+            ephemeral = rng.randrange(1024, 65535)
+            if mod == 'syn':
+                yield (f"{stamp} mod=syn|cli={ip}/{ephemeral}|srv={addresses[peer]}/{host_port[peer]}|subj=cli|"
+                       f"os={host_os[host]}|dist={host_dist[host]}|params=none|{raw_sig}\n")
+            elif mod == 'syn+ack':
+                yield (f"{stamp} mod=syn+ack|cli={addresses[peer]}/{ephemeral}|srv={ip}/{port}|subj=srv|"
+                       f"os={host_os[host]}|dist={host_dist[host]}|params=none|{raw_sig}\n")
+            elif mod == 'mtu':
+                yield (f"{stamp} mod=mtu|cli={ip}/{ephemeral}|srv={addresses[peer]}/{host_port[peer]}|subj=cli|"
+                       f"link={links[host % 3]}|raw_mtu=1500\n")
+            elif mod == 'uptime':
+                yield (f"{stamp} mod=uptime|cli={addresses[peer]}/{ephemeral}|srv={ip}/{port}|subj=srv|"
+                       f"uptime={host % 400} days {host % 24} hrs|raw_freq=1000.00 Hz\n")
+            elif mod == 'http request':
+                extra = '|http=Python-requests|bad_sw=1' if ephemeral % 50 == 0 else ''
+                yield (f"{stamp} mod=http request|cli={ip}/{ephemeral}|srv={addresses[peer]}/{host_port[peer]}|subj=cli|"
+                       f"app={app}|lang=English|params=none|raw_sig=1:Host,User-Agent::{extra}\n")
+            else:
+                yield (f"{stamp} mod=http response|cli={addresses[peer]}/{ephemeral}|srv={ip}/{port}|subj=srv|"
+                       f"app={servers[host % len(servers)]}|lang=English|params=none|"
+                       f"raw_sig=1:Server,Content-Type::\n")
+        done += count
+
+def benchmark_pipeline(sizes=BENCH_SIZES, hosts=50000, ports=None, oses=None, baseline=None, output=None):
+    """Time each ingest/report stage on synthetic corpora; returns the number of regressions.
+
+    Stages: parse_event (the parser the ingest path uses), update_live_stats,
+    highlight_line/check_high_value, process_intelligence, print_final_statistics
+    and save_json_report. Results go to `output` as JSON; with a `baseline`
+    results file each stage's lines/s is compared with the same corpus size there.
+    """
+    import contextlib
+    import io
+    import platform
+    import tempfile
+
+    previous = {}
+    if baseline:
+        with open(baseline) as f:
+            previous = {str(run['lines']): run for run in json.load(f)['runs']}
+    output = output or f"p0f_bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np is not None,
+        'hosts': hosts,
+        'ports': {str(port): weight for port, weight in (ports or BENCH_PORTS).items()},
+        'oses': oses or BENCH_OSES,
+        'runs': [],
+    }
+    regressions = 0
+    home = os.getcwd()
+
+    for lines in sizes:
+        with tempfile.TemporaryDirectory(prefix='p0f_bench_') as workdir:
+            os.chdir(workdir)
+            try:
+                reset_profiles()
+                started = time.perf_counter()
+                with open('full.log', 'w') as f:
+                    for line in synthetic_log_lines(lines, hosts, ports, oses):
+                        f.write(line)
+                generated = time.perf_counter() - started
+                stages = dict.fromkeys(('parse_event', 'update_live_stats', 'highlight_line',
+                                        'process_intelligence', 'print_final_statistics',
+                                        'save_json_report'), 0.0)
+
+                with open('full.log') as f:
+                    while True:
+                        chunk = f.readlines(1 << 22)
+                        if not chunk:
+                            break
+                        t0 = time.perf_counter()
+                        events = [event for event in map(parse_event, chunk) if event is not None]
+                        t1 = time.perf_counter()
+                        update_live_stats_batch(events)
+                        t2 = time.perf_counter()
+                        for line in chunk:
+                            highlight_line(line)
+                        t3 = time.perf_counter()
+                        stages['parse_event'] += t1 - t0
+                        stages['update_live_stats'] += t2 - t1
+                        stages['highlight_line'] += t3 - t2
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    t0 = time.perf_counter()
+                    counts = process_intelligence(quiet=True)
+                    t1 = time.perf_counter()
+                    print_final_statistics(counts, save_to_file=False)
+                    t2 = time.perf_counter()
+                    save_json_report(take_snapshot())
+                    t3 = time.perf_counter()
+                stages['process_intelligence'] = t1 - t0
+                stages['print_final_statistics'] = t2 - t1
+                stages['save_json_report'] = t3 - t2
+                run = {
+                    'lines': lines, 'hosts': len(ip_profiles), 'corpus_bytes': os.path.getsize('full.log'),
+                    'generate_seconds': round(generated, 3),
+                    'stages': {name: {'seconds': round(seconds, 4), 'lines_per_sec': round(lines / seconds) if seconds else None}
+                               for name, seconds in stages.items()},
+                }
+            finally:
+                os.chdir(home)
+                reset_profiles()
+        results['runs'].append(run)
+
+        print(f"\n{Colors.BOLD}Pipeline benchmark: {lines:,} lines, {run['hosts']:,} hosts "
+              f"({run['corpus_bytes'] / 2**20:.1f} MiB, generated in {generated:.1f}s){Colors.RESET}")
+        before = previous.get(str(lines), {}).get('stages', {})
+        for name, stage in run['stages'].items():
+            rate = stage['lines_per_sec']
+            line = f"  {name:<24} {stage['seconds']:>9.3f} s  {rate or 0:>12,} lines/s"
+            old = before.get(name, {}).get('lines_per_sec')
+            if old and rate:
+                change = rate / old - 1
+                color = Colors.RED if change < -BENCH_TOLERANCE else Colors.GREEN if change > BENCH_TOLERANCE else ''
+                line += f"  {color}{change:+.1%} vs baseline{Colors.RESET if color else ''}"
+                if change < -BENCH_TOLERANCE:
+                    regressions += 1
+            print(line)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n{Colors.GREEN}[+] Benchmark results saved to: {output}{Colors.RESET}")
+    if baseline:
+        if regressions:
+            print(f"{Colors.RED}[!] {regressions} stage(s) more than {BENCH_TOLERANCE:.0%} slower than {baseline}{Colors.RESET}")
+        else:
+            print(f"{Colors.GREEN}[+] No stage more than {BENCH_TOLERANCE:.0%} slower than {baseline}{Colors.RESET}")
+    return regressions
+
+def first_fingerprints(logfile):
+    """{ip: (os, dist)} from the first labelled syn / syn+ack line of each host in a p0f-style log"""
+    hosts = {}
+    with open(logfile, errors='surrogateescape') as f:
+        for line in f:
+            event = parse_event(line)
+            if event is None or event.mod not in ('syn', 'syn+ack') or event.os in (None, '???'):
+                continue
+            key = pack_ip(event.subject_ip)
+            if key not in hosts:
+                hosts[key] = (event.os, event.dist)
+    return hosts
+
+def benchmark_native(pcap):
+    """Time --native against p0f on one pcap and report how often they agree.
+
+    Agreement is per host fingerprinted by both: same OS family
+    (os_family()) and same distance for the first label each path gives.
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix='p0f_native_') as workdir:
+        native_log = os.path.join(workdir, 'native.log')
+        p0f_log = os.path.join(workdir, 'p0f.log')
+        started = time.perf_counter()
+        packets, lines = write_native_log(pcap, native_log)
+        native_seconds = time.perf_counter() - started
+        print(f"\n{Colors.BOLD}Native fingerprint benchmark: {Path(pcap).name}, {packets:,} packets{Colors.RESET}")
+        print(f"  native  {native_seconds:>9.2f} s  {packets / max(native_seconds, 1e-9):>12,.0f} packets/s  {lines:>10,} lines")
+        if shutil.which('p0f') is None:
+            print(f"{Colors.YELLOW}[!] p0f is not installed: no speed or agreement comparison{Colors.RESET}")
+            return
+        started = time.perf_counter()
+        if not run_p0f_offline(pcap, p0f_log):
+            print(f"{Colors.RED}[!] p0f failed on {pcap}{Colors.RESET}")
+            return
+        p0f_seconds = time.perf_counter() - started
+        print(f"  p0f     {p0f_seconds:>9.2f} s  {packets / max(p0f_seconds, 1e-9):>12,.0f} packets/s  "
+              f"{native_seconds and p0f_seconds / native_seconds:>9.1f}x the native time")
+
+        native = first_fingerprints(native_log)
+        reference = first_fingerprints(p0f_log)
+    both = native.keys() & reference.keys()
+    families = sum(os_family(native[key][0].replace(NATIVE_TAG, '')) == os_family(reference[key][0])
+                   for key in both)
+    distances = sum(native[key][1] == reference[key][1] for key in both)
+    print(f"  Hosts labelled: native {len(native):,}, p0f {len(reference):,}, both {len(both):,}")
+    if both:
+        print(f"  Agreement on hosts labelled by both: OS family {families / len(both):.1%}, "
+              f"distance {distances / len(both):.1%}")
+    missed = len(reference.keys() - native.keys())
+    if missed:
+        print(f"  Labelled by p0f only: {missed:,} ({missed / len(reference):.1%} of p0f's hosts)")
 
 def main():
-    global verbose_mode
+    global verbose_mode, export_format, report_analytics, subnet_prefixes
     
     parser = argparse.ArgumentParser(
         description='p0f-miner: Actionable passive reconnaissance (grouped by IP, saved to reports)',
@@ -1102,9 +6145,51 @@ Examples:
   # Live capture with faster updates (10s)
   sudo ./p0f-miner.py -i eth0 -u 10
   
+  # Live capture on two interfaces at once (one p0f each, merged profiles)
+  sudo ./p0f-miner.py -i eth0 -i wlan0
+  
   # Live capture with packet-level details
   sudo ./p0f-miner.py -i eth0 -v
   
+  # Live capture without keeping full.log on disk
+  sudo ./p0f-miner.py -i eth0 --no-log
+  
+  # Long engagement: gzip full.log in 256 MB / hourly segments
+  sudo ./p0f-miner.py -i eth0 --rotate-size 256 --rotate-time 3600
+  
+  # Multi-day capture: at most 500k hosts in memory, spill hosts idle for 1h
+  sudo ./p0f-miner.py -i eth0 --max-hosts 500000 --host-ttl 3600
+  
+  # Stream changed hosts to p0f_deltas/ every minute, one JSON object per host
+  sudo ./p0f-miner.py -i eth0 --delta-every 60 --export ndjson
+  
+  # Keep profiles in SQLite and carry on from yesterday's session
+  sudo ./p0f-miner.py -i eth0 --db hosts.db --resume
+  
+  # Query saved profiles (index cached under ~/.cache/p0f_miner/ for the next query)
+  ./p0f-miner.py --query 'os~"Windows 2012" and port=445 and dist<=1'
+  ./p0f-miner.py --query '(eol or scanner) and ip=10.20.0.0/16' --from p0f_profiles_*.json --query-output json
+  
+  # Poll live state from scripts/Prometheus on http://127.0.0.1:9100/
+  sudo ./p0f-miner.py -i eth0 --http 9100
+  curl '127.0.0.1:9100/hosts?flag=eol&port=445&limit=50'
+  curl '127.0.0.1:9100/hosts?cidr=10.20.0.0/16&flag=server'
+  
+  # See where live mode spends its time; dump a cProfile of the whole run
+  sudo ./p0f-miner.py -i eth0 --instrument --profile p0f.pstats
+  
+  # Only profile in-scope hosts (scope.txt: '10.0.0.0/8', '!10.9.0.0/16', ...); subnets per /16
+  ./p0f-miner.py -r capture.pcap --scope scope.txt --subnet-prefix 16
+  
+  # Push scope, service ports and an extra exclusion down to p0f as a BPF filter
+  sudo ./p0f-miner.py -i eth0 --scope scope.txt --ports 22,445,3389 --filter 'not host 10.0.0.5'
+  
+  # Add distance histogram, OS family per /24 and service pairs to the report (needs numpy)
+  ./p0f-miner.py -r capture.pcap --analytics
+  
+  # Time every pipeline stage on 100k/1M synthetic lines and compare with an earlier run
+  ./p0f-miner.py --bench 100000 1000000 --bench-baseline p0f_bench_20250101_120000.json
+  
   # Offline analysis (shows IP-grouped intelligence)
   # Saves: p0f_report_TIMESTAMP.txt + p0f_profiles_TIMESTAMP.json
   ./p0f-miner.py -r capture.pcap
@@ -1112,41 +6197,194 @@ Examples:
   # Offline with packet details
   ./p0f-miner.py -r capture.pcap -v
   
+  # Many pcaps in parallel, merged into one report (quote globs)
+  ./p0f-miner.py -r 'rotated/*.pcap' -j 8
+  
+  # One huge pcap split into 8 flow-hashed shards, one p0f per shard
+  ./p0f-miner.py -r huge.pcap --shards 8
+  
+  # Strip bulk payload first: p0f only reads handshakes and HTTP headers
+  ./p0f-miner.py -r huge.pcapng --prefilter --shards 8
+  
+  # Quick triage without p0f (lower-confidence OS labels), and how it compares
+  ./p0f-miner.py -r huge.pcap --native
+  ./p0f-miner.py --bench-native sample.pcap
+  
+  # Interrupted run on a huge pcap: the same command resumes from full.log.ckpt
+  ./p0f-miner.py -r huge.pcap
+  
   # List interfaces
   sudo ./p0f-miner.py -L
 
 Output Files:
   - p0f_report_TIMESTAMP.txt    : Human-readable intelligence report
-  - p0f_profiles_TIMESTAMP.json : Machine-readable IP profiles
-  - full.log                    : Complete p0f output
+  - p0f_profiles_TIMESTAMP.json : Machine-readable IP profiles (.ndjson with --export ndjson)
+  - p0f_deltas/delta-NNNNNN.ndjson : Hosts changed per interval (--delta-every)
+  - full.log                    : Complete p0f output (live: unless --no-log)
+  - full.log.NNNNNN.gz          : Older full.log segments with --rotate-size/--rotate-time
   - *.log files                 : Categorized findings
+  - p0f_runs/                   : Per-pcap output when reading several pcaps
+  - --db FILE                   : SQLite host database (hosts, services, tags)
+  - p0f_bench_TIMESTAMP.json    : Per-stage timings from --bench
+  - --profile FILE              : cProfile/pstats data for the run
+  - ~/.cache/p0f_miner/*.idx    : Cached --query index for an export
         '''
     )
     
-    parser.add_argument('-r', '--read', metavar='FILE', help='Read from pcap file (offline mode)')
-    parser.add_argument('-i', '--interface', metavar='IFACE', help='Capture on network interface (live mode)')
+    parser.add_argument('-r', '--read', metavar='FILE', nargs='+', help='Read from pcap file(s) or globs (offline mode)')
+    parser.add_argument('-i', '--interface', metavar='IFACE', action='append',
+                        help='Capture on network interface (live mode); repeat or comma-separate for '
+                             'several, each with its own p0f')
     parser.add_argument('-L', '--list-interfaces', action='store_true', help='List available network interfaces')
     parser.add_argument('-p', '--promiscuous', action='store_true', help='Enable promiscuous mode (live mode only)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Show all traffic (default: summaries only)')
     parser.add_argument('-u', '--update', type=int, default=15, metavar='SEC', help='Update interval for live mode (default: 15s)')
+    parser.add_argument('-j', '--jobs', type=int, metavar='N', help='Parallel p0f workers for multiple pcaps (default: CPU count)')
+    parser.add_argument('--shards', type=int, default=0, metavar='N', help='Split each pcap into N flow-hashed shards analysed in parallel')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='Offline: run p0f on slim copies of the pcaps holding only SYN, SYN+ACK, FIN/RST '
+                             'and HTTP header packets (pcapng is read too)')
+    parser.add_argument('--native', action='store_true',
+                        help="Offline: fingerprint SYN/SYN+ACK packets without p0f (TTL, window, TCP options; "
+                             "faster, lower confidence, labels tagged '(native guess)')")
+    parser.add_argument('--bench-native', metavar='PCAP',
+                        help='Time --native against p0f on PCAP, report how often they agree, and exit')
+    parser.add_argument('--checkpoint', type=int, default=60, metavar='SEC', help='Offline: checkpoint profile building every SEC seconds so a rerun resumes (0 = off, default: 60)')
+    parser.add_argument('--bench-memory', type=int, nargs='?', const=100000, metavar='HOSTS', help='Measure profile memory per host on synthetic data and exit')
+    parser.add_argument('--bench', type=int, nargs='*', metavar='LINES', help='Time each pipeline stage on synthetic corpora of LINES lines and exit (default: 100k 1M 10M)')
+    parser.add_argument('--bench-hosts', type=int, default=50000, metavar='N', help='Distinct hosts in the --bench corpora (default: 50000)')
+    parser.add_argument('--bench-ports', metavar='MIX', help="Service port mix for --bench, e.g. '445:5,3389:2,80' (port:weight)")
+    parser.add_argument('--bench-os', metavar='MIX', help="OS mix for --bench, e.g. 'Windows XP:1,Linux 3.11 and newer:4'")
+    parser.add_argument('--bench-baseline', metavar='FILE', help='Earlier --bench results to compare against (exit status 1 on regressions)')
+    parser.add_argument('--bench-out', metavar='FILE', help='Where to write --bench results (default: p0f_bench_TIMESTAMP.json)')
+    parser.add_argument('--max-hosts', type=int, metavar='N', help='Live mode: keep at most N host profiles in memory (LRU, rest spilled to disk)')
+    parser.add_argument('--host-ttl', type=int, metavar='SEC', help='Live mode: spill host profiles idle for more than SEC seconds')
+    parser.add_argument('--spill-file', default='p0f_spill.ndjson', metavar='FILE', help='Append-only store for spilled profiles (default: p0f_spill.ndjson)')
+    parser.add_argument('--export', choices=('json', 'ndjson'), default='json', help='Profile export format: one JSON document or one host per line (default: json)')
+    parser.add_argument('--delta-every', type=int, metavar='SEC', help='Live mode: every SEC seconds write hosts changed since the last delta to p0f_deltas/')
+    parser.add_argument('--db', metavar='FILE', help='Keep host profiles in a SQLite database (WAL, batched upserts)')
+    parser.add_argument('--resume', action='store_true', help='Continue enriching the --db database instead of starting it afresh')
+    parser.add_argument('--query', metavar='EXPR', help="Print hosts matching EXPR from saved profiles, e.g. 'os~Windows and port=445 and dist<=1', and exit")
+    parser.add_argument('--from', dest='query_from', nargs='+', metavar='FILE', help='--query input: profile exports (.json/.ndjson) or a --db store (default: --db, else the newest p0f_profiles_* export)')
+    parser.add_argument('--query-output', choices=('ips', 'json', 'ndjson'), default='ips', help='--query output: one IP per line (default), a JSON array or one JSON object per line')
+    parser.add_argument('--instrument', action='store_true', help='Record lines/s, per-stage time, per-rule matches and cost, stats_lock waits and reader lag (live stats + JSON stats block)')
+    parser.add_argument('--profile', metavar='FILE', help='Run under cProfile and write pstats data to FILE')
+    parser.add_argument('--analytics', action='store_true', help='Add distance histogram, OS family per /24 and service co-occurrence to the final report (needs numpy)')
+    parser.add_argument('--scope', metavar='FILE', help="Drop traffic of out-of-scope hosts (in p0f's BPF filter and again before profiling): FILE lists networks, one per line ('!CIDR' = out of scope, longest prefix wins)")
+    parser.add_argument('--ports', metavar='LIST', help="Only fingerprint traffic to/from these ports, e.g. '22,445,3389,8000-8100' (BPF for p0f)")
+    parser.add_argument('--filter', metavar='BPF', help="Extra BPF expression for p0f, ANDed with --scope and --ports (e.g. 'not host 10.0.0.5')")
+    parser.add_argument('--subnet-prefix', type=int, default=24, metavar='N', help='Group IPv4 hosts by /N in the report\'s subnet summary (default: 24)')
+    parser.add_argument('--subnet-prefix6', type=int, default=64, metavar='N', help='Group IPv6 hosts by /N in the report\'s subnet summary (default: 64)')
+    parser.add_argument('--http', type=int, metavar='PORT', help='Live mode: serve /metrics, /hosts, /hosts/<ip> and /categories on 127.0.0.1:PORT')
+    parser.add_argument('--no-log', action='store_true', help='Do not tee live p0f output to full.log')
+    parser.add_argument('--rotate-size', type=int, metavar='MB', help='Live mode: rotate full.log into gzipped segments every MB megabytes')
+    parser.add_argument('--rotate-time', type=int, metavar='SEC', help='Live mode: rotate full.log into gzipped segments every SEC seconds')
     
     args = parser.parse_args()
     
+    use_collation_locale()
     verbose_mode = args.verbose
+    export_format = args.export
+    report_analytics = args.analytics
+    if report_analytics and np is None:
+        print(f"{Colors.YELLOW}[!] --analytics needs numpy (pip3 install numpy); report will not include it{Colors.RESET}")
+    if not (0 <= args.subnet_prefix <= 32 and 0 <= args.subnet_prefix6 <= 128):
+        parser.error("--subnet-prefix must be 0-32 and --subnet-prefix6 0-128")
+    subnet_prefixes = (args.subnet_prefix, args.subnet_prefix6)
+    scope = None
+    if args.scope:
+        try:
+            scope = load_scope(args.scope)
+        except (OSError, ValueError) as e:
+            sys.exit(f"{Colors.RED}[!] Could not load scope: {e}{Colors.RESET}")
+    ports = None
+    if args.ports:
+        try:
+            ports = parse_ports(args.ports)
+        except ValueError as e:
+            parser.error(f"--ports: {e}")
+    bpf = build_capture_filter(scope, ports, args.filter)
     
+    if args.interface:
+        args.interface = list(dict.fromkeys(name for value in args.interface
+                                            for name in value.split(',') if name))
     if args.interface and os.geteuid() != 0:
         sys.exit(f"{Colors.RED}[!] Live capture requires root. Run with sudo.{Colors.RESET}")
     
     if args.list_interfaces:
         list_interfaces()
     
-    if args.read:
-        main_offline(args.read)
-    elif args.interface:
-        main_live(args.interface, args.promiscuous, args.update)
-    else:
+    if args.bench_memory:
+        benchmark_profile_memory(args.bench_memory)
+        sys.exit(0)
+    
+    if args.bench_native:
+        try:
+            benchmark_native(args.bench_native)
+        except (OSError, ValueError) as e:
+            sys.exit(f"{Colors.RED}[!] {e}{Colors.RESET}")
+        sys.exit(0)
+    
+    if args.bench is not None:
+        ports = oses = None
+        try:
+            if args.bench_ports:
+                ports = parse_mix(args.bench_ports, int)
+        except ValueError as e:
+            parser.error(f"--bench-ports: {e}")
+        try:
+            if args.bench_os:
+                oses = parse_mix(args.bench_os)
+        except ValueError as e:
+            parser.error(f"--bench-os: {e}")
+        regressions = benchmark_pipeline(args.bench or BENCH_SIZES, args.bench_hosts, ports, oses,
+                                         args.bench_baseline, args.bench_out)
+        sys.exit(1 if regressions else 0)
+    
+    if args.query is not None:
+        paths = args.query_from or ([args.db] if args.db else [latest_export()])
+        if not paths[0]:
+            parser.error("--query needs --from FILE (no p0f_profiles_* export in this directory)")
+        main_query(args.query, paths, args.query_output)
+        sys.exit(0)
+    
+    if args.resume and not args.db:
+        parser.error("--resume needs --db FILE")
+    if args.native and not args.read:
+        parser.error("--native reads pcaps (-r); live capture always uses p0f")
+    if not (args.read or args.interface):
         parser.print_help()
         sys.exit(1)
+    
+    instruments = enable_instrumentation() if args.instrument else None
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
+    if args.db:
+        open_profile_db(args.db, args.resume)
+    try:
+        if args.read:
+            main_offline(args.read, args.jobs, args.shards, args.checkpoint, args.prefilter, scope, bpf,
+                         args.native, instruments)
+        else:
+            main_live(args.interface, args.promiscuous, args.update, args.no_log,
+                      args.max_hosts, args.host_ttl, args.spill_file,
+                      args.rotate_size and args.rotate_size << 20, args.rotate_time,
+                      args.delta_every, args.http, scope, bpf, instruments)
+    finally:
+        close_profile_db()
+        if instruments is not None:
+            print(f"\n{Colors.CYAN}[+] Instrumentation:{Colors.RESET}")
+            for line in instruments.report_lines():
+                print(f"    {line}")
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"{Colors.GREEN}[+] cProfile stats saved to: {args.profile} "
+                  f"(python3 -m pstats {args.profile}){Colors.RESET}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,27 @@
+import signal
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import p0f_miner  # noqa: E402
+
+# p0f_miner turns Ctrl-C into "write the final report"; give it back to pytest
+signal.signal(signal.SIGINT, signal.default_int_handler)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory: the pipeline reads and writes full.log, *.log and reports in the cwd"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def profiles():
+    """Empty ip_profiles / live_stats for the test, emptied again afterwards"""
+    p0f_miner.reset_profiles()
+    yield p0f_miner.ip_profiles
+    p0f_miner.reset_profiles()
@@ -0,0 +1,89 @@
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import p0f_miner
+
+needs_shell = pytest.mark.skipif(not all(map(shutil.which, ('sh', 'grep', 'awk', 'sort'))),
+                                 reason="needs sh, grep, awk and sort")
+
+
+def varied_lines():
+    """Event lines carrying every app=, http= and port literal the rules look for, plus a few that aren't events"""
+    apps = sorted({app for cmd in p0f_miner.ONELINERS.values() for app in re.findall(r'(?:app|http)=([^|\']+)', cmd)})
+    ports = sorted({int(port) for cmd in p0f_miner.ONELINERS.values() for port in re.findall(r':(\d+) ', cmd)})
+    oses = ['Windows XP', 'Windows 2003', 'Windows 7 or 8', 'Windows 7 (NT kernel)', 'Windows 10', 'Windows 2016',
+            'Linux 2.6.x', 'Linux 3.11 and newer', 'Linux 4.x', 'FreeBSD 9.x', 'Mac OS X', 'HP', '???']
+    links = ['Ethernet or modem', 'DSL', 'generic tunnel or VPN']
+    lines = ["-- p0f 3.09b by Michal Zalewski <lcamtuf@coredump.cx> --\n", "\n"]
+    for i in range(600):
+        port = ports[i % len(ports)]
+        app = apps[i % len(apps)]
+        host = f"2001:db8::{i % 37:x}" if i % 11 == 0 else f"10.{i % 3}.{i % 5}.{i % 41}"
+        peer = f"192.168.{i % 4}.{i % 23}"
+        subj = 'srv' if i % 3 else 'cli'
+        dist = i % 21
+        lines.append(f"[2024/01/01 08:{i // 60 % 60:02d}:{i % 60:02d}] mod={('syn', 'syn+ack', 'http request', 'mtu')[i % 4]}"
+                     f"|cli={peer}/{40000 + i}|srv={host}/{port}|subj={subj}|os={oses[i % len(oses)]}|dist={dist}"
+                     f"|distance={dist}|nat={'yes' if i % 7 == 0 else 'no'}|link={links[i % 3]}"
+                     f"|app={app}|http={apps[i * 7 % len(apps)]}|to {host}:{port} -> {peer}:{port} \n")
+    return lines
+
+
+@needs_shell
+def test_engine_matches_shell_pipelines(workdir, monkeypatch):
+    monkeypatch.setenv('LC_ALL', 'C')
+    p0f_miner.use_collation_locale()
+    with open('full.log', 'w') as f:
+        f.writelines(varied_lines())
+        f.writelines(p0f_miner.synthetic_log_lines(2000, hosts=200))
+
+    os.mkdir('engine')
+    os.symlink('../full.log', 'engine/full.log')
+    monkeypatch.chdir('engine')
+    counts = p0f_miner.process_intelligence(quiet=True)
+
+    monkeypatch.chdir(workdir)
+    os.mkdir('shell')
+    os.symlink('../full.log', 'shell/full.log')
+    for name, cmd in p0f_miner.ONELINERS.items():
+        # The engine selects event lines itself (the '^\[.+\]' source filter
+        # would drop every timestamped line); the private-address halves of
+        # NETWORK_RULES have no grep equivalent
+        if name in p0f_miner.NETWORK_RULES:
+            continue
+        cmd = cmd.replace("grep -vE '^\\[.+\\]' full.log", "cat full.log")
+        subprocess.run(cmd, shell=True, cwd='shell', check=True)
+
+    matched = 0
+    for name, cmd in p0f_miner.ONELINERS.items():
+        if name in p0f_miner.NETWORK_RULES:
+            continue
+        output = p0f_miner.oneliner_output(cmd)
+        with open(os.path.join('engine', output), 'rb') as a, open(os.path.join('shell', output), 'rb') as b:
+            assert a.read() == b.read(), name
+        assert counts[output] == p0f_miner.count_lines(os.path.join('shell', output)), name
+        matched += counts[output] > 0
+    assert matched > len(p0f_miner.ONELINERS) * 3 // 4
+
+
+def test_network_rules_keep_private_endpoints_only(workdir):
+    with open('full.log', 'w') as f:
+        f.write("[2024/01/01 08:00:00] mod=syn|cli=10.0.0.1/40000|srv=192.168.1.5/445|subj=cli|os=Windows 10|dist=0|params=none\n")
+        f.write("[2024/01/01 08:00:01] mod=syn|cli=10.0.0.2/40000|srv=8.8.8.8/443|subj=cli|os=Linux 4.x|dist=0|params=none\n")
+        f.write("[2024/01/01 08:00:02] mod=syn|cli=fd00::1/40000|srv=fe80::2/22|subj=cli|os=Linux 4.x|dist=0|params=none\n")
+        f.write("[2024/01/01 08:00:03] mod=syn|cli=8.8.4.4/40000|srv=10.0.0.9/22|subj=cli|os=Linux 4.x|dist=0|params=none\n")
+    p0f_miner.process_intelligence(quiet=True)
+    with open('internal-only.log') as f:
+        assert [line.split('|')[1] for line in f] == ['cli=10.0.0.1/40000', 'cli=fd00::1/40000']
+    with open('same-subnet.log') as f:
+        assert [line.split('|')[1] for line in f] == ['cli=10.0.0.1/40000', 'cli=10.0.0.2/40000', 'cli=fd00::1/40000']
+
+
+def test_compile_oneliner_falls_back_to_shell_for_unsupported_pipelines():
+    assert p0f_miner.compile_oneliner('x', "grep -F 'os=' full.log | wc -l > x.log") is None
+    rule = p0f_miner.compile_oneliner('x', "grep -vE '^\\[.+\\]' full.log | grep -F 'nat=yes' | sort -u > x.log")
+    assert rule.output == 'x.log' and rule.unique
@@ -0,0 +1,73 @@
+import glob
+import json
+
+import pytest
+
+import p0f_miner
+
+ODD_LINES = [
+    '[2024/01/01 08:00:00] mod=syn|cli=10.9.9.9/40000|srv=10.9.9.1/445|subj=cli|os=Windows "XP"|dist=1|params=none|raw_sig=x\n',
+    '[2024/01/01 08:00:01] mod=http request|cli=10.9.9.9/40001|srv=10.9.9.1/80|subj=cli|app=Café\\Browser|lang=none|'
+    'params=none|raw_sig=1:Host::|http=nmap|bad_sw=2\n',
+    '[2024/01/01 08:00:02] mod=syn+ack|cli=10.9.9.9/40000|srv=2001:db8:0:0:0:0:0:7/22|subj=srv|os=Linux 4.x|dist=0|'
+    'params=none|raw_sig=x\n',
+]
+
+
+def export_path():
+    paths = glob.glob('p0f_profiles_*')
+    assert len(paths) == 1
+    return paths[0]
+
+
+def expected_document(snapshot, timestamp, stats_extra=None):
+    """The export as the original json.dump() of the whole document built it"""
+    stats = dict(snapshot.stats)
+    stats.update(stats_extra or {})
+    return {'timestamp': timestamp, 'stats': stats,
+            'hosts': {ip: p0f_miner.host_record(profile) for ip, profile in snapshot.items()}}
+
+
+@pytest.mark.parametrize('lines', [0, 1, 3000])
+def test_streamed_json_matches_json_dump(workdir, profiles, lines):
+    if lines:
+        p0f_miner.ingest_lines(list(p0f_miner.synthetic_log_lines(lines, hosts=300)) + ODD_LINES)
+    snapshot = p0f_miner.take_snapshot()
+    p0f_miner.save_json_report(snapshot)
+
+    path = export_path()
+    timestamp = path[len('p0f_profiles_'):-len('.json')]
+    with open(path) as f:
+        text = f.read()
+    assert text == json.dumps(expected_document(snapshot, timestamp), indent=2)
+    assert len(json.loads(text)['hosts']) == len(profiles)
+
+
+def test_json_stats_carry_instrumentation(workdir, profiles):
+    p0f_miner.ingest_lines(ODD_LINES)
+    instruments = p0f_miner.Instrumentation()
+    summary = instruments.summary()
+    instruments.summary = lambda: summary
+    snapshot = p0f_miner.take_snapshot()
+    p0f_miner.save_json_report(snapshot, instruments)
+
+    path = export_path()
+    with open(path) as f:
+        text = f.read()
+    expected = expected_document(snapshot, path[len('p0f_profiles_'):-len('.json')], {'instrumentation': summary})
+    assert text == json.dumps(expected, indent=2)
+
+
+def test_ndjson_export(workdir, profiles, monkeypatch):
+    monkeypatch.setattr(p0f_miner, 'export_format', 'ndjson')
+    p0f_miner.ingest_lines(list(p0f_miner.synthetic_log_lines(500, hosts=50)) + ODD_LINES)
+    snapshot = p0f_miner.take_snapshot()
+    p0f_miner.save_json_report(snapshot)
+
+    path = export_path()
+    assert path.endswith('.ndjson')
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    expected = expected_document(snapshot, None)['hosts']
+    assert {record.pop('ip'): record for record in records} == expected
+    assert len(records) == len(expected)
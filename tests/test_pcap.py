@@ -0,0 +1,151 @@
+import io
+import struct
+
+import pytest
+
+import p0f_miner
+from p0f_miner import PcapngReader, PcapReader, open_capture
+
+
+def tcp_packet(src, dst, sport, dport, flags=0x02, payload=b''):
+    """Ethernet + IPv4 + TCP frame"""
+    tcp = struct.pack('>HHIIBBHHH', sport, dport, 1, 0, 5 << 4, flags, 65535, 0, 0) + payload
+    ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, 6, 0,
+                     bytes(map(int, src.split('.'))), bytes(map(int, dst.split('.'))))
+    return b'\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb\x08\x00' + ip + tcp
+
+
+PACKETS = [tcp_packet('10.0.0.1', '10.0.0.2', 40000 + i, 445, payload=b'x' * i) for i in range(5)]
+
+
+def classic_pcap(packets, order='<', magic=0xa1b2c3d4, truncate=0):
+    data = struct.pack(order + 'IHHiIII', magic, 2, 4, 0, 0, 65535, p0f_miner.LINKTYPE_ETHERNET)
+    for number, packet in enumerate(packets):
+        data += struct.pack(order + 'IIII', 1700000000 + number, number * 1000, len(packet), len(packet)) + packet
+    return data[:len(data) - truncate]
+
+
+def block(order, kind, body):
+    body += b'\0' * (-len(body) % 4)
+    return struct.pack(order + 'II', kind, len(body) + 12) + body + struct.pack(order + 'I', len(body) + 12)
+
+
+def pcapng_section(order, packets, linktype=p0f_miner.LINKTYPE_ETHERNET):
+    """Section header, a nanosecond-resolution interface of `linktype`, a raw-IP interface,
+    then the packets as enhanced, simple and obsolete blocks plus one on the raw interface"""
+    data = block(order, 0x0a0d0d0a, struct.pack(order + 'IHHq', 0x1a2b3c4d, 1, 0, -1))
+    tsresol = struct.pack(order + 'HH', 9, 1) + b'\x09\0\0\0' + struct.pack(order + 'HH', 0, 0)
+    data += block(order, 1, struct.pack(order + 'HHI', linktype, 0, 65535) + tsresol)
+    data += block(order, 1, struct.pack(order + 'HHI', p0f_miner.LINKTYPE_RAW, 0, 65535))
+    stamps = []
+    for number, packet in enumerate(packets):
+        stamp = (1700000000 + number) * 10 ** 9 + number * 1000
+        kind = number % 3
+        if kind == 0:
+            data += block(order, 6, struct.pack(order + 'IIIII', 0, stamp >> 32, stamp & 0xffffffff,
+                                                len(packet), len(packet)) + packet)
+            stamps.append((1700000000 + number, number))
+        elif kind == 1:
+            data += block(order, 3, struct.pack(order + 'I', len(packet)) + packet)
+            stamps.append((0, 0))
+        else:
+            data += block(order, 2, struct.pack(order + 'HHIIII', 0, 0, stamp >> 32, stamp & 0xffffffff,
+                                                len(packet), len(packet)) + packet)
+            stamps.append((1700000000 + number, number))
+        # Interface 1 has another link type: not representable in the one-linktype classic output
+        data += block(order, 6, struct.pack(order + 'IIIII', 1, 0, 0, 4, 4) + b'\x45\0\0\0')
+    return data, stamps
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('order,magic', [('<', 0xa1b2c3d4), ('>', 0xa1b2c3d4), ('<', 0xa1b23c4d)])
+def test_classic_reader(tmp_path, order, magic):
+    reader = open_capture(write(tmp_path, 'a.pcap', classic_pcap(PACKETS, order, magic)))
+    assert isinstance(reader, PcapReader) and reader.linktype == p0f_miner.LINKTYPE_ETHERNET
+    offsets = list(reader)
+    assert [reader.data[start:end] for _, start, end in offsets] == PACKETS
+    assert [reader.seconds(record) for record, _, _ in offsets] == [1700000000 + n for n in range(len(PACKETS))]
+
+    records, starts, ends, seconds = zip(*reader.chunks(2))
+    assert seconds == (None, None, None)
+    assert list(zip(sum(records, []), sum(starts, []), sum(ends, []))) == offsets
+
+    out = io.BytesIO()
+    for offset in offsets:
+        reader.copy(out, *offset)
+    assert reader.header + out.getvalue() == classic_pcap(PACKETS, order, magic)
+    reader.close()
+
+
+def test_classic_reader_stops_at_truncated_record(tmp_path):
+    reader = open_capture(write(tmp_path, 'a.pcap', classic_pcap(PACKETS, truncate=3)))
+    assert [reader.data[start:end] for _, start, end in reader] == PACKETS[:-1]
+    assert sum(len(chunk[0]) for chunk in reader.chunks(64)) == len(PACKETS) - 1
+    reader.close()
+
+
+@pytest.mark.parametrize('orders', [('<',), ('>',), ('<', '>')])
+def test_pcapng_reader(tmp_path, orders):
+    data, stamps = b'', []
+    for order in orders:
+        section, section_stamps = pcapng_section(order, PACKETS)
+        data += section
+        stamps += section_stamps
+    reader = open_capture(write(tmp_path, 'a.pcapng', data))
+    assert isinstance(reader, PcapngReader) and reader.linktype == p0f_miner.LINKTYPE_ETHERNET
+
+    out = io.BytesIO()
+    packets, seen = [], []
+    for record, start, end in reader:
+        packets.append(reader.data[start:end])
+        seen.append(reader.stamp[:2])
+        reader.copy(out, record, start, end)
+    assert packets == PACKETS * len(orders)
+    assert seen == stamps
+    assert reader.skipped == len(PACKETS) * len(orders)
+
+    chunked = [item for chunk in reader.chunks(4) for item in chunk[3]]
+    assert chunked == [seconds for seconds, _ in stamps]
+    reader.close()
+
+    # copy() output is a classic pcap with the same packets and microsecond stamps
+    classic = open_capture(write(tmp_path, 'b.pcap', reader.header + out.getvalue()))
+    assert [classic.data[start:end] for _, start, end in classic] == packets
+    assert [classic.record.unpack_from(classic.data, record)[:2] for record, _, _ in classic] == seen
+    classic.close()
+
+
+def test_pcapng_reader_stops_at_corrupt_block(tmp_path):
+    data, _ = pcapng_section('<', PACKETS)
+    reader = open_capture(write(tmp_path, 'a.pcapng', data + b'\x06\0\0\0\xff\xff\0\0'))
+    assert len(list(reader)) == len(PACKETS)
+    reader.close()
+
+
+def test_open_capture_rejects(tmp_path):
+    for name, data in (('empty.pcap', b''), ('text.pcap', b'not a capture at all'),
+                       ('noif.pcapng', block('<', 0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1)))):
+        with pytest.raises(ValueError):
+            open_capture(write(tmp_path, name, data))
+
+
+def test_shards_keep_flows_together(tmp_path):
+    packets = [tcp_packet(f'10.0.{i % 3}.1', '10.1.0.1', 40000 + i % 7, 445, flags) for i in range(60)
+               for flags in (0x02, 0x10)]
+    pcap = write(tmp_path, 'a.pcap', classic_pcap(packets))
+    paths = p0f_miner.shard_pcap(pcap, 4, directory=str(tmp_path / 'shards'))
+    flows = {}
+    total = 0
+    for shard, path in enumerate(paths):
+        reader = open_capture(path)
+        for _, start, end in reader:
+            key = p0f_miner.flow_key(reader.data, start, end, reader.linktype)
+            assert flows.setdefault(key, shard) == shard
+            total += 1
+        reader.close()
+    assert total == len(packets) and len(flows) == 21
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+
+# Pretend to be a platform without the POSIX-only modules and calls
+NON_POSIX = """
+import os, sys
+for name in ('fcntl', 'termios', 'resource', 'pwd', 'grp', 'pty', 'tty'):
+    sys.modules[name] = None
+for name in ('getuid', 'geteuid', 'getpgid', 'killpg', 'setsid'):
+    if hasattr(os, name):
+        delattr(os, name)
+sys.path.insert(0, sys.argv[1])
+sys.argv = ['p0f_miner.py'] + sys.argv[2:]
+import p0f_miner
+p0f_miner.main()
+"""
+
+
+def test_query_runs_without_posix_modules(tmp_path):
+    export = tmp_path / 'p0f_profiles_1.ndjson'
+    export.write_text(json.dumps({'ip': '10.0.0.5', 'os': 'Windows 2012', 'distance': 1, 'services': ['SMB:445'],
+                                  'is_eol': False, 'is_server': True, 'nat': False}) + '\n')
+    result = subprocess.run([sys.executable, '-c', NON_POSIX, str(REPO), '--query', 'port=445', '--from', str(export)],
+                            cwd=tmp_path, capture_output=True, text=True,
+                            env=dict(os.environ, XDG_CACHE_HOME=str(tmp_path / 'cache')), timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == '10.0.0.5\n'
@@ -0,0 +1,99 @@
+import ipaddress
+import random
+
+import pytest
+
+import p0f_miner
+from p0f_miner import PrefixTrie, pack_ip, parse_network
+
+
+def random_networks(rng, count):
+    networks = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            address = ipaddress.IPv4Address(rng.choice([10, 172, 192]) << 24 | rng.getrandbits(24))
+            length = rng.randrange(4, 33)
+        else:
+            address = ipaddress.IPv6Address(0x20010db8 << 96 | rng.getrandbits(96))
+            length = rng.randrange(16, 129)
+        networks.append(ipaddress.ip_network(f"{address}/{length}", strict=False))
+    return networks
+
+
+def random_addresses(rng, networks, count):
+    """Addresses inside the networks, or just past the end of one"""
+    addresses = []
+    for _ in range(count):
+        network = rng.choice(networks)
+        value = int(network.network_address) + rng.randrange(network.num_addresses + 1)
+        addresses.append(ipaddress.ip_address(min(value, 2 ** network.max_prefixlen - 1)))
+    return addresses
+
+
+def test_lookup_matches_brute_force_longest_prefix():
+    rng = random.Random(21)
+    networks = random_networks(rng, 400)
+    trie = PrefixTrie()
+    for number, network in enumerate(networks):
+        trie.insert(str(network), number)
+    latest = {network: number for number, network in enumerate(networks)}   # a re-insert replaces
+
+    assert len(trie) == len(latest)
+    for address in random_addresses(rng, networks, 5000):
+        containing = [network for network in latest if network.version == address.version and address in network]
+        expected = latest[max(containing, key=lambda network: network.prefixlen)] if containing else None
+        assert trie.lookup(pack_ip(str(address))) == expected, address
+        assert trie.match(str(address), 'none') == ('none' if expected is None else expected)
+
+
+def test_items_lists_every_network_parents_first():
+    trie = PrefixTrie(['10.0.0.0/8', '10.1.0.0/16', '10.1.2.0/24', '192.168.0.0/16', '2001:db8::/32', '10.0.0.0/9'])
+    items = [p0f_miner.format_network(*network) for network, _ in trie.items()]
+    assert sorted(items) == sorted(['10.0.0.0/8', '10.0.0.0/9', '10.1.0.0/16', '10.1.2.0/24', '192.168.0.0/16',
+                                    '2001:db8::/32'])
+    assert items.index('10.0.0.0/8') < items.index('10.0.0.0/9')
+    assert items.index('10.0.0.0/8') < items.index('10.1.0.0/16') < items.index('10.1.2.0/24')
+
+
+def test_lookup_edge_cases():
+    trie = PrefixTrie(p0f_miner.PRIVATE_NETWORKS)
+    assert trie.match('10.255.255.255') and trie.match('fd12::1') and trie.match('::1')
+    assert not trie.match('11.0.0.1') and not trie.match('2001:db8::1') and not trie.match('::2')
+    # p0f's expanded IPv6 spelling packs to a tagged key; it must match all the same
+    assert trie.match('fe80:0:0:0:0:0:0:1')
+    assert trie.lookup('not-an-ip', 'default') == 'default'
+    assert trie.match('garbage') is None
+
+    everything = PrefixTrie(['0.0.0.0/0', '::/0'], 'any')
+    assert everything.match('8.8.8.8') == everything.match('2001:db8::1') == 'any'
+
+
+def test_parse_network():
+    assert parse_network('10.1.2.3/8') == (pack_ip('10.0.0.0'), 8)
+    assert parse_network(' 192.168.1.1 ') == (pack_ip('192.168.1.1'), 32)
+    assert parse_network('2001:db8:0:0:0:0:0:1/64') == (pack_ip('2001:db8::'), 64)
+    for bad in ('10.0.0.0/33', '10.0.0.0/x', 'example.com', '2001:db8::/129'):
+        with pytest.raises(ValueError):
+            parse_network(bad)
+
+
+def test_scope_longest_prefix_wins(tmp_path):
+    path = tmp_path / 'scope.txt'
+    path.write_text("# engagement scope\n10.0.0.0/8\n!10.66.0.0/16   # printers\n10.66.6.6\n\n2001:db8::/32\n")
+    scope = p0f_miner.load_scope(str(path))
+    assert (scope.included, scope.excluded) == (3, 1)
+    assert scope.contains('10.1.1.1') and scope.contains('10.66.6.6') and scope.contains('2001:db8::9')
+    assert not scope.contains('10.66.1.1') and not scope.contains('192.168.1.1')
+
+    event = p0f_miner.parse_event("[2024/01/01 08:00:00] mod=syn|cli=10.66.1.1/40000|srv=10.1.1.1/445|subj=srv|"
+                                  "os=Windows 10|dist=0|params=none|raw_sig=x\n")
+    restricted = scope.restrict(event)
+    assert restricted.cli_ip is None and restricted.srv_ip == '10.1.1.1' and restricted.os == 'Windows 10'
+
+    excluded_only = p0f_miner.NetworkScope()
+    excluded_only.add('10.66.0.0/16', False)
+    assert excluded_only.contains('192.168.1.1') and not excluded_only.contains('10.66.0.1')
+
+    path.write_text("10.0.0.0/8\n10.0.0.300\n")
+    with pytest.raises(ValueError, match=r'scope\.txt:2'):
+        p0f_miner.load_scope(str(path))
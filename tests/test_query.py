@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+import p0f_miner
+from p0f_miner import ProfileIndex, parse_query
+
+
+def record(ip, name=None, distance=None, services=(), **flags):
+    entry = {'ip': ip, 'os': name, 'os_detail': name, 'distance': distance, 'services': list(services),
+             'scanners': [], 'suspicious': [], 'nat': False, 'uptime': None, 'link': None,
+             'is_server': bool(services), 'is_eol': False}
+    entry.update(flags)
+    return entry
+
+
+RECORDS = [
+    record('10.0.0.5', 'Windows 2012', 1, ['SMB:445', 'RDP:3389']),
+    record('10.0.1.7', 'Windows XP', 3, ['SMB:445'], is_eol=True),
+    record('10.20.3.4', 'Linux 3.11 and newer', 0, ['SSH:22'], nat=True),
+    record('192.168.1.9', 'Mac OS X', 2, scanners=['nmap']),
+    record('2001:db8:0:0:0:0:0:2', 'Linux 2.6.x', 5, ['port-8080:8080']),
+    record('2001:db8::3', 'FreeBSD 9.x', None),
+    record('10.0.0.5', 'Windows 7', 4),   # repeated IP: the first record wins
+]
+
+
+def ips(expression, records=RECORDS):
+    index = ProfileIndex(records)
+    return sorted(index.records[row]['ip'] for row in index.select(parse_query(expression)))
+
+
+def test_parse_query_terms_and_flags():
+    assert parse_query('port=445') == ('term', 'port', '=', '445')
+    assert parse_query('EOL') == ('term', 'flag', '=', 'eol')
+    assert parse_query('dist <= 2') == ('term', 'dist', '<=', '2')
+    assert parse_query('os~"Windows 2012 and later"') == ('term', 'os', '~', 'Windows 2012 and later')
+    assert parse_query('os=Linux 3.11 and nat') == ('and', ('term', 'os', '=', 'Linux 3.11'), ('term', 'flag', '=', 'nat'))
+
+
+def test_parse_query_precedence():
+    a, b, c = (('term', 'port', '=', str(port)) for port in (1, 2, 3))
+    assert parse_query('port=1 or port=2 and port=3') == ('or', a, ('and', b, c))
+    assert parse_query('(port=1 or port=2) and port=3') == ('and', ('or', a, b), c)
+    assert parse_query('not port=1 and not (port=2)') == ('and', ('not', a), ('not', b))
+    assert parse_query('port=1 and port=2 and port=3') == ('and', ('and', a, b), c)
+
+
+@pytest.mark.parametrize('expression', ['', '   ', 'port=1 and', '(port=1', 'port=1)', 'bogus', 'port=1 or', 'and'])
+def test_parse_query_rejects(expression):
+    with pytest.raises(ValueError):
+        parse_query(expression)
+
+
+def test_select():
+    assert ips('os~"Windows 2012" and port=445 and dist<=1') == ['10.0.0.5']
+    assert ips('port=SMB') == ['10.0.0.5', '10.0.1.7']
+    assert ips('family=windows and not eol') == ['10.0.0.5']
+    assert ips('dist>=3 or nat') == ['10.0.1.7', '10.20.3.4', '2001:db8:0:0:0:0:0:2']
+    assert ips('dist!=1') == ['10.0.1.7', '10.20.3.4', '192.168.1.9', '2001:db8:0:0:0:0:0:2', '2001:db8::3']
+    assert ips('scanner') == ['192.168.1.9']
+    assert ips('os=Windows 7') == []
+    assert ips('port=8080') == ['2001:db8:0:0:0:0:0:2']
+
+
+def test_select_by_address():
+    assert ips('ip=10.0.0.0/16') == ['10.0.0.5', '10.0.1.7']
+    assert ips('ip=10.0.0.5') == ['10.0.0.5']
+    # Both p0f spellings of an IPv6 address, either way round
+    assert ips('ip=2001:db8::2') == ['2001:db8:0:0:0:0:0:2']
+    assert ips('ip=2001:db8:0:0:0:0:0:3') == ['2001:db8::3']
+    assert ips('ip=2001:db8::/32') == ['2001:db8:0:0:0:0:0:2', '2001:db8::3']
+
+
+@pytest.mark.parametrize('expression', ['dist~1', 'dist=near', 'port=gopher', 'port<445', 'colour=red'])
+def test_select_rejects(expression):
+    with pytest.raises(ValueError):
+        ProfileIndex(RECORDS).select(parse_query(expression))
+
+
+def test_query_index_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    export = tmp_path / 'p0f_profiles_1.ndjson'
+    export.write_text(''.join(json.dumps(entry) + '\n' for entry in RECORDS))
+
+    index, source = p0f_miner.load_query_index([str(export)])
+    assert source == 'built' and len(index) == 6
+    cache = p0f_miner.query_cache_path(str(export))
+    assert cache.startswith(str(tmp_path / 'cache')) and os.path.isfile(cache)
+    assert p0f_miner.load_query_index([str(export)])[1] == 'cached'
+
+    if hasattr(os, 'getuid'):
+        # A cache file others could have written is never unpickled
+        os.chmod(cache, 0o666)
+        assert p0f_miner.load_query_index([str(export)])[1] == 'built'